@@ -0,0 +1,157 @@
+"""
+Write-behind buffer coalescing the stat changes sent by forum signals
+
+Instead of one task per forum event, changes are merged per user and course
+and applied in bulk by a periodic flush. The first change after a flush
+schedules the next one, and a flush leaving changes behind, e.g. the ones of
+a course which failed to apply, schedules another one. It is enabled with the
+SOCIAL_ENGAGEMENT_WRITE_BUFFER setting, e.g.
+
+    SOCIAL_ENGAGEMENT_WRITE_BUFFER = {
+        'BACKEND': 'social_engagement.buffer.RedisEngagementBuffer',
+        'OPTIONS': {'url': 'redis://localhost:6379/0'},
+    }
+    # seconds between the first buffered change and its flush
+    SOCIAL_ENGAGEMENT_WRITE_BUFFER_FLUSH_INTERVAL = 30
+    # seconds after which buffered changes are flushed immediately,
+    # in case a scheduled flush got lost
+    SOCIAL_ENGAGEMENT_WRITE_BUFFER_MAX_STALENESS = 300
+"""
+import threading
+import time
+from collections import defaultdict
+
+from .utils import get_configured_backend
+
+try:
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+
+def get_engagement_buffer():
+    """
+    Returns the configured write-behind buffer or None if it is not enabled.
+    """
+    return get_configured_backend('SOCIAL_ENGAGEMENT_WRITE_BUFFER')
+
+
+class EngagementBuffer:
+    """
+    Interface of a buffer of stat changes keyed by user and course.
+    """
+
+    def add(self, user_id, course_id, changes):
+        """
+        Merges `changes` (`stat: delta`) into the pending changes of a user in a course.
+        Returns the time the oldest pending change was buffered and whether
+        this is the first pending change since the last flush.
+        """
+        raise NotImplementedError
+
+    def request_flush(self):
+        """
+        Returns True only for the first call since the last flush, so an
+        immediate flush is requested once when changes get stale.
+        """
+        raise NotImplementedError
+
+    def pop_all(self):
+        """
+        Removes and returns all pending changes as `{(user_id, course_id): {stat: delta}}`.
+        Concurrent calls never return the same changes.
+        """
+        raise NotImplementedError
+
+    def has_pending(self):
+        """
+        Returns True if there are pending changes.
+        """
+        raise NotImplementedError
+
+
+class InMemoryEngagementBuffer(EngagementBuffer):
+    """
+    Process-local buffer, meant for tests and for deployments running tasks
+    eagerly in the same process.
+    """
+
+    def __init__(self, **kwargs):  # pylint: disable=unused-argument
+        self._lock = threading.Lock()
+        self._changes = defaultdict(lambda: defaultdict(int))
+        self._pending_since = None
+        self._flush_requested = False
+
+    def add(self, user_id, course_id, changes):
+        with self._lock:
+            first = self._pending_since is None
+            if first:
+                self._pending_since = time.time()
+            pending = self._changes[(int(user_id), str(course_id))]
+            for stat, delta in changes.items():
+                pending[stat] += delta
+            return self._pending_since, first
+
+    def request_flush(self):
+        with self._lock:
+            requested = not self._flush_requested
+            self._flush_requested = True
+            return requested
+
+    def pop_all(self):
+        with self._lock:
+            changes = {key: dict(value) for key, value in self._changes.items()}
+            self._changes.clear()
+            self._pending_since = None
+            self._flush_requested = False
+        return changes
+
+    def has_pending(self):
+        with self._lock:
+            return bool(self._changes)
+
+
+class RedisEngagementBuffer(EngagementBuffer):
+    """
+    Buffer shared by all processes through a Redis hash of `user_id|course_id|stat` counters.
+    """
+
+    # reads and deletes the hash in one step, so overlapping flushes can't take the same changes
+    POP_SCRIPT = """
+        local changes = redis.call('HGETALL', KEYS[1])
+        redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+        return changes
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', key_prefix='social_engagement:buffer', **kwargs):
+        if redis is None:
+            raise ImportError('RedisEngagementBuffer requires the `redis` package.')
+        self.client = redis.Redis.from_url(url, **kwargs)
+        self.changes_key = '{}:changes'.format(key_prefix)
+        self.since_key = '{}:since'.format(key_prefix)
+        self.flush_key = '{}:flush'.format(key_prefix)
+        self._pop_script = self.client.register_script(self.POP_SCRIPT)
+
+    def add(self, user_id, course_id, changes):
+        pipeline = self.client.pipeline(transaction=True)
+        for stat, delta in changes.items():
+            pipeline.hincrby(self.changes_key, '{}|{}|{}'.format(int(user_id), course_id, stat), delta)
+        pipeline.setnx(self.since_key, time.time())
+        pipeline.get(self.since_key)
+        *__, first, pending_since = pipeline.execute()
+        return float(pending_since), bool(first)
+
+    def request_flush(self):
+        return bool(self.client.setnx(self.flush_key, 1))
+
+    def pop_all(self):
+        raw_changes = self._pop_script(keys=[self.changes_key, self.since_key, self.flush_key])
+
+        changes = defaultdict(dict)
+        for field, delta in zip(raw_changes[::2], raw_changes[1::2]):
+            user_id, course_id, stat = field.decode('utf-8').rsplit('|', 2)
+            changes[(int(user_id), course_id)][stat] = int(delta)
+        return dict(changes)
+
+    def has_pending(self):
+        return bool(self.client.exists(self.changes_key))
@@ -0,0 +1,56 @@
+"""
+Cached lookup of course end dates
+
+Forum events of closed courses are not counted, and checking that for every
+event against the modulestore is expensive. End dates are read from
+CourseOverview and cached in the process and in the shared Django cache for
+SOCIAL_ENGAGEMENT_COURSE_END_CACHE_TTL seconds, so a changed end date takes
+effect after that delay.
+"""
+from datetime import datetime
+
+import pytz
+from django.conf import settings
+from django.core.cache import cache
+
+from opaque_keys.edx.keys import CourseKey
+from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+
+from .utils import LocalTTLCache
+
+_MISSING = object()
+
+_course_ends = LocalTTLCache(
+    maxsize=getattr(settings, 'SOCIAL_ENGAGEMENT_COURSE_END_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'SOCIAL_ENGAGEMENT_COURSE_END_CACHE_TTL', 300),
+)
+
+
+def get_course_end(course_id):
+    """
+    Returns the end date of a course, or None if it has no end date or does not exist.
+    """
+    course_key = course_id if isinstance(course_id, CourseKey) else CourseKey.from_string(course_id)
+    course_id = str(course_key)
+
+    end = _course_ends.get(course_id, _MISSING)
+    if end is _MISSING:
+        cache_key = 'social_engagement.course_end.{}'.format(course_id)
+        end = cache.get(cache_key, _MISSING)
+        if end is _MISSING:
+            try:
+                end = CourseOverview.get_from_id(course_key).end
+            except CourseOverview.DoesNotExist:
+                end = None
+            cache.set(cache_key, end, getattr(settings, 'SOCIAL_ENGAGEMENT_COURSE_END_CACHE_TTL', 300))
+        _course_ends.set(course_id, end)
+
+    return end
+
+
+def is_course_closed(course_id):
+    """
+    Returns True if the course has already ended.
+    """
+    end = get_course_end(course_id)
+    return bool(end and end < datetime.now(pytz.UTC))
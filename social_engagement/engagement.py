@@ -4,14 +4,22 @@ Business logic tier regarding social engagement scores
 
 import logging
 import sys
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from functools import partial
+from uuid import uuid4
 
 import pytz
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from django.http import HttpRequest
+from django.utils import timezone
 
 import openedx.core.djangoapps.django_comment_common.comment_client as cc
 from edx_notifications.data import NotificationMessage
@@ -27,14 +35,44 @@ from openedx.core.djangoapps.django_comment_common.comment_client.utils import C
 from requests.exceptions import ConnectionError
 from xmodule.modulestore.django import modulestore
 
-from .models import StudentSocialEngagementScore
+from .models import (CourseSocialEngagementAggregate,
+                     CourseSocialEngagementState,
+                     StudentSocialEngagementScore,
+                     handle_engagement_score_written,
+                     is_course_aggregate_enabled,
+                     is_incremental_recompute_enabled)
+from .scoring import ScoringEngine, get_social_metric_points, get_weights_hash
+from .utils import LocalTTLCache
 
 log = logging.getLogger(__name__)
 
+# thread authors never change, so lookups are cached in the process and in the shared cache
+_thread_authors = LocalTTLCache(
+    maxsize=getattr(settings, 'SOCIAL_ENGAGEMENT_THREAD_AUTHOR_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'SOCIAL_ENGAGEMENT_THREAD_AUTHOR_CACHE_TTL', 3600),
+)
 
-def update_course_engagement(course_id, compute_if_closed_course=False, course_descriptor=None):
+# state of `leaderboard_notification_batch` in the current thread
+_notification_batch = threading.local()
+
+
+def update_course_engagement(course_id, compute_if_closed_course=False, course_descriptor=None, bulk=False,
+                             checkpointed=False, raise_forum_errors=False, atomic=False):
     """
     Compute and save engagement scores and stats for whole course.
+
+    With `bulk` set, scores are computed in memory and written with chunked
+    bulk queries instead of one `update_or_create` per user. In both modes
+    users whose stats and score did not change are skipped.
+
+    With `checkpointed` set, progress is checkpointed after every chunk of
+    users, so a recompute retried after an error resumes where it stopped.
+
+    With `bulk` and `atomic` set, the scores of all users are written in a single
+    transaction once all stats are fetched, so a failure doesn't leave them partly written.
+
+    Errors of cs_comments_service are logged, or raised for the caller to retry
+    if `checkpointed` or `raise_forum_errors` is set.
     """
 
     if not settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT', False):
@@ -60,22 +98,290 @@ def update_course_engagement(course_id, compute_if_closed_course=False, course_d
             return
 
     score_update_count = 0
+    skipped_count = 0
+    started = timezone.now()
 
-    try:
-        for user_id, social_stats in _get_course_social_stats(slash_course_id):
-            log.info('Updating social engagement score for user_id {}  in course_key {}'.format(user_id, course_key))
+    with leaderboard_notification_batch(course_key) as notification_batch:
+        try:
+            if checkpointed:
+                score_update_count, skipped_count = _checkpointed_update_course_engagement(
+                    course_key, slash_course_id, bulk, notification_batch
+                )
+            elif bulk:
+                score_update_count, skipped_count = _bulk_update_course_engagement(
+                    course_key, slash_course_id, atomic
+                )
+            else:
+                score_update_count, skipped_count = _save_users_scores(
+                    course_key,
+                    _get_course_social_stats(slash_course_id),
+                    StudentSocialEngagementScore.get_course_engagement_entries(course_key),
+                )
+
+            if is_incremental_recompute_enabled() and not checkpointed:
+                CourseSocialEngagementState.record_recompute(course_key, started)
+
+        except (CommentClientRequestError, ConnectionError) as error:
+            if checkpointed or raise_forum_errors:
+                raise
+            log.exception(error)
+
+    log.info(
+        'Social engagement scores written for {} users and skipped for {} unchanged users in course_key {}'.format(
+            score_update_count, skipped_count, course_key
+        )
+    )
+    return score_update_count
+
+
+def _save_users_scores(course_key, user_stats, existing):
+    """
+    Compute and save scores of `(user_id, stats)` tuples one by one, skipping
+    users whose `existing` entry did not change.
+    Returns the number of written and skipped scores.
+    """
+    score_update_count = 0
+    skipped_count = 0
+    weights_hash = get_weights_hash()
+
+    for user_id, social_stats in user_stats:
+        current_score = _compute_social_engagement_score(social_stats)
 
-            current_score = _compute_social_engagement_score(social_stats)
+        entry = existing.get(int(user_id))
+        if entry is not None and not entry.has_engagement_changed(current_score, social_stats, weights_hash):
+            skipped_count += 1
+            continue
 
-            StudentSocialEngagementScore.save_user_engagement_score(
-                course_key, user_id, current_score, social_stats
+        log.info('Updating social engagement score for user_id {}  in course_key {}'.format(
+            user_id, course_key
+        ))
+
+        StudentSocialEngagementScore.save_user_engagement_score(
+            course_key, user_id, current_score, social_stats
+        )
+
+        score_update_count += 1
+
+    return score_update_count, skipped_count
+
+
+def _checkpointed_update_course_engagement(course_key, slash_course_id, bulk, notification_batch):
+    """
+    Compute and save scores of a course in chunks of consecutive user ids, and
+    checkpoint the last saved user after every chunk.
+
+    Stats are fetched once and kept as a snapshot in the cache, together with the
+    leaders of `notification_batch`, so a recompute resumed after the checkpoint
+    continues with the same stats and notifies against the leaders from before
+    its first chunk was saved.
+    Returns the number of written and skipped scores.
+    """
+    state = CourseSocialEngagementState.start_recompute(course_key)
+    fetched = None
+    try:
+        snapshot_id = state.recompute_snapshot_id
+        last_user_id = state.recompute_last_user_id
+        snapshot = _get_stats_snapshot(snapshot_id) if snapshot_id else None
+
+        if snapshot:
+            user_stats, fetched, previous_leaders = snapshot
+            log.info('Resuming social engagement recompute of course_key {} after user_id {}'.format(
+                course_key, last_user_id
+            ))
+            if last_user_id is not None:
+                user_stats = [item for item in user_stats if item[0] > last_user_id]
+            if previous_leaders is not None and 'previous_leaders' in notification_batch:
+                notification_batch['previous_leaders'] = previous_leaders
+        else:
+            fetched = timezone.now()
+            user_stats = sorted(
+                (int(user_id), stats) for user_id, stats in _get_course_social_stats(slash_course_id)
             )
+            snapshot_id = _save_stats_snapshot(user_stats, fetched, notification_batch.get('previous_leaders'))
+            last_user_id = None
+            CourseSocialEngagementState.record_checkpoint(course_key, snapshot_id)
+
+        batch_size = getattr(settings, 'SOCIAL_ENGAGEMENT_BULK_BATCH_SIZE', 500)
+        scoring_engine = get_scoring_engine()
+        score_update_count = 0
+        skipped_count = 0
+        for start in range(0, len(user_stats), batch_size):
+            chunk = user_stats[start:start + batch_size]
+            user_id_range = (chunk[0][0], chunk[-1][0])
+            if bulk:
+                written, skipped = StudentSocialEngagementScore.bulk_save_user_engagement_scores(
+                    course_key,
+                    scoring_engine.score_users(chunk),
+                    user_id_range=user_id_range,
+                    refresh_rankings=False,
+                )
+            else:
+                written, skipped = _save_users_scores(
+                    course_key,
+                    chunk,
+                    StudentSocialEngagementScore.get_course_engagement_entries(course_key, user_id_range),
+                )
+            score_update_count += written
+            skipped_count += skipped
+            CourseSocialEngagementState.record_checkpoint(course_key, snapshot_id, chunk[-1][0])
+
+        # a resumed recompute may have written scores before the checkpoint
+        if bulk and (score_update_count or last_user_id is not None):
+            StudentSocialEngagementScore.refresh_course_rankings(course_key, batch_size)
+    except Exception:
+        CourseSocialEngagementState.finish_recompute(course_key, fetched, failed=True)
+        raise
+
+    CourseSocialEngagementState.finish_recompute(course_key, fetched)
+    _delete_stats_snapshot(snapshot_id)
+    return score_update_count, skipped_count
 
-            score_update_count += 1
 
-    except (CommentClientRequestError, ConnectionError) as error:
-        log.exception(error)
+def _save_stats_snapshot(user_stats, fetched, previous_leaders=None):
+    """
+    Stores `(user_id, stats)` tuples in the cache in chunks, and returns the id of the snapshot.
+    """
+    snapshot_id = uuid4().hex
+    chunk_size = getattr(settings, 'SOCIAL_ENGAGEMENT_BULK_BATCH_SIZE', 500)
+    timeout = getattr(settings, 'SOCIAL_ENGAGEMENT_STATS_SNAPSHOT_TTL', 6 * 60 * 60)
+
+    chunks = [user_stats[start:start + chunk_size] for start in range(0, len(user_stats), chunk_size)]
+    cache.set_many(
+        {_stats_snapshot_cache_key(snapshot_id, index): chunk for index, chunk in enumerate(chunks)},
+        timeout
+    )
+    # the header is stored last, so an incomplete snapshot is never used
+    cache.set(
+        _stats_snapshot_cache_key(snapshot_id),
+        {'chunks': len(chunks), 'fetched': fetched, 'previous_leaders': previous_leaders},
+        timeout
+    )
+    return snapshot_id
+
+
+def _get_stats_snapshot(snapshot_id):
+    """
+    Returns the `(user_id, stats)` tuples of a snapshot, the time they were fetched and
+    the leaders before the recompute, or None if any part of the snapshot expired.
+    """
+    header = cache.get(_stats_snapshot_cache_key(snapshot_id))
+    if header is None:
+        return None
 
+    keys = [_stats_snapshot_cache_key(snapshot_id, index) for index in range(header['chunks'])]
+    chunks = cache.get_many(keys)
+    if len(chunks) < len(keys):
+        return None
+    return [item for key in keys for item in chunks[key]], header['fetched'], header.get('previous_leaders')
+
+
+def _delete_stats_snapshot(snapshot_id):
+    header = cache.get(_stats_snapshot_cache_key(snapshot_id))
+    keys = [_stats_snapshot_cache_key(snapshot_id)]
+    if header:
+        keys += [_stats_snapshot_cache_key(snapshot_id, index) for index in range(header['chunks'])]
+    cache.delete_many(keys)
+
+
+def _stats_snapshot_cache_key(snapshot_id, chunk=None):
+    key = 'social_engagement.stats_snapshot.{}'.format(snapshot_id)
+    return key if chunk is None else '{}.{}'.format(key, chunk)
+
+
+def _bulk_update_course_engagement(course_key, slash_course_id, atomic=False):
+    """
+    Compute scores of all users in memory and save them with bulk queries,
+    in a single transaction if `atomic` is set.
+    Returns the number of written and skipped scores.
+    """
+    user_scores = get_scoring_engine().score_users(_get_course_social_stats(slash_course_id))
+    log.info('Bulk updating social engagement scores for {} users in course_key {}'.format(
+        len(user_scores), course_key
+    ))
+    if not atomic:
+        return StudentSocialEngagementScore.bulk_save_user_engagement_scores(course_key, user_scores)
+
+    # the leaderboard index is outside the database, so rankings are refreshed once the scores are committed
+    with transaction.atomic():
+        written_count, skipped_count = StudentSocialEngagementScore.bulk_save_user_engagement_scores(
+            course_key, user_scores, refresh_rankings=False
+        )
+    if written_count:
+        StudentSocialEngagementScore.refresh_course_rankings(course_key)
+    return written_count, skipped_count
+
+
+def is_checkpointed_recompute_enabled():
+    """
+    Returns True if course recomputes checkpoint their progress and are retried on errors.
+    """
+    return settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT_CHECKPOINTED_RECOMPUTE', False)
+
+
+def is_sharded_recompute_enabled():
+    """
+    Returns True if course recomputes are split into shards processed by separate tasks.
+    """
+    return settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT_SHARDED_RECOMPUTE', False)
+
+
+def get_course_social_stats_shards(slash_course_id):
+    """
+    Fetches stats of all users in a course and splits them into shards of
+    consecutive user ids, as lists of `(user_id, stats)` tuples.
+
+    Shards hold at least SOCIAL_ENGAGEMENT_RECOMPUTE_SHARD_SIZE users, and
+    more if a course would need more than SOCIAL_ENGAGEMENT_RECOMPUTE_MAX_SHARDS shards.
+    """
+    user_stats = sorted((int(user_id), stats) for user_id, stats in _get_course_social_stats(slash_course_id))
+    shard_size = getattr(settings, 'SOCIAL_ENGAGEMENT_RECOMPUTE_SHARD_SIZE', 5000)
+    max_shards = getattr(settings, 'SOCIAL_ENGAGEMENT_RECOMPUTE_MAX_SHARDS', 16)
+    shard_size = max(shard_size, -(-len(user_stats) // max_shards))
+    return [user_stats[start:start + shard_size] for start in range(0, len(user_stats), shard_size)]
+
+
+def save_course_scores_shard(course_key, shard):
+    """
+    Computes and saves scores of a shard of `(user_id, stats)` tuples with bulk queries.
+    Stored ranks and the leaderboard index are left to `finish_course_scores_shards`.
+    Returns the number of written and skipped scores.
+    """
+    if not shard:
+        return 0, 0
+
+    user_scores = get_scoring_engine().score_users(shard)
+    return StudentSocialEngagementScore.bulk_save_user_engagement_scores(
+        course_key,
+        user_scores,
+        user_id_range=(shard[0][0], shard[-1][0]),
+        refresh_rankings=False,
+    )
+
+
+def finish_course_scores_shards(course_key, shard_results, previous_leaders=None, started=None):
+    """
+    Refreshes course level data once all shards of a recompute are saved and
+    notifies users who entered the leaderboard meanwhile.
+    Returns the number of written scores.
+    """
+    score_update_count = sum(written for written, __ in shard_results)
+    skipped_count = sum(skipped for __, skipped in shard_results)
+
+    if score_update_count:
+        StudentSocialEngagementScore.refresh_course_rankings(course_key)
+        if is_course_aggregate_enabled():
+            CourseSocialEngagementAggregate.reconcile(course_key)
+
+    if started and is_incremental_recompute_enabled():
+        CourseSocialEngagementState.record_recompute(course_key, started)
+
+    if previous_leaders is not None:
+        notify_new_leaders(course_key, previous_leaders)
+
+    log.info(
+        'Social engagement scores written for {} users and skipped for {} unchanged users '
+        'in {} shards of course_key {}'.format(score_update_count, skipped_count, len(shard_results), course_key)
+    )
     return score_update_count
 
 
@@ -87,22 +393,24 @@ def _get_course_social_stats(course_id):
     yield from stats.items()
 
 
-def get_social_metric_points():
+def get_scoring_engine():
     """
-    Get custom or default social metric points.
+    Returns a scoring engine computing scores of many users with the current social metric points.
     """
-    return getattr(
-        settings,
-        'SOCIAL_METRIC_POINTS',
-        {
-            'num_threads': 10,
-            'num_comments': 15,
-            'num_replies': 15,
-            'num_upvotes': 25,
-            'num_thread_followers': 5,
-            'num_comments_generated': 15,
-        }
-    )
+    return ScoringEngine(get_social_metric_points())
+
+
+def get_stat_changes(param, increment=True, items=1):
+    """
+    Converts the arguments of a stat change into a dictionary of signed deltas.
+
+    :param param: `str` with stat that should be changed or
+                  `dict[str, int]` (`stat: number_of_occurrences`) with the stats that should be changed
+    """
+    factor = items if increment else -items
+    if isinstance(param, dict):
+        return {stat: value * factor for stat, value in param.items()}
+    return {param: factor}
 
 
 def _compute_social_engagement_score(social_metrics):
@@ -129,7 +437,7 @@ def handle_progress_pre_save_signal(sender, instance, **kwargs):
     Handle the pre-save ORM event on StudentSocialEngagementScore
     """
 
-    if settings.FEATURES['ENABLE_NOTIFICATIONS']:
+    if settings.FEATURES['ENABLE_NOTIFICATIONS'] and not _is_notification_batch_active():
         # If notifications feature is enabled, then we need to get the user's
         # rank before the save is made, so that we can compare it to
         # after the save and see if the position changes
@@ -147,63 +455,183 @@ def handle_progress_post_save_signal(sender, instance, **kwargs):
     Handle the pre-save ORM event on CourseModuleCompletions
     """
 
-    if settings.FEATURES['ENABLE_NOTIFICATIONS']:
+    if settings.FEATURES['ENABLE_NOTIFICATIONS'] and not _is_notification_batch_active():
         # If notifications feature is enabled, then we need to get the user's
         # rank before the save is made, so that we can compare it to
         # after the save and see if the position changes
 
-        leaderboard_rank = StudentSocialEngagementScore.get_user_leaderboard_position(
-            instance.course_id,
-            user_id=instance.user.id,
-            exclude_users=get_aggregate_exclusion_user_ids(instance.course_id)
+        _notify_if_entered_leaderboard(instance.course_id, instance.user.id, instance.presave_leaderboard_rank)
+
+
+def _notify_if_entered_leaderboard(course_id, user_id, presave_leaderboard_rank):
+    """
+    Compare user's current rank to the rank before the write and notify them if they entered the Leaderboard.
+    """
+    leaderboard_rank = StudentSocialEngagementScore.get_user_leaderboard_position(
+        course_id,
+        user_id=user_id,
+        exclude_users=get_aggregate_exclusion_user_ids(course_id)
+    )['position']
+
+    if leaderboard_rank == 0:
+        # quick escape when user is not in the leaderboard
+        # which means rank = 0. Trouble is 0 < 3, so unfortunately
+        # the semantics around 0 don't match the logic below
+        return
+
+    # logic for Notification trigger is when a user enters into the Leaderboard
+    leaderboard_size = getattr(settings, 'LEADERBOARD_SIZE', 3)
+    presave_leaderboard_rank = presave_leaderboard_rank if presave_leaderboard_rank else sys.maxsize
+    if leaderboard_rank <= leaderboard_size and presave_leaderboard_rank > leaderboard_size:
+        _publish_leaderboard_notification(course_id, user_id, leaderboard_rank)
+
+
+def apply_user_engagement_changes(course_key, user_id, changes):
+    """
+    Add signed stat `changes` to the user's stats and score with a single upsert
+    statement, then run the post-write hooks and notifications the model save
+    receivers would run.
+    """
+    social_metric_points = get_social_metric_points()
+    score_delta = sum(social_metric_points.get(stat, 0) * delta for stat, delta in changes.items())
+
+    notify = settings.FEATURES['ENABLE_NOTIFICATIONS'] and not _is_notification_batch_active()
+    if notify:
+        presave_leaderboard_rank = StudentSocialEngagementScore.get_user_leaderboard_position(
+            course_key,
+            user_id=user_id,
+            exclude_users=get_aggregate_exclusion_user_ids(course_key)
         )['position']
 
-        if leaderboard_rank == 0:
-            # quick escape when user is not in the leaderboard
-            # which means rank = 0. Trouble is 0 < 3, so unfortunately
-            # the semantics around 0 don't match the logic below
-            return
+    with transaction.atomic():
+        StudentSocialEngagementScore.lock_course_ranks(course_key)
+        StudentSocialEngagementScore.upsert_engagement_changes(course_key, user_id, changes, score_delta)
+        entry = StudentSocialEngagementScore.objects.get(course_id__exact=course_key, user_id=user_id)
+        # an inserted entry got the same creation and modification time
+        handle_engagement_score_written(entry, entry.created == entry.modified, score_delta)
 
-        # logic for Notification trigger is when a user enters into the Leaderboard
-        leaderboard_size = getattr(settings, 'LEADERBOARD_SIZE', 3)
-        presave_leaderboard_rank = instance.presave_leaderboard_rank if instance.presave_leaderboard_rank else sys.maxsize
-        if leaderboard_rank <= leaderboard_size and presave_leaderboard_rank > leaderboard_size:
-            try:
-                notification_msg = NotificationMessage(
-                    msg_type=get_notification_type('open-edx.lms.leaderboard.engagement.rank-changed'),
-                    namespace=str(instance.course_id),
-                    payload={
-                        '_schema_version': '1',
-                        'rank': leaderboard_rank,
-                        'leaderboard_name': 'Engagement',
-                    }
-                )
+    if notify:
+        _notify_if_entered_leaderboard(course_key, user_id, presave_leaderboard_rank)
+
+
+@contextmanager
+def leaderboard_notification_batch(course_key):
+    """
+    Context manager for saving many scores of a course at once.
+
+    While it is active the per-row notification receivers are bypassed. Instead,
+    the leaderboard is read once before and once after the batch, and the users
+    who newly entered it get notified.
+
+    Yields a dictionary with the `previous_leaders` read before the batch, empty
+    if notifications are not sent by this batch. A resumed recompute replaces
+    them with the leaders read before it was interrupted.
+    """
+    if not settings.FEATURES['ENABLE_NOTIFICATIONS'] or _is_notification_batch_active():
+        yield {}
+        return
+
+    batch = {'previous_leaders': get_leaderboard_leaders(course_key)}
+
+    _notification_batch.active = True
+    try:
+        yield batch
+    finally:
+        _notification_batch.active = False
+
+    notify_new_leaders(course_key, batch['previous_leaders'])
 
-                #
-                # add in all the context parameters we'll need to
-                # generate a URL back to the website that will
-                # present the new course announcement
-                #
-                # IMPORTANT: This can be changed to msg.add_click_link() if we
-                # have a particular URL that we wish to use. In the initial use case,
-                # we need to make the link point to a different front end website
-                # so we need to resolve these links at dispatch time
-                #
-                notification_msg.add_click_link_params({
-                    'course_id': str(instance.course_id),
-                })
-
-                publish_notification_to_user(int(instance.user.id), notification_msg)
-            except Exception as ex:
-                # Notifications are never critical, so we don't want to disrupt any
-                # other logic processing. So log and continue.
-                log.exception(ex)
+
+def get_leaderboard_leaders(course_key):
+    """
+    Returns ids of the users currently on the leaderboard of a course.
+    """
+    return StudentSocialEngagementScore.get_leaderboard_user_ids(
+        course_key,
+        getattr(settings, 'LEADERBOARD_SIZE', 3),
+        exclude_users=get_aggregate_exclusion_user_ids(course_key)
+    )
+
+
+def notify_new_leaders(course_key, previous_leaders):
+    """
+    Notifies users who entered the leaderboard of a course since it was read as `previous_leaders`.
+    Notifications are sent once the current transaction is committed, if there is one.
+    """
+    previous_leaders = set(previous_leaders)
+    new_leaders = [
+        (leaderboard_rank, user_id)
+        for leaderboard_rank, user_id in enumerate(get_leaderboard_leaders(course_key), start=1)
+        if user_id not in previous_leaders
+    ]
+
+    def publish():
+        for leaderboard_rank, user_id in new_leaders:
+            _publish_leaderboard_notification(course_key, user_id, leaderboard_rank)
+
+    if new_leaders:
+        transaction.on_commit(publish)
+
+
+def _is_notification_batch_active():
+    """
+    Returns True if scores are being saved inside `leaderboard_notification_batch`.
+    """
+    return getattr(_notification_batch, 'active', False)
+
+
+def _publish_leaderboard_notification(course_id, user_id, leaderboard_rank):
+    """
+    Notify the user that they entered into the Leaderboard.
+    """
+    try:
+        notification_msg = NotificationMessage(
+            msg_type=get_notification_type('open-edx.lms.leaderboard.engagement.rank-changed'),
+            namespace=str(course_id),
+            payload={
+                '_schema_version': '1',
+                'rank': leaderboard_rank,
+                'leaderboard_name': 'Engagement',
+            }
+        )
+
+        #
+        # add in all the context parameters we'll need to
+        # generate a URL back to the website that will
+        # present the new course announcement
+        #
+        # IMPORTANT: This can be changed to msg.add_click_link() if we
+        # have a particular URL that we wish to use. In the initial use case,
+        # we need to make the link point to a different front end website
+        # so we need to resolve these links at dispatch time
+        #
+        notification_msg.add_click_link_params({
+            'course_id': str(course_id),
+        })
+
+        publish_notification_to_user(int(user_id), notification_msg)
+    except Exception as ex:
+        # Notifications are never critical, so we don't want to disrupt any
+        # other logic processing. So log and continue.
+        log.exception(ex)
+
+
+def is_deferred_deletion_enabled():
+    """
+    Returns True if deletions are accounted for by a background course recompute
+    instead of walking the deleted thread or comment in the request.
+    """
+    return settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT_DEFERRED_DELETION', False)
 
 
 def get_involved_users_in_thread(request, thread):
     """
     Compute all the users involved in the children of a specific thread.
     """
+    if is_deferred_deletion_enabled():
+        # the stats of involved users are recomputed in a task after the deletion
+        return _detail_results_factory()['users']
+
     params = {"thread_id": thread.id, "page_size": 100}
     is_question = getattr(thread, "thread_type", None) == "question"
     author_id = getattr(thread, 'user_id', None)
@@ -238,6 +666,10 @@ def get_involved_users_in_comment(request, comment):
     Method used to extract the involved users in the comment.
     This method also returns the creator of the post.
     """
+    if is_deferred_deletion_enabled():
+        # the stats of involved users are recomputed in a task after the deletion
+        return _detail_results_factory()['users']
+
     params = {"page_size": 100}
     comment_author_id = getattr(comment, 'user_id', None)
     thread_author_id = None
@@ -278,52 +710,31 @@ def _detail_results_factory():
 
 
 def _get_users_in_thread(request):
-    from lms.djangoapps.discussion.rest_api.views import CommentViewSet
-    users = set()
-    response_page = 1
-    has_results = True
-    while has_results:
-        try:
-            params = {"page": response_page}
-            response = CommentViewSet().list(
-                _get_request(request, params)
-            )
-
-            for comment in response.data["results"]:
-                users.add(comment["author"])
-                if comment["child_count"] > 0:
-                    users.update(_get_users_in_comment(request, comment["id"]))
-            has_results = response.data["pagination"]["next"]
-            response_page += 1
-        except (ThreadNotFoundError, InvalidKeyError):
-            return users
-    return users
+    return _get_users_in_tree(request, is_thread=True)
 
 
 def _get_users_in_comment(request, comment_id):
-    from lms.djangoapps.discussion.rest_api.views import CommentViewSet
+    return _get_users_in_tree(request, comment_id)
+
+
+def _get_users_in_tree(request, comment_id=None, is_thread=False):
     users = set()
-    response_page = 1
-    has_results = True
-    while has_results:
-        try:
-            response = CommentViewSet().retrieve(_get_request(request, {"page": response_page}), comment_id)
-            for comment in response.data["results"]:
-                users.add(comment["author"])
-                if comment["child_count"] > 0:
-                    users.update(_get_users_in_comment(request, comment["id"]))
-            has_results = response.data["pagination"]["next"]
-            response_page += 1
-        except (ThreadNotFoundError, InvalidKeyError):
-            return users
+    for __, __, response in _CommentTreeWalker(request).walk(comment_id, is_thread=is_thread):
+        users.update(comment["author"] for comment in response.data["results"])
     return users
 
 
 def _get_request(incoming_request, params):
+    """
+    Returns a GET request with `params` added to the query of `incoming_request`.
+
+    META is shared with the incoming request instead of being copied, as the
+    comment views only read it.
+    """
     request = HttpRequest()
     request.method = 'GET'
     request.user = incoming_request.user
-    request.META = incoming_request.META.copy()
+    request.META = incoming_request.META
     request.GET = incoming_request.GET.copy()
     request.GET.update(params)
     return request
@@ -336,9 +747,39 @@ def _get_author_of_comment(parent_id):
 
 
 def _get_author_of_thread(thread_id):
-    thread = cc.Thread.find(thread_id)
-    if thread and hasattr(thread, 'user_id'):
-        return thread.user_id
+    author_id = get_cached_thread_author_id(thread_id)
+    if author_id is None:
+        thread = cc.Thread.find(thread_id)
+        if thread and hasattr(thread, 'user_id'):
+            author_id = thread.user_id
+            _cache_thread_author_id(thread_id, author_id)
+    return author_id
+
+
+def get_cached_thread_author_id(thread_id):
+    """
+    Returns the id of the thread's author if it is cached in the process or
+    in the shared cache, without calling cs_comments_service.
+    """
+    author_id = _thread_authors.get(thread_id)
+    if author_id is None:
+        author_id = cache.get(_thread_author_cache_key(thread_id))
+        if author_id is not None:
+            _thread_authors.set(thread_id, author_id)
+    return author_id
+
+
+def _cache_thread_author_id(thread_id, author_id):
+    _thread_authors.set(thread_id, author_id)
+    cache.set(
+        _thread_author_cache_key(thread_id),
+        author_id,
+        getattr(settings, 'SOCIAL_ENGAGEMENT_THREAD_AUTHOR_CACHE_TTL', 3600)
+    )
+
+
+def _thread_author_cache_key(thread_id):
+    return 'social_engagement.thread_author.{}'.format(thread_id)
 
 
 def _get_details_for_deletion(request, comment_id=None, results=None, nested=False, is_thread=False):
@@ -348,44 +789,159 @@ def _get_details_for_deletion(request, comment_id=None, results=None, nested=Fal
     if not results:
         results = _detail_results_factory()
 
-    for page, response in enumerate(_get_paginated_results(request, comment_id, is_thread)):
-            if page == 0:
-                results['all_comments'] += response.data['pagination']['count']
+    for nested, first_page, response in _CommentTreeWalker(request).walk(comment_id, nested, is_thread):
+        if first_page:
+            results['all_comments'] += response.data['pagination']['count']
 
-            if results['replies'] == 0:
-                results['replies'] = response.data['pagination']['count']
+        if results['replies'] == 0:
+            results['replies'] = response.data['pagination']['count']
 
-            for comment in response.data['results']:
-                _extract_stats_from_comment(request, comment, results, nested)
+        for comment in response.data['results']:
+            _extract_stats_from_comment(comment, results, nested)
 
     return results
 
 
-def _get_paginated_results(request, comment_id, is_thread):
+class _CommentTreeWalker:
     """
-    Yield paginated comments of comment or thread.
+    Walks the pages of comments of a thread or comment and of all their replies.
+
+    The tree is walked iteratively, one level at a time, so the pages of all
+    comments of a level are fetched concurrently through a bounded thread pool.
+    The number of fetched pages is capped by SOCIAL_ENGAGEMENT_DELETION_MAX_PAGES.
     """
-    from lms.djangoapps.discussion.rest_api.views import CommentViewSet
 
-    response_page = 1
-    has_next = True
-    while has_next:
-        try:
-            if is_thread:
-                response = CommentViewSet().list(_get_request(request, {"page": response_page}))
+    def __init__(self, request):
+        self.request = request
+        self.max_pages = getattr(settings, 'SOCIAL_ENGAGEMENT_DELETION_MAX_PAGES', 1000)
+        self.pages_fetched = 0
+        self.nodes_visited = 0
+        self.truncated = False
+
+    def walk(self, comment_id=None, nested=False, is_thread=False):
+        """
+        Yields `(nested, first_page, response)` for every fetched page, in a deterministic order.
+        """
+        level = [(comment_id, nested, is_thread)]
+        with _get_fetch_executor() as executor:
+            while level:
+                next_level = []
+                for (__, nested, __), responses in zip(level, self._fetch_level(executor, level)):
+                    for page, response in enumerate(responses):
+                        for comment in response.data['results']:
+                            self.nodes_visited += 1
+                            if comment['child_count'] > 0:
+                                next_level.append((comment['id'], True, False))
+                        yield nested, page == 0, response
+                level = next_level
+
+        if self.truncated:
+            log.warning(
+                "Stopped walking comments of '%s' after %s pages and %s comments.",
+                comment_id, self.pages_fetched, self.nodes_visited
+            )
+        else:
+            log.debug("Walked %s pages and %s comments of '%s'.", self.pages_fetched, self.nodes_visited, comment_id)
+
+    def _fetch_level(self, executor, nodes):
+        """
+        Returns a list of response pages for each of `nodes` (`(comment_id, nested, is_thread)`), in the same order.
+
+        Once the first page of a node reveals the number of pages, the remaining
+        pages are fetched concurrently. Otherwise they are followed one by one.
+        """
+        first_pages = self._fetch(executor, [(comment_id, is_thread, 1) for comment_id, __, is_thread in nodes])
+
+        pages = []
+        remaining_pages = []
+        for (comment_id, __, is_thread), response in zip(nodes, first_pages):
+            responses = [response] if response else []
+            pages.append(responses)
+            if not response:
+                continue
+
+            num_pages = response.data['pagination'].get('num_pages')
+            if num_pages:
+                remaining_pages.extend((responses, (comment_id, is_thread, page)) for page in range(2, num_pages + 1))
             else:
-                response = CommentViewSet().retrieve(_get_request(request, {"page": response_page}), comment_id)
-        except (ThreadNotFoundError, CommentNotFoundError, InvalidKeyError):
-            raise StopIteration
+                page = 1
+                while response and response.data['pagination']['next']:
+                    page += 1
+                    response = self._fetch(None, [(comment_id, is_thread, page)])[0]
+                    if response:
+                        responses.append(response)
+
+        fetched = self._fetch(executor, [page for __, page in remaining_pages])
+        for (responses, __), response in zip(remaining_pages, fetched):
+            if response:
+                responses.append(response)
+
+        return pages
+
+    def _fetch(self, executor, pages):
+        """
+        Returns responses for `pages` (`(comment_id, is_thread, page)`) in the same order.
+        Pages over the cap are not fetched and returned as None.
+        """
+        allowed = pages
+        if self.max_pages is not None:
+            allowed = pages[:max(self.max_pages - self.pages_fetched, 0)]
+            self.truncated = self.truncated or len(allowed) < len(pages)
+        self.pages_fetched += len(allowed)
+
+        responses = _map_concurrently(executor, lambda page: _fetch_page(self.request, *page), allowed)
+        return responses + [None] * (len(pages) - len(allowed))
+
+
+@contextmanager
+def _get_fetch_executor():
+    """
+    Yields a bounded thread pool for fetching comment pages, or None if
+    concurrent fetching is disabled.
+    """
+    max_workers = getattr(settings, 'SOCIAL_ENGAGEMENT_DELETION_FETCH_WORKERS', 8)
+    if max_workers <= 1:
+        yield None
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield executor
+
+
+def _map_concurrently(executor, function, items):
+    """
+    Returns `function` results for `items` in the order of `items`.
+    """
+    if executor is None or len(items) <= 1:
+        return [function(item) for item in items]
+    return list(executor.map(partial(_call_in_worker_thread, function), items))
+
 
-        has_next = response.data["pagination"]["next"]
-        response_page += 1
-        yield response
+def _call_in_worker_thread(function, item):
+    try:
+        return function(item)
+    finally:
+        # worker threads open their own database connections, which are not closed by request handling
+        connections.close_all()
 
 
-def _extract_stats_from_comment(request, comment, results, nested):
+def _fetch_page(request, comment_id, is_thread, page):
     """
-    Extract results from comment and its nested comments.
+    Returns a page of comments of comment or thread, or None if it does not exist.
+    """
+    from lms.djangoapps.discussion.rest_api.views import CommentViewSet
+
+    try:
+        if is_thread:
+            return CommentViewSet().list(_get_request(request, {"page": page}))
+        return CommentViewSet().retrieve(_get_request(request, {"page": page}), comment_id)
+    except (ThreadNotFoundError, CommentNotFoundError, InvalidKeyError):
+        return None
+
+
+def _extract_stats_from_comment(comment, results, nested):
+    """
+    Extract results from comment.
     """
     user_id = comment.serializer.instance['user_id']
 
@@ -396,6 +952,3 @@ def _extract_stats_from_comment(request, comment, results, nested):
     results['users'][user_id]['num_upvotes'] += comment['vote_count']
     if comment.serializer.instance['abuse_flaggers']:
         results['users'][user_id]['num_flagged'] += 1
-
-    if comment['child_count'] > 0:
-        _get_details_for_deletion(request, comment['id'], results, nested=True)
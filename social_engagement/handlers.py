@@ -1,18 +1,37 @@
 """
-Discussion forum signal handlers
+Discussion forum and enrollment signal handlers
 """
 import logging
 
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 
-import openedx.core.djangoapps.django_comment_common.comment_client as cc
+from opaque_keys import InvalidKeyError
+from opaque_keys.edx.keys import CourseKey
 from openedx.core.djangoapps.django_comment_common.signals import (comment_created, comment_deleted,
                                            thread_created, thread_deleted,
                                            thread_followed,
                                            thread_or_comment_flagged,
                                            thread_unfollowed, thread_voted)
-from social_engagement.tasks import task_update_user_engagement
+from social_engagement.buffer import get_engagement_buffer
+from social_engagement.course_schedule import is_course_closed
+from social_engagement.engagement import (get_cached_thread_author_id,
+                                          get_stat_changes,
+                                          is_deferred_deletion_enabled)
+from social_engagement.models import (CourseSocialEngagementState,
+                                      handle_enrollment_changed,
+                                      handle_user_activation_changed,
+                                      is_enrollment_tracking_enabled,
+                                      is_incremental_recompute_enabled)
+from social_engagement.tasks import (buffer_engagement_changes,
+                                     enqueue_deferred_deletion,
+                                     task_update_thread_author_engagement,
+                                     task_update_user_engagement,
+                                     task_update_users_engagement)
+from student.models import CourseEnrollment
 
 log = logging.getLogger(__name__)
 
@@ -30,9 +49,7 @@ def thread_signal_handler(sender, **kwargs):  # pylint: disable=unused-argument
 
     # present if thread_deleted
     if 'involved_users' in kwargs:
-        users = kwargs['involved_users']
-        for user, user_data in users.items():
-            _decrement(user, course_id, user_data)
+        _handle_deletion(thread, course_id, kwargs['involved_users'])
 
     # thread or comment voted
     else:
@@ -62,9 +79,7 @@ def comment_deleted_signal_handler(sender, **kwargs):  # pylint: disable=unused-
     course_id = getattr(post, 'course_id', None)
 
     if 'involved_users' in kwargs:
-        users = kwargs['involved_users']
-        for user, user_data in users.items():
-            _decrement(user, course_id, user_data)
+        _handle_deletion(post, course_id, kwargs['involved_users'])
 
 
 @receiver(comment_created)
@@ -91,18 +106,8 @@ def comment_created_signal_handler(sender, **kwargs):  # pylint: disable=unused-
             _increment(action_user.id, course_id, 'num_replies')
 
         if thread_id:
-            thread = cc.Thread.find(thread_id)
-
-            # IMPORTANT: we have to use getattr here as
-            # otherwise the property will not get fetched
-            # from cs_comment_service
-            try:
-                thread_user_id = int(getattr(thread, 'user_id'))
-
-                # update the engagement score of the thread creator as well
-                _increment(thread_user_id, course_id, 'num_comments_generated')
-            except AttributeError as error:
-                log.exception(error)
+            # update the engagement score of the thread creator as well
+            _increment_thread_author(thread_id, course_id, 'num_comments_generated')
 
 
 @receiver(thread_followed)
@@ -150,6 +155,75 @@ def thread_or_comment_flagged_handler(sender, **kwargs):  # pylint: disable=unus
     change(user_id, course_id, 'num_flagged')
 
 
+@receiver(pre_save, sender=CourseEnrollment)
+def enrollment_pre_save_handler(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Remember whether the stored enrollment is active, so only activations and deactivations are handled.
+    """
+    instance.social_engagement_presave_is_active = CourseEnrollment.objects.filter(
+        pk=instance.pk
+    ).values_list('is_active', flat=True).first() if instance.pk and is_enrollment_tracking_enabled() else None
+
+
+@receiver(post_save, sender=CourseEnrollment)
+def enrollment_post_save_handler(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Updates the course total and rankings when a user's enrollment in a course is activated or deactivated.
+    Enrollment signals are not used, as they are also sent for re-enrollments, upgrades and payments.
+    """
+    was_active = bool(getattr(instance, 'social_engagement_presave_is_active', None))
+    if was_active != instance.is_active:
+        handle_enrollment_changed(instance.course_id, instance.user_id)
+
+
+@receiver(pre_save, sender=User)
+def user_pre_save_handler(sender, instance, update_fields=None, **kwargs):  # pylint: disable=unused-argument
+    """
+    Remember whether the stored user is active, so only activations and deactivations are handled.
+    """
+    tracked = instance.pk and is_enrollment_tracking_enabled() and (
+        update_fields is None or 'is_active' in update_fields
+    )
+    instance.social_engagement_presave_is_active = User.objects.filter(
+        pk=instance.pk
+    ).values_list('is_active', flat=True).first() if tracked else None
+
+
+@receiver(post_save, sender=User)
+def user_post_save_handler(sender, instance, created, **kwargs):  # pylint: disable=unused-argument
+    """
+    Updates the totals and rankings of a user's courses when the user is activated or deactivated.
+    """
+    was_active = getattr(instance, 'social_engagement_presave_is_active', None)
+    if not created and was_active is not None and was_active != instance.is_active:
+        handle_user_activation_changed(instance.id)
+
+
+def _handle_deletion(post, course_id, involved_users):
+    """
+    Decrement stats of users involved in a deleted thread or comment. In deferred
+    mode a task recomputes the stats of the course instead.
+    """
+    if is_deferred_deletion_enabled():
+        if settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT') and course_id and _is_course_open(course_id):
+            _record_course_activity(course_id)
+            enqueue_deferred_deletion(course_id, getattr(post, 'id', None))
+    else:
+        _decrement_users(course_id, involved_users)
+
+
+def _increment_thread_author(thread_id, course_id, param):
+    """
+    Increment a stat of the thread's author. If the author is not cached, it is
+    looked up in cs_comments_service by a task instead of in the web request.
+    """
+    thread_user_id = get_cached_thread_author_id(thread_id)
+    if thread_user_id is not None:
+        _increment(int(thread_user_id), course_id, param)
+    elif settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT') and course_id and _is_course_open(course_id):
+        task_update_thread_author_engagement.delay(thread_id, course_id, param)
+
+
 def _increment(*args, **kwargs):
     """
     A facade for handling incrementation.
@@ -164,6 +238,30 @@ def _decrement(*args, **kwargs):
     _handle_change_after_signal(*args, increment=False, **kwargs)
 
 
+def _decrement_users(course_id, involved_users):
+    """
+    Decrement stats of many users (`user_id: {stat: number_of_occurrences}`) with a single Celery task.
+    """
+    users_changes = {
+        user_id: get_stat_changes(user_data, increment=False)
+        for user_id, user_data in involved_users.items() if user_id
+    }
+    if not (settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT') and users_changes and course_id):
+        return
+
+    # Do not calculate engagement after course ends, and do not even enqueue a task for it.
+    if not _is_course_open(course_id):
+        return
+    _record_course_activity(course_id)
+
+    engagement_buffer = get_engagement_buffer()
+    if engagement_buffer:
+        for user_id, changes in users_changes.items():
+            buffer_engagement_changes(engagement_buffer, user_id, course_id, changes)
+    else:
+        task_update_users_engagement.delay(course_id, users_changes)
+
+
 def _handle_change_after_signal(user_id, course_id, param, increment=True, items=1):
     """
     Validate settings and input and run Celery task for saving changed parameters.
@@ -172,4 +270,37 @@ def _handle_change_after_signal(user_id, course_id, param, increment=True, items
                   `dict[str, int]` (`stat: number_of_occurrences`) with the stats that should be changed
     """
     if settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT') and user_id and course_id:
-        task_update_user_engagement.delay(user_id, course_id, param, increment, items)
+        # Do not calculate engagement after course ends, and do not even enqueue a task for it.
+        if not _is_course_open(course_id):
+            return
+        _record_course_activity(course_id)
+
+        engagement_buffer = get_engagement_buffer()
+        if engagement_buffer:
+            buffer_engagement_changes(engagement_buffer, user_id, course_id, get_stat_changes(param, increment, items))
+        else:
+            task_update_user_engagement.delay(user_id, course_id, param, increment, items)
+
+
+def _is_course_open(course_id):
+    """
+    Returns True if the course has not ended. Events with an invalid course id are logged and dropped.
+    """
+    try:
+        return not is_course_closed(course_id)
+    except InvalidKeyError:
+        log.warning("Skipping social engagement update for invalid course id %s", course_id)
+        return False
+
+
+def _record_course_activity(course_id):
+    """
+    Move the activity watermark of the course forward, at most once per interval.
+    """
+    if not is_incremental_recompute_enabled():
+        return
+
+    interval = getattr(settings, 'SOCIAL_ENGAGEMENT_ACTIVITY_RECORD_INTERVAL', 60)
+    if cache.add('social_engagement.activity.{}'.format(course_id), True, interval):
+        CourseSocialEngagementState.record_activity(CourseKey.from_string(str(course_id)))
+
@@ -0,0 +1,277 @@
+"""
+Sorted-set index of social engagement scores per course
+
+The index answers rank and Top N lookups without ORDER BY/COUNT queries over
+the enrollment join. It is enabled with the SOCIAL_ENGAGEMENT_LEADERBOARD_INDEX
+setting, e.g.
+
+    SOCIAL_ENGAGEMENT_LEADERBOARD_INDEX = {
+        'BACKEND': 'social_engagement.leaderboard.RedisLeaderboardIndex',
+        'OPTIONS': {'url': 'redis://localhost:6379/0'},
+    }
+"""
+import bisect
+import threading
+from datetime import datetime, timedelta
+
+from .utils import get_configured_backend
+
+try:
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+# inverted values of index members are padded to 20 digits
+_MEMBER_MAX = 10 ** 20 - 1
+
+# field of the members hash marking a course index built by `replace`
+_BUILT_FIELD = 'built'
+
+
+def get_leaderboard_index():
+    """
+    Returns the configured leaderboard index or None if it is not enabled.
+    """
+    return get_configured_backend('SOCIAL_ENGAGEMENT_LEADERBOARD_INDEX')
+
+
+def _timestamp_us(modified):
+    """
+    Returns the modification time as whole microseconds since the epoch.
+    """
+    return (modified - datetime(1970, 1, 1, tzinfo=modified.tzinfo)) // timedelta(microseconds=1)
+
+
+def index_member(user_id, modified):
+    """
+    Returns the sorted set member of a user, which breaks score ties like the
+    `('modified', 'user_id')` part of the leaderboard ordering.
+
+    Sorted sets rank equal scores by member, in reverse lexicographic order for
+    ZREVRANK/ZREVRANGE, so both parts are stored inverted and zero padded: the
+    earlier modification and then the lower user id sort first.
+    """
+    return '{:020d}:{:020d}'.format(_MEMBER_MAX - _timestamp_us(modified), _MEMBER_MAX - int(user_id))
+
+
+def parse_index_member(member):
+    """
+    Returns the user id of a sorted set member.
+    """
+    if isinstance(member, bytes):
+        member = member.decode('ascii')
+    return _MEMBER_MAX - int(member.split(':')[1])
+
+
+class LeaderboardIndex:
+    """
+    Interface of a sorted set of users per course, ordered like `LEADERBOARD_ORDERING`
+    by score descending, then modification time and user id ascending.
+    """
+
+    def update(self, course_key, user_id, score, modified):
+        """
+        Adds or moves a user in the course index.
+        """
+        raise NotImplementedError
+
+    def remove(self, course_key, user_id):
+        """
+        Removes a user from the course index.
+        """
+        raise NotImplementedError
+
+    def replace(self, course_key, entries):
+        """
+        Replaces the whole course index with `entries` of `(user_id, score, modified)`
+        and marks it as built.
+        """
+        raise NotImplementedError
+
+    def is_built(self, course_key):
+        """
+        Returns True if the course index was built by `replace` and still holds all
+        its entries. Updates alone don't build an index, as they only add the users
+        whose scores changed since it was lost or enabled.
+        """
+        raise NotImplementedError
+
+    def rank(self, course_key, user_id, exclude_users=None):
+        """
+        Returns the zero based rank of a user, not counting excluded users
+        above them, or None if the user is not in the index.
+        """
+        raise NotImplementedError
+
+    def top(self, course_key, count, exclude_users=None):
+        """
+        Returns ids of the Top N users of the course, skipping excluded users.
+        """
+        raise NotImplementedError
+
+
+class InMemoryLeaderboardIndex(LeaderboardIndex):
+    """
+    Process-local index, meant for tests and single process deployments.
+    """
+
+    def __init__(self, **kwargs):  # pylint: disable=unused-argument
+        self._lock = threading.Lock()
+        # course_id: {user_id: sort_key}
+        self._keys = {}
+        # course_id: sorted list of (-score, modified, user_id) sort keys
+        self._sorted = {}
+        self._built = set()
+
+    @staticmethod
+    def _sort_key(user_id, score, modified):
+        return (-score, _timestamp_us(modified), int(user_id))
+
+    def _remove(self, course_id, user_id):
+        key = self._keys.setdefault(course_id, {}).pop(user_id, None)
+        if key is not None:
+            items = self._sorted[course_id]
+            del items[bisect.bisect_left(items, key)]
+
+    def _add(self, course_id, user_id, key):
+        self._keys.setdefault(course_id, {})[user_id] = key
+        bisect.insort(self._sorted.setdefault(course_id, []), key)
+
+    def update(self, course_key, user_id, score, modified):
+        course_id = str(course_key)
+        with self._lock:
+            self._remove(course_id, int(user_id))
+            self._add(course_id, int(user_id), self._sort_key(user_id, score, modified))
+
+    def remove(self, course_key, user_id):
+        with self._lock:
+            self._remove(str(course_key), int(user_id))
+
+    def replace(self, course_key, entries):
+        course_id = str(course_key)
+        keys = {int(user_id): self._sort_key(user_id, score, modified) for user_id, score, modified in entries}
+        with self._lock:
+            self._keys[course_id] = keys
+            self._sorted[course_id] = sorted(keys.values())
+            self._built.add(course_id)
+
+    def is_built(self, course_key):
+        return str(course_key) in self._built
+
+    def rank(self, course_key, user_id, exclude_users=None):
+        course_id = str(course_key)
+        with self._lock:
+            keys = self._keys.get(course_id, {})
+            key = keys.get(int(user_id))
+            if key is None:
+                return None
+            rank = bisect.bisect_left(self._sorted[course_id], key)
+            excluded_above = sum(
+                1 for excluded_id in exclude_users or []
+                if int(excluded_id) in keys and keys[int(excluded_id)] < key
+            )
+        return rank - excluded_above
+
+    def top(self, course_key, count, exclude_users=None):
+        exclude_users = {int(user_id) for user_id in exclude_users or []}
+        with self._lock:
+            items = self._sorted.get(str(course_key), [])[:count + len(exclude_users)]
+        return [user_id for __, __, user_id in items if user_id not in exclude_users][:count]
+
+
+class RedisLeaderboardIndex(LeaderboardIndex):
+    """
+    Index stored in Redis sorted sets, one per course, scored by the engagement
+    score with `index_member` members. The current member of every user is kept
+    in a hash next to the set, so it can be replaced when the user is moved.
+
+    The hash also holds the built marker of the course. The index is only built
+    while the marker is there and the set has a member for every user of the hash,
+    so losing either key, e.g. to an eviction or a restart, unbuilds it.
+    """
+
+    UPDATE_SCRIPT = """
+        local member = redis.call('HGET', KEYS[2], ARGV[1])
+        if member then
+            redis.call('ZREM', KEYS[1], member)
+        end
+        redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+        redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+    """
+
+    REMOVE_SCRIPT = """
+        local member = redis.call('HGET', KEYS[2], ARGV[1])
+        if member then
+            redis.call('ZREM', KEYS[1], member)
+            redis.call('HDEL', KEYS[2], ARGV[1])
+        end
+    """
+
+    RANKS_SCRIPT = """
+        local ranks = {}
+        for i, user_id in ipairs(ARGV) do
+            local member = redis.call('HGET', KEYS[2], user_id)
+            ranks[i] = member and redis.call('ZREVRANK', KEYS[1], member) or -1
+        end
+        return ranks
+    """
+
+    BUILT_SCRIPT = """
+        if redis.call('HEXISTS', KEYS[2], ARGV[1]) == 0 then
+            return 0
+        end
+        if redis.call('ZCARD', KEYS[1]) + 1 == redis.call('HLEN', KEYS[2]) then
+            return 1
+        end
+        return 0
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', key_prefix='social_engagement:leaderboard', **kwargs):
+        if redis is None:
+            raise ImportError('RedisLeaderboardIndex requires the `redis` package.')
+        self.client = redis.Redis.from_url(url, **kwargs)
+        self.key_prefix = key_prefix
+        self._update_script = self.client.register_script(self.UPDATE_SCRIPT)
+        self._remove_script = self.client.register_script(self.REMOVE_SCRIPT)
+        self._ranks_script = self.client.register_script(self.RANKS_SCRIPT)
+        self._built_script = self.client.register_script(self.BUILT_SCRIPT)
+
+    def _keys(self, course_key):
+        key = '{}:{}'.format(self.key_prefix, course_key)
+        return [key, '{}:members'.format(key)]
+
+    def update(self, course_key, user_id, score, modified):
+        self._update_script(
+            keys=self._keys(course_key),
+            args=[int(user_id), score, index_member(user_id, modified)],
+        )
+
+    def remove(self, course_key, user_id):
+        self._remove_script(keys=self._keys(course_key), args=[int(user_id)])
+
+    def replace(self, course_key, entries):
+        key, members_key = self._keys(course_key)
+        members = {int(user_id): index_member(user_id, modified) for user_id, __, modified in entries}
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.delete(key, members_key)
+        if members:
+            pipeline.zadd(key, {members[int(user_id)]: score for user_id, score, __ in entries})
+        pipeline.hset(members_key, mapping=dict(members, **{_BUILT_FIELD: 1}))
+        pipeline.execute()
+
+    def is_built(self, course_key):
+        return bool(self._built_script(keys=self._keys(course_key), args=[_BUILT_FIELD]))
+
+    def rank(self, course_key, user_id, exclude_users=None):
+        exclude_users = [int(excluded_id) for excluded_id in exclude_users or []]
+        rank, *excluded_ranks = self._ranks_script(keys=self._keys(course_key), args=[int(user_id)] + exclude_users)
+
+        if rank < 0:
+            return None
+        return rank - sum(1 for excluded_rank in excluded_ranks if 0 <= excluded_rank < rank)
+
+    def top(self, course_key, count, exclude_users=None):
+        exclude_users = {int(user_id) for user_id in exclude_users or []}
+        members = self.client.zrevrange(self._keys(course_key)[0], 0, count + len(exclude_users) - 1)
+        user_ids = [parse_index_member(member) for member in members]
+        return [user_id for user_id in user_ids if user_id not in exclude_users][:count]
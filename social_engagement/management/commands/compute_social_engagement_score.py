@@ -2,21 +2,58 @@
 Command to compute social engagement score of users in a single course or all open courses
 ./manage.py lms compute_social_engagement_score -c {course_id} --settings=aws
 ./manage.py lms compute_social_engagement_score -a true --settings=aws
+
+Courses already queued or being computed are not queued again, see SOCIAL_ENGAGEMENT_RECOMPUTE_DEBOUNCE.
+
+Selected courses are queued with the ones having recent forum activity first, then by enrollment size.
+Courses with activity in the last SOCIAL_ENGAGEMENT_ACTIVE_COURSE_WINDOW seconds are active, and
+their tasks can get their own priority or queue, e.g.
+
+    SOCIAL_ENGAGEMENT_RECOMPUTE_TASK_OPTIONS = {
+        'active': {'priority': 9},
+        'inactive': {'priority': 0, 'routing_key': 'edx.lms.core.low'},
+    }
+
+With ENABLE_SOCIAL_ENGAGEMENT_INCREMENTAL_RECOMPUTE feature enabled, courses without forum
+activity since their last computation are skipped, unless --full is given.
+
+With ENABLE_SOCIAL_ENGAGEMENT_CHECKPOINTED_RECOMPUTE feature enabled, courses whose last
+computation failed can be queued again:
+./manage.py lms compute_social_engagement_score --failed --settings=aws
+
+Scores can be computed in local processes instead of Celery tasks, e.g. for backfills:
+./manage.py lms compute_social_engagement_score -a true --workers 8 --settings=aws
+Local workers take the same course lock as the tasks, courses being computed elsewhere are skipped.
 """
-import datetime
 import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
 
+from django.conf import settings
 from django.core.management import BaseCommand
-from django.db.models import Q
+from django.db import connections
+from django.db.models import Count, Q
+from django.utils import timezone
 from pytz import UTC
 
 from dateutil.relativedelta import relativedelta
 from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
-from social_engagement.tasks import task_compute_social_scores_in_course
+from social_engagement.engagement import is_checkpointed_recompute_enabled, update_course_engagement
+from social_engagement.models import CourseSocialEngagementState, is_incremental_recompute_enabled
+from social_engagement.tasks import RECOMPUTE_LOCK, enqueue_course_recompute
+from social_engagement.utils import acquire_course_task_lock, release_course_task_lock
+from student.models import CourseEnrollment
 from util.prompt import query_yes_no
 
 log = logging.getLogger(__name__)
 
+PROGRESS_BAR_WIDTH = 30
+COURSE_ID_CHUNK_SIZE = 1000
+
+ACTIVE_COURSE = 'active'
+INACTIVE_COURSE = 'inactive'
+
 
 class Command(BaseCommand):
     """
@@ -60,6 +97,30 @@ class Command(BaseCommand):
                  "for inactive courses from the last 24 months.",
             metavar="0"
         ),
+        parser.add_argument(
+            "--failed",
+            dest="requeue_failed",
+            action="store_true",
+            default=False,
+            help="Compute scores of the courses whose last checkpointed computation failed"
+        ),
+        parser.add_argument(
+            "--full",
+            dest="full",
+            action="store_true",
+            default=False,
+            help="Compute scores of all selected courses, including the ones "
+                 "without forum activity since their last computation"
+        ),
+        parser.add_argument(
+            "-w",
+            "--workers",
+            dest="workers",
+            type=int,
+            default=0,
+            help="Compute scores in this many local processes instead of queuing Celery tasks",
+            metavar="0"
+        ),
         parser.add_argument(
             "--noinput",
             "--no-input",
@@ -75,9 +136,15 @@ class Command(BaseCommand):
         compute_for_inactive_courses = options.get('compute_for_inactive_courses')
         months_back_limit = options.get('months_back_limit')
         interactive = options.get('interactive')
+        full = options.get('full')
+        requeue_failed = options.get('requeue_failed')
+        workers = options.get('workers')
 
+        course_tiers = {}
         if course_id:
-            task_compute_social_scores_in_course.delay(course_id)
+            course_ids = [course_id]
+        elif requeue_failed:
+            course_ids = [str(failed_id) for failed_id in CourseSocialEngagementState.get_failed_course_ids()]
         elif compute_for_all_open_courses or compute_for_inactive_courses:
             # prompt for user confirmation in interactive mode
             execute = query_yes_no(
@@ -85,29 +152,162 @@ class Command(BaseCommand):
                 , default="no"
             ) if interactive else True
 
-            if execute:
-                courses = CourseOverview.objects.none()
-                today = datetime.datetime.today().replace(tzinfo=UTC)
-
-                # Add active courses to queryset if compute_for_all_open_courses is True
-                if compute_for_all_open_courses:
-                    courses |= CourseOverview.objects.filter(
-                        Q(end__gte=today) |
-                        Q(end__isnull=True)
-                    )
-                # Add inactive courses to queryset if compute_for_inactive_courses is True
-                if compute_for_inactive_courses:
-                    filter_set = Q(end__lt=today)
-                    # If user set months back limit, add filter to queryset
-                    if months_back_limit:
-                        backwards_query_limit_date = (
-                            datetime.datetime.today() - relativedelta(months=months_back_limit)
-                        ).replace(tzinfo=UTC)
-                        filter_set &= Q(end__gte=backwards_query_limit_date)
-                    # Filter courses and add them to courses list
-                    courses |= CourseOverview.objects.filter(filter_set)
-
-                for course in courses:
-                    course_id = str(course.id)
-                    task_compute_social_scores_in_course.delay(course_id)
+            if not execute:
+                return
+
+            course_ids, course_tiers = self._get_selected_course_ids(
+                compute_for_all_open_courses, compute_for_inactive_courses, months_back_limit, full
+            )
+        else:
+            return
+
+        if workers:
+            self._compute_locally(course_ids, workers)
+        else:
+            task_options = getattr(settings, 'SOCIAL_ENGAGEMENT_RECOMPUTE_TASK_OPTIONS', {})
+            for course_id in course_ids:
+                tier = course_tiers.get(course_id)
+                if enqueue_course_recompute(course_id, **task_options.get(tier, {})):
                     log.info("Task queued to compute social engagment score for course %s", course_id)
+
+    def _get_selected_course_ids(self, compute_for_all_open_courses, compute_for_inactive_courses,
+                                 months_back_limit, full):
+        """
+        Returns ids of the open and/or inactive courses selected by the command options,
+        ordered by recent forum activity and enrollment size, and the activity tier of each course.
+        """
+        courses = CourseOverview.objects.none()
+        today = datetime.today().replace(tzinfo=UTC)
+
+        # Add active courses to queryset if compute_for_all_open_courses is True
+        if compute_for_all_open_courses:
+            courses |= CourseOverview.objects.filter(
+                Q(end__gte=today) |
+                Q(end__isnull=True)
+            )
+        # Add inactive courses to queryset if compute_for_inactive_courses is True
+        if compute_for_inactive_courses:
+            filter_set = Q(end__lt=today)
+            # If user set months back limit, add filter to queryset
+            if months_back_limit:
+                backwards_query_limit_date = (
+                    datetime.today() - relativedelta(months=months_back_limit)
+                ).replace(tzinfo=UTC)
+                filter_set &= Q(end__gte=backwards_query_limit_date)
+            # Filter courses and add them to courses list
+            courses |= CourseOverview.objects.filter(filter_set)
+
+        skip_dormant = is_incremental_recompute_enabled() and not full
+        now = timezone.now()
+        active_since = now - timedelta(
+            seconds=getattr(settings, 'SOCIAL_ENGAGEMENT_ACTIVE_COURSE_WINDOW', 7 * 24 * 60 * 60)
+        )
+
+        selected = []
+        course_keys = list(courses.values_list('id', flat=True))
+        for chunk_start in range(0, len(course_keys), COURSE_ID_CHUNK_SIZE):
+            chunk = course_keys[chunk_start:chunk_start + COURSE_ID_CHUNK_SIZE]
+            states = {
+                state.course_id: state
+                for state in CourseSocialEngagementState.objects.filter(course_id__in=chunk)
+            }
+            enrollment_counts = dict(
+                CourseEnrollment.objects.filter(course_id__in=chunk, is_active=True)
+                .values('course_id')
+                .annotate(count=Count('id'))
+                .values_list('course_id', 'count')
+            )
+
+            for course_key in chunk:
+                state = states.get(course_key)
+                if skip_dormant and state and state.is_dormant(now):
+                    log.info("Skipping course %s without forum activity since the last computation", course_key)
+                    continue
+                last_activity = state.last_activity if state else None
+                active = last_activity is not None and last_activity >= active_since
+                selected.append((
+                    not active,
+                    -enrollment_counts.get(course_key, 0),
+                    -last_activity.timestamp() if last_activity else 0,
+                    str(course_key),
+                ))
+
+        selected.sort()
+        course_ids = [course_id for __, __, __, course_id in selected]
+        course_tiers = {
+            course_id: INACTIVE_COURSE if inactive else ACTIVE_COURSE
+            for inactive, __, __, course_id in selected
+        }
+        return course_ids, course_tiers
+
+    def _compute_locally(self, course_ids, workers):
+        """
+        Computes scores of courses in a pool of `workers` local processes instead of Celery tasks.
+        A single worker computes them in this process.
+        """
+        started = time.time()
+        failures = []
+        skipped = []
+
+        if workers == 1:
+            results = map(compute_course, course_ids)
+            self._report_progress(results, len(course_ids), failures, skipped)
+        else:
+            # forked workers open their own connections instead of sharing the parent's
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=connections.close_all) as executor:
+                results = as_completed([executor.submit(compute_course, course_id) for course_id in course_ids])
+                self._report_progress((future.result() for future in results), len(course_ids), failures, skipped)
+
+        self.stdout.write("Computed social engagement scores of {} courses in {:.1f}s, {} failed, {} skipped".format(
+            len(course_ids) - len(skipped), time.time() - started, len(failures), len(skipped)
+        ))
+        for course_id, error in failures:
+            self.stderr.write("{}: {}".format(course_id, error))
+
+    def _report_progress(self, results, total, failures, skipped):
+        """
+        Writes a progress bar line for every computed course and collects failures and skipped courses.
+        """
+        for done, (course_id, duration, score_update_count, error) in enumerate(results, start=1):
+            filled = PROGRESS_BAR_WIDTH * done // total
+            progress = "[{}{}] {}/{}".format('#' * filled, '.' * (PROGRESS_BAR_WIDTH - filled), done, total)
+            if score_update_count is None:
+                skipped.append(course_id)
+                self.stdout.write("{} {} skipped, already being computed".format(progress, course_id))
+            elif error:
+                failures.append((course_id, error))
+                self.stdout.write("{} {} failed after {:.2f}s".format(progress, course_id, duration))
+            else:
+                self.stdout.write("{} {} {:.2f}s, {} scores updated".format(
+                    progress, course_id, duration, score_update_count
+                ))
+
+
+def compute_course(course_id):
+    """
+    Computes scores of a course in the current process, holding the course lock of the recompute tasks.
+    Returns the course id, the duration, the number of written scores and the error message if it failed.
+    The number of written scores is None if the course is already being computed.
+    """
+    started = time.time()
+    timeout = getattr(settings, 'SOCIAL_ENGAGEMENT_RECOMPUTE_LOCK_TIMEOUT', 2 * 60 * 60)
+    lock_token = acquire_course_task_lock(RECOMPUTE_LOCK, course_id, timeout)
+    if not lock_token:
+        log.info("Skipping course %s, social scores are already being computed", course_id)
+        return course_id, time.time() - started, None, None
+    try:
+        score_update_count = update_course_engagement(
+            course_id,
+            compute_if_closed_course=True,
+            bulk=settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT_BULK_RECOMPUTE', False),
+            checkpointed=is_checkpointed_recompute_enabled(),
+        )
+    except Exception as error:  # pylint: disable=broad-except
+        log.exception(error)
+        return course_id, time.time() - started, 0, '{}: {}'.format(type(error).__name__, error)
+    finally:
+        release_course_task_lock(
+            RECOMPUTE_LOCK, course_id, lock_token, getattr(settings, 'SOCIAL_ENGAGEMENT_RECOMPUTE_DEBOUNCE', 0)
+        )
+    return course_id, time.time() - started, score_update_count or 0, None
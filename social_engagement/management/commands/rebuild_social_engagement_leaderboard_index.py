@@ -0,0 +1,47 @@
+"""
+Command to rebuild the social engagement leaderboard index from the database for a single course or all courses
+./manage.py lms rebuild_social_engagement_leaderboard_index -c {course_id} --settings=aws
+./manage.py lms rebuild_social_engagement_leaderboard_index --settings=aws
+"""
+import logging
+
+from django.core.management import BaseCommand, CommandError
+
+from opaque_keys.edx.keys import CourseKey
+from social_engagement.leaderboard import get_leaderboard_index
+from social_engagement.models import StudentSocialEngagementScore
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the social engagement leaderboard index of a single course or all courses
+    """
+    help = "Command to rebuild the social engagement leaderboard index of a single course or all courses"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-c",
+            "--course_id",
+            dest="course_id",
+            help="course id to rebuild the leaderboard index, all courses are rebuilt if omitted",
+            metavar="any/course/id"
+        ),
+
+    def handle(self, *args, **options):
+        if not get_leaderboard_index():
+            raise CommandError("SOCIAL_ENGAGEMENT_LEADERBOARD_INDEX setting is not configured.")
+
+        course_id = options.get('course_id')
+
+        if course_id:
+            course_keys = [CourseKey.from_string(course_id)]
+        else:
+            course_keys = StudentSocialEngagementScore.objects.values_list('course_id', flat=True).distinct()
+
+        for course_key in course_keys:
+            indexed_count = StudentSocialEngagementScore.rebuild_leaderboard_index(course_key)
+            log.info(
+                "Rebuilt social engagement leaderboard index for course %s with %d users", course_key, indexed_count
+            )
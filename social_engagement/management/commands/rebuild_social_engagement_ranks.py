@@ -0,0 +1,45 @@
+"""
+Command to rebuild stored social engagement ranks of users in a single course or all courses
+./manage.py lms rebuild_social_engagement_ranks -c {course_id} --settings=aws
+./manage.py lms rebuild_social_engagement_ranks --settings=aws
+
+Ranks of a course are built by the first score write after ENABLE_SOCIAL_ENGAGEMENT_MATERIALIZED_RANK
+feature is enabled, and follow enrollment and user (de)activations. Writes made while the feature is
+disabled are not ranked, so rebuild the ranks when the feature is enabled again.
+"""
+import logging
+
+from django.core.management import BaseCommand
+
+from opaque_keys.edx.keys import CourseKey
+from social_engagement.models import StudentSocialEngagementScore
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds stored social engagement ranks of users in a single course or all courses
+    """
+    help = "Command to rebuild stored social engagement ranks of users in a single course or all courses"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-c",
+            "--course_id",
+            dest="course_id",
+            help="course id to rebuild social engagement ranks, all courses are rebuilt if omitted",
+            metavar="any/course/id"
+        ),
+
+    def handle(self, *args, **options):
+        course_id = options.get('course_id')
+
+        if course_id:
+            course_keys = [CourseKey.from_string(course_id)]
+        else:
+            course_keys = StudentSocialEngagementScore.objects.values_list('course_id', flat=True).distinct()
+
+        for course_key in course_keys:
+            changed_count = StudentSocialEngagementScore.rebuild_course_ranks(course_key)
+            log.info("Rebuilt social engagement ranks for course %s, %d ranks changed", course_key, changed_count)
@@ -0,0 +1,57 @@
+"""
+Command to detect and repair drift of the social engagement course aggregates in a single course or all courses
+./manage.py lms reconcile_social_engagement_aggregates -c {course_id} --settings=aws
+./manage.py lms reconcile_social_engagement_aggregates --dry-run --settings=aws
+"""
+import logging
+
+from django.core.management import BaseCommand
+
+from opaque_keys.edx.keys import CourseKey
+from social_engagement.models import CourseSocialEngagementAggregate, StudentSocialEngagementScore
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Compares social engagement course aggregates with a full SUM of the scores and repairs any drift
+    """
+    help = "Command to detect and repair drift of the social engagement course aggregates"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-c",
+            "--course_id",
+            dest="course_id",
+            help="course id to reconcile, all courses with scores are reconciled if omitted",
+            metavar="any/course/id"
+        ),
+        parser.add_argument(
+            "--dry-run",
+            dest="dry_run",
+            action="store_true",
+            default=False,
+            help="Only report drift, do not repair it"
+        ),
+
+    def handle(self, *args, **options):
+        course_id = options.get('course_id')
+        dry_run = options.get('dry_run')
+
+        if course_id:
+            course_keys = [CourseKey.from_string(course_id)]
+        else:
+            course_keys = StudentSocialEngagementScore.objects.values_list('course_id', flat=True).distinct()
+
+        drifted_count = 0
+        for course_key in course_keys:
+            drift = CourseSocialEngagementAggregate.reconcile(course_key, repair=not dry_run)
+            if drift:
+                drifted_count += 1
+                log.warning(
+                    "Social engagement aggregate of course %s drifted by %s%s",
+                    course_key, drift, '' if dry_run else ', repaired'
+                )
+
+        log.info("Reconciled social engagement aggregates, %d courses drifted", drifted_count)
@@ -0,0 +1,64 @@
+"""
+Command to recompute stored social engagement scores from the stored stats after SOCIAL_METRIC_POINTS changed,
+in a single course or all courses with scores computed with other points
+./manage.py lms rescore_social_engagement_scores -c {course_id} --settings=aws
+./manage.py lms rescore_social_engagement_scores --dry-run --settings=aws
+"""
+import logging
+
+from django.core.management import BaseCommand
+
+from opaque_keys.edx.keys import CourseKey
+from social_engagement.models import StudentSocialEngagementScore
+from social_engagement.scoring import get_weights_hash
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Recomputes stored social engagement scores with the current social metric points without forum calls
+    """
+    help = "Command to recompute stored social engagement scores with the current social metric points"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-c",
+            "--course_id",
+            dest="course_id",
+            help="course id to re-score, all courses with stale scores are re-scored if omitted",
+            metavar="any/course/id"
+        ),
+        parser.add_argument(
+            "--dry-run",
+            dest="dry_run",
+            action="store_true",
+            default=False,
+            help="Only report courses with stale scores, do not re-score them"
+        ),
+
+    def handle(self, *args, **options):
+        course_id = options.get('course_id')
+        dry_run = options.get('dry_run')
+        weights_hash = get_weights_hash()
+
+        if course_id:
+            course_keys = [CourseKey.from_string(course_id)]
+        else:
+            course_keys = StudentSocialEngagementScore.get_stale_course_ids(weights_hash)
+
+        rescored_count = 0
+        for course_key in course_keys:
+            if dry_run:
+                stale_count = StudentSocialEngagementScore.objects.filter(
+                    course_id__exact=course_key
+                ).exclude(weights_hash=weights_hash).count()
+                log.info("Course %s has %d stale social engagement scores", course_key, stale_count)
+                continue
+
+            course_rescored_count = StudentSocialEngagementScore.rescore_course(course_key)
+            rescored_count += course_rescored_count
+            log.info("Re-scored %d social engagement scores in course %s", course_rescored_count, course_key)
+
+        if not dry_run:
+            log.info("Re-scored %d social engagement scores in %d courses", rescored_count, len(course_keys))
@@ -1,14 +1,20 @@
 """
 Unit tests for compute_social_engagement_score command
 """
-from datetime import datetime
+from datetime import datetime, timedelta
+from io import StringIO
 
 from django.conf import settings
 from django.core.management import call_command
+from django.test.utils import override_settings
+from django.utils import timezone
 
-from mock import patch
+from mock import call, patch
 from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
-from social_engagement.models import StudentSocialEngagementScore
+from social_engagement.models import CourseSocialEngagementState, StudentSocialEngagementScore
+from social_engagement.tasks import (RECOMPUTE_LOCK, enqueue_course_recompute, task_compute_social_scores_in_course,
+                                     task_release_course_recompute_lock)
+from social_engagement.utils import release_course_task_lock, reset_local_state
 from student.models import CourseEnrollment
 from student.tests.factories import CourseEnrollmentFactory, UserFactory
 from xmodule.modulestore.tests.django_utils import SharedModuleStoreTestCase
@@ -40,6 +46,10 @@ class TestComputeSocialScoreCommand(SharedModuleStoreTestCase):
             cls.users.append(user)
             CourseEnrollmentFactory(user=user, course_id=cls.course.id)
 
+    def setUp(self):
+        super().setUp()
+        reset_local_state()
+
     def test_compute_social_engagement_score(self):
         """
         Test to ensure all users enrolled in course have their social scores computed
@@ -90,3 +100,175 @@ class TestComputeSocialScoreCommand(SharedModuleStoreTestCase):
         users_count = StudentSocialEngagementScore.objects.all().count()
         open_course_users_count = course1_users + course2_users
         self.assertEqual(users_count, open_course_users_count)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_SOCIAL_ENGAGEMENT_INCREMENTAL_RECOMPUTE': True})
+    def test_dormant_courses_skipped(self):
+        """
+        Test that courses without forum activity since their last computation are skipped
+        """
+        __ = CourseOverview.get_from_id(self.course.id)
+        enqueue_path = 'social_engagement.management.commands.compute_social_engagement_score.' \
+                       'enqueue_course_recompute'
+
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = iter(())
+            call_command('compute_social_engagement_score', course_id=str(self.course.id))
+        self.assertIsNotNone(CourseSocialEngagementState.objects.get(course_id=self.course.id).last_recompute)
+
+        with patch(enqueue_path) as mock_enqueue:
+            call_command('compute_social_engagement_score', compute_for_all_open_courses=True, interactive=False)
+            self.assertNotIn(call(str(self.course.id)), mock_enqueue.call_args_list)
+
+            call_command(
+                'compute_social_engagement_score', compute_for_all_open_courses=True, interactive=False, full=True
+            )
+            self.assertIn(call(str(self.course.id)), mock_enqueue.call_args_list)
+
+        CourseSocialEngagementState.record_activity(self.course.id, timezone.now() + timedelta(minutes=5))
+        with patch(enqueue_path) as mock_enqueue:
+            call_command('compute_social_engagement_score', compute_for_all_open_courses=True, interactive=False)
+            self.assertIn(call(str(self.course.id)), mock_enqueue.call_args_list)
+
+    @override_settings(SOCIAL_ENGAGEMENT_RECOMPUTE_TASK_OPTIONS={
+        'active': {'priority': 9},
+        'inactive': {'priority': 0},
+    })
+    def test_courses_queued_by_activity_and_enrollment(self):
+        """
+        Test that active courses are queued first with their own priority, then courses by enrollment size
+        """
+        small_course = CourseFactory.create()
+        active_course = CourseFactory.create()
+        for course in (small_course, active_course, self.course):
+            __ = CourseOverview.get_from_id(course.id)
+        CourseEnrollmentFactory(user=UserFactory.create(), course_id=small_course.id)
+        CourseSocialEngagementState.record_activity(active_course.id)
+
+        enqueue_path = 'social_engagement.management.commands.compute_social_engagement_score.' \
+                       'enqueue_course_recompute'
+        with patch(enqueue_path) as mock_enqueue:
+            call_command('compute_social_engagement_score', compute_for_all_open_courses=True, interactive=False)
+
+        queued = [args for args in mock_enqueue.call_args_list if args[0][0] in (
+            str(small_course.id), str(active_course.id), str(self.course.id)
+        )]
+        self.assertEqual(queued, [
+            call(str(active_course.id), priority=9),
+            call(str(self.course.id), priority=0),
+            call(str(small_course.id), priority=0),
+        ])
+
+    def test_compute_social_engagement_score_locally(self):
+        """
+        Test that scores are computed in the command process with progress and failures reported
+        """
+        user_ids = [user.id for user in self.users]
+        out = StringIO()
+        err = StringIO()
+
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = ((user_id, self.DEFAULT_STATS) for user_id in user_ids)
+            call_command('compute_social_engagement_score', course_id=str(self.course.id), workers=1,
+                         stdout=out, stderr=err)
+
+        users_count = StudentSocialEngagementScore.objects.filter(course_id=self.course.id).count()
+        self.assertEqual(users_count, len(self.users))
+        self.assertIn('1/1 {}'.format(self.course.id), out.getvalue())
+        self.assertIn('0 failed', out.getvalue())
+
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.side_effect = ValueError('Unexpected stats')
+            call_command('compute_social_engagement_score', course_id=str(self.course.id), workers=1,
+                         stdout=out, stderr=err)
+
+        self.assertIn('1 failed', out.getvalue())
+        self.assertIn('{}: ValueError: Unexpected stats'.format(self.course.id), err.getvalue())
+
+    def test_compute_locally_skips_locked_course(self):
+        """
+        Test that local workers take the course lock and skip courses being computed by a task
+        """
+        course_id = str(self.course.id)
+        self.addCleanup(release_course_task_lock, RECOMPUTE_LOCK, course_id)
+        out = StringIO()
+
+        with patch('social_engagement.tasks.task_compute_social_scores_in_course'):
+            self.assertTrue(enqueue_course_recompute(course_id))
+
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            call_command('compute_social_engagement_score', course_id=course_id, workers=1, stdout=out)
+            self.assertFalse(mock_func.called)
+        self.assertIn('{} skipped'.format(course_id), out.getvalue())
+        self.assertIn('1 skipped', out.getvalue())
+
+        release_course_task_lock(RECOMPUTE_LOCK, course_id)
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = iter(())
+            call_command('compute_social_engagement_score', course_id=course_id, workers=1, stdout=out)
+            self.assertTrue(mock_func.called)
+
+        # the lock is released once the course is computed
+        with patch('social_engagement.tasks.task_compute_social_scores_in_course'):
+            self.assertTrue(enqueue_course_recompute(course_id))
+
+    def test_duplicate_recomputes_not_queued(self):
+        """
+        Test that a course is not queued again while its scores are being computed or within the debounce window
+        """
+        course_id = str(self.course.id)
+        self.addCleanup(release_course_task_lock, RECOMPUTE_LOCK, course_id)
+        task_path = 'social_engagement.tasks.task_compute_social_scores_in_course'
+
+        with patch(task_path) as mock_task:
+            self.assertTrue(enqueue_course_recompute(course_id))
+            call_command('compute_social_engagement_score', course_id=course_id)
+            self.assertEqual(mock_task.apply_async.call_count, 1)
+            task_kwargs = mock_task.apply_async.call_args[0][1]
+
+        # the lock is released when the queued task finishes
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = iter(())
+            task_compute_social_scores_in_course(course_id, **task_kwargs)
+
+        with patch(task_path) as mock_task:
+            self.assertTrue(enqueue_course_recompute(course_id))
+            task_kwargs = mock_task.apply_async.call_args[0][1]
+
+        with override_settings(SOCIAL_ENGAGEMENT_RECOMPUTE_DEBOUNCE=60):
+            with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+                mock_func.return_value = iter(())
+                task_compute_social_scores_in_course(course_id, **task_kwargs)
+
+            with patch(task_path) as mock_task:
+                self.assertFalse(enqueue_course_recompute(course_id))
+                self.assertFalse(mock_task.apply_async.called)
+
+    def test_recompute_lock_released_by_its_holder(self):
+        """
+        Test that the course lock is only released by the task it was taken for, and when enqueuing fails
+        """
+        course_id = str(self.course.id)
+        self.addCleanup(release_course_task_lock, RECOMPUTE_LOCK, course_id)
+        task_path = 'social_engagement.tasks.task_compute_social_scores_in_course'
+
+        with patch(task_path) as mock_task:
+            mock_task.apply_async.side_effect = ConnectionError('Broker unavailable')
+            with self.assertRaises(ConnectionError):
+                enqueue_course_recompute(course_id)
+
+        with patch(task_path) as mock_task:
+            self.assertTrue(enqueue_course_recompute(course_id))
+            task_kwargs = mock_task.apply_async.call_args[0][1]
+
+        # tasks run without the token of the lock, or with an expired one, leave it alone
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = iter(())
+            task_compute_social_scores_in_course(course_id)
+            task_release_course_recompute_lock(course_id, 'expired-token')
+        with patch(task_path) as mock_task:
+            self.assertFalse(enqueue_course_recompute(course_id))
+
+        # a failed sharded recompute releases the lock from the chord error callback
+        task_release_course_recompute_lock(course_id, task_kwargs['lock_token'])
+        with patch(task_path) as mock_task:
+            self.assertTrue(enqueue_course_recompute(course_id))
@@ -0,0 +1,123 @@
+"""
+Unit tests for rebuild_social_engagement_ranks command
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+from mock import patch
+from social_engagement.models import StudentSocialEngagementScore
+from student.tests.factories import CourseEnrollmentFactory, UserFactory
+from xmodule.modulestore.tests.django_utils import SharedModuleStoreTestCase
+from xmodule.modulestore.tests.factories import CourseFactory
+
+
+@patch.dict(settings.FEATURES, {'ENABLE_SOCIAL_ENGAGEMENT': True, 'ENABLE_NOTIFICATIONS': False})
+class TestRebuildSocialEngagementRanksCommand(SharedModuleStoreTestCase):
+    """
+    Tests the `rebuild_social_engagement_ranks` command.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.course = CourseFactory.create()
+        cls.users = []
+        for __ in range(4):
+            user = UserFactory.create()
+            cls.users.append(user)
+            CourseEnrollmentFactory(user=user, course_id=cls.course.id)
+
+    def _get_ranks(self):
+        return dict(
+            StudentSocialEngagementScore.objects.filter(course_id=self.course.id).values_list('user_id', 'rank')
+        )
+
+    def test_rebuild_ranks(self):
+        """
+        Test to ensure ranks are rebuilt from scores
+        """
+        for score, user in zip((10, 40, 20, 30), self.users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+        self.assertEqual(set(self._get_ranks().values()), {None})
+
+        call_command('rebuild_social_engagement_ranks', course_id=str(self.course.id))
+
+        expected = {user.id: rank for rank, user in zip((4, 1, 3, 2), self.users)}
+        self.assertEqual(self._get_ranks(), expected)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_SOCIAL_ENGAGEMENT_MATERIALIZED_RANK': True})
+    def test_ranks_maintained_on_save(self):
+        """
+        Test to ensure stored ranks match a rebuild after incremental updates
+        """
+        for score, user in zip((10, 40, 20, 30), self.users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.users[0].id, 50)
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.users[1].id, 5)
+
+        ranks = self._get_ranks()
+        self.assertEqual(ranks[self.users[0].id], 1)
+        self.assertEqual(ranks[self.users[1].id], 4)
+
+        call_command('rebuild_social_engagement_ranks')
+        self.assertEqual(self._get_ranks(), ranks)
+
+        position = StudentSocialEngagementScore.get_user_leaderboard_position(
+            self.course.id,
+            user_id=self.users[2].id,
+            exclude_users=[self.users[0].id],
+        )
+        self.assertEqual(position['position'], 2)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_SOCIAL_ENGAGEMENT_MATERIALIZED_RANK': True})
+    def test_unenrolled_users_not_ranked(self):
+        """
+        Test to ensure only active enrolled users are ranked
+        """
+        unenrolled_user = UserFactory.create()
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, unenrolled_user.id, 100)
+        for score, user in zip((10, 40, 20, 30), self.users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+
+        ranks = self._get_ranks()
+        self.assertIsNone(ranks[unenrolled_user.id])
+        self.assertEqual(ranks[self.users[1].id], 1)
+
+        call_command('rebuild_social_engagement_ranks', course_id=str(self.course.id))
+        self.assertEqual(self._get_ranks(), ranks)
+
+    def test_ranks_built_on_first_save(self):
+        """
+        Test to ensure ranks of a course are built by the first save once the feature is enabled
+        """
+        for score, user in zip((10, 40, 20, 30), self.users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+        self.assertEqual(set(self._get_ranks().values()), {None})
+
+        with patch.dict(settings.FEATURES, {'ENABLE_SOCIAL_ENGAGEMENT_MATERIALIZED_RANK': True}):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.users[0].id, 25)
+
+        expected = {user.id: rank for rank, user in zip((3, 1, 4, 2), self.users)}
+        self.assertEqual(self._get_ranks(), expected)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_SOCIAL_ENGAGEMENT_MATERIALIZED_RANK': True})
+    def test_deactivated_users_not_ranked(self):
+        """
+        Test to ensure users leave the ranks when they are deactivated and come back when activated
+        """
+        for score, user in zip((10, 40, 20, 30), self.users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+
+        user = User.objects.get(pk=self.users[1].id)
+        user.is_active = False
+        user.save()
+        ranks = self._get_ranks()
+        self.assertIsNone(ranks[user.id])
+        self.assertEqual(ranks[self.users[3].id], 1)
+
+        user.is_active = True
+        user.save()
+        expected = {ranked_user.id: rank for rank, ranked_user in zip((4, 1, 3, 2), self.users)}
+        self.assertEqual(self._get_ranks(), expected)
@@ -0,0 +1,137 @@
+"""
+Unit tests for reconcile_social_engagement_aggregates command
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+from mock import patch
+from social_engagement.models import CourseSocialEngagementAggregate, StudentSocialEngagementScore
+from student.models import CourseEnrollment, EnrollStatusChange
+from student.signals import ENROLL_STATUS_CHANGE
+from student.tests.factories import CourseEnrollmentFactory, UserFactory
+from xmodule.modulestore.tests.django_utils import SharedModuleStoreTestCase
+from xmodule.modulestore.tests.factories import CourseFactory
+
+
+@patch.dict(settings.FEATURES, {
+    'ENABLE_SOCIAL_ENGAGEMENT': True,
+    'ENABLE_SOCIAL_ENGAGEMENT_COURSE_AGGREGATES': True,
+    'ENABLE_NOTIFICATIONS': False,
+})
+class TestReconcileSocialEngagementAggregatesCommand(SharedModuleStoreTestCase):
+    """
+    Tests the `reconcile_social_engagement_aggregates` command.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.course = CourseFactory.create()
+        cls.users = []
+        for __ in range(3):
+            user = UserFactory.create()
+            cls.users.append(user)
+            CourseEnrollmentFactory(user=user, course_id=cls.course.id)
+
+    def _get_total(self):
+        return CourseSocialEngagementAggregate.objects.get(course_id=self.course.id).total_score
+
+    def test_aggregate_maintained_on_save(self):
+        """
+        Test to ensure the aggregate follows saved scores
+        """
+        for score, user in zip((10, 20, 30), self.users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.users[0].id, 40)
+
+        self.assertEqual(self._get_total(), 90)
+        self.assertEqual(StudentSocialEngagementScore.get_course_average_engagement_score(self.course.id), 30)
+
+    def test_reconcile(self):
+        """
+        Test to ensure drift is reported in dry runs and repaired otherwise
+        """
+        for score, user in zip((10, 20, 30), self.users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+        CourseSocialEngagementAggregate.objects.filter(course_id=self.course.id).update(total_score=5)
+
+        call_command('reconcile_social_engagement_aggregates', course_id=str(self.course.id), dry_run=True)
+        self.assertEqual(self._get_total(), 5)
+
+        call_command('reconcile_social_engagement_aggregates')
+        self.assertEqual(self._get_total(), 60)
+
+        # dry runs don't create missing aggregates
+        CourseSocialEngagementAggregate.objects.filter(course_id=self.course.id).delete()
+        call_command('reconcile_social_engagement_aggregates', course_id=str(self.course.id), dry_run=True)
+        self.assertFalse(CourseSocialEngagementAggregate.objects.filter(course_id=self.course.id).exists())
+
+    def test_aggregate_covers_enrolled_users(self):
+        """
+        Test to ensure only scores of active enrolled users are counted, like the SUM over the leaderboard
+        """
+        unenrolled_user = UserFactory.create()
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, unenrolled_user.id, 100)
+        for score, user in zip((10, 20, 30), self.users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+        self.assertEqual(self._get_total(), 60)
+
+        CourseEnrollment.unenroll(self.users[0], self.course.id)
+        self.assertEqual(self._get_total(), 50)
+        CourseEnrollment.enroll(self.users[0], self.course.id)
+        self.assertEqual(self._get_total(), 60)
+
+        self.assertEqual(CourseSocialEngagementAggregate.reconcile(self.course.id), {})
+        self.assertEqual(
+            StudentSocialEngagementScore.get_course_average_engagement_score(
+                self.course.id, exclude_users=[self.users[2].id, unenrolled_user.id]
+            ),
+            10
+        )
+
+    def test_enrollment_changes_counted_once(self):
+        """
+        Test to ensure re-enrollments, mode changes and upgrades don't count a score again
+        """
+        for score, user in zip((10, 20, 30), self.users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+        self.assertEqual(self._get_total(), 60)
+
+        CourseEnrollment.enroll(self.users[0], self.course.id)
+        CourseEnrollment.enroll(self.users[0], self.course.id)
+        CourseEnrollment.enroll(self.users[0], self.course.id, mode='verified')
+        ENROLL_STATUS_CHANGE.send(
+            sender=None,
+            event=EnrollStatusChange.upgrade_complete,
+            user=self.users[0],
+            course_id=self.course.id,
+            mode='verified',
+        )
+        self.assertEqual(self._get_total(), 60)
+
+        CourseEnrollment.unenroll(self.users[0], self.course.id)
+        CourseEnrollment.unenroll(self.users[0], self.course.id)
+        self.assertEqual(self._get_total(), 50)
+        CourseEnrollment.enroll(self.users[0], self.course.id)
+        self.assertEqual(self._get_total(), 60)
+        self.assertEqual(CourseSocialEngagementAggregate.reconcile(self.course.id), {})
+
+    def test_deactivated_users_not_counted(self):
+        """
+        Test to ensure scores of users leave the course total when the users are deactivated
+        """
+        for score, user in zip((10, 20, 30), self.users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+
+        user = User.objects.get(pk=self.users[0].id)
+        user.is_active = False
+        user.save()
+        user.save()
+        self.assertEqual(self._get_total(), 50)
+
+        user.is_active = True
+        user.save()
+        self.assertEqual(self._get_total(), 60)
+        self.assertEqual(CourseSocialEngagementAggregate.reconcile(self.course.id), {})
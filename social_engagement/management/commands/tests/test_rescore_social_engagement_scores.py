@@ -0,0 +1,90 @@
+"""
+Unit tests for rescore_social_engagement_scores command
+"""
+from django.conf import settings
+from django.core.management import call_command
+from django.test.utils import override_settings
+
+from mock import patch
+from social_engagement.models import (CourseSocialEngagementAggregate,
+                                      StudentSocialEngagementScore,
+                                      StudentSocialEngagementScoreHistory)
+from social_engagement.scoring import get_weights_hash
+from student.tests.factories import CourseEnrollmentFactory, UserFactory
+from xmodule.modulestore.tests.django_utils import SharedModuleStoreTestCase
+from xmodule.modulestore.tests.factories import CourseFactory
+
+OLD_POINTS = {'num_threads': 10, 'num_comments': 15, 'num_upvotes': 25}
+NEW_POINTS = {'num_threads': 20, 'num_comments': 5, 'num_upvotes': 1}
+
+
+@patch.dict(settings.FEATURES, {
+    'ENABLE_SOCIAL_ENGAGEMENT': True,
+    'ENABLE_SOCIAL_ENGAGEMENT_COURSE_AGGREGATES': True,
+    'ENABLE_SOCIAL_ENGAGEMENT_MATERIALIZED_RANK': True,
+    'ENABLE_NOTIFICATIONS': False,
+})
+class TestRescoreSocialEngagementScoresCommand(SharedModuleStoreTestCase):
+    """
+    Tests the `rescore_social_engagement_scores` command.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.course = CourseFactory.create()
+        cls.users = []
+        for __ in range(3):
+            user = UserFactory.create()
+            cls.users.append(user)
+            CourseEnrollmentFactory(user=user, course_id=cls.course.id)
+
+    def _save_scores(self):
+        user_stats = [
+            (self.users[0].id, {'num_threads': 1, 'num_comments': 2, 'num_upvotes': 3}),
+            (self.users[1].id, {'num_threads': 4, 'num_comments': 0, 'num_upvotes': 0}),
+            (self.users[2].id, {'num_threads': 0, 'num_comments': 1, 'num_upvotes': 10}),
+        ]
+        with override_settings(SOCIAL_METRIC_POINTS=OLD_POINTS):
+            StudentSocialEngagementScore.bulk_save_user_engagement_scores(self.course.id, [
+                (user_id, sum(stats[stat] * points for stat, points in OLD_POINTS.items()), stats)
+                for user_id, stats in user_stats
+            ])
+
+    def _get_scores(self):
+        return dict(
+            StudentSocialEngagementScore.objects.filter(course_id=self.course.id).values_list('user_id', 'score')
+        )
+
+    def test_rescore(self):
+        """
+        Test to ensure scores are recomputed from the stored stats with the current points
+        """
+        self._save_scores()
+        self.assertEqual(self._get_scores(), {self.users[0].id: 115, self.users[1].id: 40, self.users[2].id: 265})
+
+        with override_settings(SOCIAL_METRIC_POINTS=NEW_POINTS):
+            self.assertEqual(StudentSocialEngagementScore.get_stale_course_ids(), [self.course.id])
+            call_command('rescore_social_engagement_scores', dry_run=True)
+            self.assertEqual(self._get_scores()[self.users[0].id], 115)
+
+            history_count = StudentSocialEngagementScoreHistory.objects.count()
+            call_command('rescore_social_engagement_scores')
+
+            self.assertEqual(self._get_scores(), {self.users[0].id: 33, self.users[1].id: 80, self.users[2].id: 15})
+            self.assertEqual(StudentSocialEngagementScoreHistory.objects.count(), history_count + 3)
+            self.assertEqual(
+                CourseSocialEngagementAggregate.objects.get(course_id=self.course.id).total_score, 128
+            )
+            self.assertEqual(StudentSocialEngagementScore.objects.get(user=self.users[1]).rank, 1)
+            self.assertEqual(StudentSocialEngagementScore.get_stale_course_ids(), [])
+
+            # only entries stamped with other points are re-scored
+            StudentSocialEngagementScore.objects.filter(user=self.users[0]).update(score=0, weights_hash=None)
+            self.assertEqual(StudentSocialEngagementScore.rescore_course(self.course.id), 1)
+            self.assertEqual(self._get_scores()[self.users[0].id], 33)
+            self.assertEqual(
+                set(StudentSocialEngagementScore.objects.values_list('weights_hash', flat=True)),
+                {get_weights_hash(NEW_POINTS)}
+            )
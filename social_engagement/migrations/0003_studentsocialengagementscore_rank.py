@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_engagement', '0002_studentsocialengagementscore_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentsocialengagementscore',
+            name='rank',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='studentsocialengagementscore',
+            index=models.Index(fields=['course_id', 'rank'], name='social_engagement_rank_idx'),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_engagement', '0003_studentsocialengagementscore_rank'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studentsocialengagementscore',
+            index=models.Index(fields=['course_id', '-score', 'modified'], name='social_engagement_score_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+import model_utils.fields
+from opaque_keys.edx.django.models import CourseKeyField
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_engagement', '0004_studentsocialengagementscore_score_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseSocialEngagementAggregate',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created', editable=False)),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified', editable=False)),
+                ('course_id', CourseKeyField(max_length=255, unique=True)),
+                ('total_score', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+import model_utils.fields
+from opaque_keys.edx.django.models import CourseKeyField
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_engagement', '0005_coursesocialengagementaggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseSocialEngagementState',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created', editable=False)),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified', editable=False)),
+                ('course_id', CourseKeyField(max_length=255, unique=True)),
+                ('last_activity', models.DateTimeField(null=True, blank=True)),
+                ('last_recompute', models.DateTimeField(null=True, blank=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_engagement', '0006_coursesocialengagementstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursesocialengagementstate',
+            name='recompute_status',
+            field=models.CharField(blank=True, choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='coursesocialengagementstate',
+            name='recompute_snapshot_id',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='coursesocialengagementstate',
+            name='recompute_last_user_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_engagement', '0007_coursesocialengagementstate_recompute_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentsocialengagementscore',
+            name='weights_hash',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+    ]
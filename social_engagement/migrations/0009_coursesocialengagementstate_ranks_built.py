@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_engagement', '0008_studentsocialengagementscore_weights_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursesocialengagementstate',
+            name='ranks_built',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -2,12 +2,17 @@
 Django database models supporting the social_engagement app
 """
 
+from datetime import timedelta
 from decimal import Decimal
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Q, Sum
-from django.db.models.signals import post_save
+from django.db import connection, models, transaction
+from django.db.models import ExpressionWrapper, F, Q, Sum, Value, Window
+from django.db.models.functions import RowNumber
+from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 from edx_solutions_api_integration.courses.utils import get_course_enrollment_count
 from edx_solutions_api_integration.utils import (get_cached_data,
@@ -16,6 +21,33 @@ from model_utils.models import TimeStampedModel
 from opaque_keys.edx.django.models import CourseKeyField
 from student.models import CourseEnrollment
 
+from .leaderboard import get_leaderboard_index
+from .scoring import ScoringEngine, get_social_metric_points, get_weights_hash
+from .utils import acquire_course_task_lock, release_course_task_lock
+
+LEADERBOARD_INDEX_REBUILD_LOCK = 'leaderboard_index_rebuild'
+
+
+def is_materialized_rank_enabled():
+    """
+    Returns True if stored ranks should be maintained and used for position lookups.
+    """
+    return settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT_MATERIALIZED_RANK', False)
+
+
+def is_incremental_recompute_enabled():
+    """
+    Returns True if course activity is tracked, so recomputes of dormant courses can be skipped.
+    """
+    return settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT_INCREMENTAL_RECOMPUTE', False)
+
+
+def is_course_aggregate_enabled():
+    """
+    Returns True if running course totals should be maintained and used for course averages.
+    """
+    return settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT_COURSE_AGGREGATES', False)
+
 
 class StudentSocialEngagementScore(TimeStampedModel):
     """
@@ -36,11 +68,39 @@ class StudentSocialEngagementScore(TimeStampedModel):
     num_upvotes = models.IntegerField(default=0)
     num_comments_generated = models.IntegerField(default=0)
 
+    # position in the course in `LEADERBOARD_ORDERING`, maintained when
+    # ENABLE_SOCIAL_ENGAGEMENT_MATERIALIZED_RANK feature is enabled
+    rank = models.IntegerField(null=True, blank=True)
+
+    # `get_weights_hash` of the social metric points the score was computed with,
+    # entries with another hash are updated by `rescore_course`
+    weights_hash = models.CharField(max_length=40, null=True, blank=True)
+
+    # every leaderboard query and rank ranks ties by the earlier modification,
+    # then by user id, which also makes `(score, modified, user_id)` a unique cursor
+    LEADERBOARD_ORDERING = ('-score', 'modified', 'user_id')
+
+    LEADERBOARD_VALUES = (
+        'user__id',
+        'user__username',
+        'user__first_name',
+        'user__last_name',
+        'user__profile__title',
+        'user__profile__profile_image_uploaded_at',
+        'score',
+        'modified',
+    )
+
     class Meta:
         """
         Meta information for this Django model
         """
         unique_together = (('user', 'course_id'),)
+        indexes = [
+            models.Index(fields=['course_id', 'rank'], name='social_engagement_rank_idx'),
+            # covers the leaderboard ordering and the position range counts
+            models.Index(fields=['course_id', '-score', 'modified'], name='social_engagement_score_idx'),
+        ]
 
     @property
     def stats(self):
@@ -53,6 +113,16 @@ class StudentSocialEngagementScore(TimeStampedModel):
             if stat.startswith('num_')
         }
 
+    def has_engagement_changed(self, score, stats, weights_hash=None):
+        """
+        Returns True if `score` or any of the given `stats` differ from the stored values,
+        or the score was computed with other weights than `weights_hash`.
+        """
+        return self.score != score or any(
+            getattr(self, stat) != value
+            for stat, value in stats.items()
+        ) or (weights_hash is not None and self.weights_hash != weights_hash)
+
     @classmethod
     def get_user_engagement_score(cls, course_key, user_id):
         """
@@ -97,16 +167,18 @@ class StudentSocialEngagementScore(TimeStampedModel):
             return data.get('course_avg')
 
         exclude_users = exclude_users or []
-        queryset = cls.objects.select_related('user').filter(
-            course_id__exact=course_key,
-            user__is_active=True,
-            user__courseenrollment__is_active=True,
-            user__courseenrollment__course_id__exact=course_key
-        )
-        queryset = queryset.exclude(user__id__in=exclude_users)
-        aggregates = queryset.aggregate(Sum('score'))
+        total_score = cls._get_aggregated_total_score(course_key, exclude_users)
+        if total_score is None:
+            queryset = cls.objects.select_related('user').filter(
+                course_id__exact=course_key,
+                user__is_active=True,
+                user__courseenrollment__is_active=True,
+                user__courseenrollment__course_id__exact=course_key
+            )
+            queryset = queryset.exclude(user__id__in=exclude_users)
+            aggregates = queryset.aggregate(Sum('score'))
+            total_score = aggregates['score__sum']
         avg_score = 0
-        total_score = aggregates['score__sum']
         if total_score is None:
             total_score = 0
         if total_score:
@@ -117,6 +189,27 @@ class StudentSocialEngagementScore(TimeStampedModel):
 
         return avg_score
 
+    @classmethod
+    def _get_aggregated_total_score(cls, course_key, exclude_users=None):
+        """
+        Helper method to return the total score of a course from its running
+        aggregate, without the excluded users, or None if there is no aggregate.
+        """
+        if not is_course_aggregate_enabled():
+            return None
+
+        total_score = CourseSocialEngagementAggregate.objects.filter(
+            course_id=course_key
+        ).values_list('total_score', flat=True).first()
+
+        if total_score is not None and exclude_users:
+            excluded_score = cls._build_queryset(course_key).filter(
+                user_id__in=exclude_users,
+            ).aggregate(Sum('score'))['score__sum']
+            total_score -= excluded_score or 0
+
+        return total_score
+
     @classmethod
     def _get_course_engagement(cls, course_key, organization=None, exclude_users=None, stats=False):
         """
@@ -137,6 +230,18 @@ class StudentSocialEngagementScore(TimeStampedModel):
             for stat in queryset
         }
 
+    @classmethod
+    def get_course_engagement_entries(cls, course_key, user_id_range=None):
+        """
+        Returns a dictionary containing all score entries of a course in form of `user_id: entry`.
+
+        :param user_id_range: optional `(first, last)` tuple limiting the entries to a range of user ids
+        """
+        queryset = cls.objects.filter(course_id__exact=course_key)
+        if user_id_range:
+            queryset = queryset.filter(user_id__range=user_id_range)
+        return {entry.user_id: entry for entry in queryset}
+
     @classmethod
     def get_course_engagement_scores(cls, course_key, organization=None, exclude_users=None):
         """
@@ -157,12 +262,316 @@ class StudentSocialEngagementScore(TimeStampedModel):
         Creates or updates an engagement score
         """
         stats = stats or {}
-        cls.objects.update_or_create(
-            course_id=course_key,
-            user_id=user_id,
-            defaults=dict(score=score, **stats)
+        with transaction.atomic():
+            cls.lock_course_ranks(course_key)
+            cls.objects.update_or_create(
+                course_id=course_key,
+                user_id=user_id,
+                defaults=dict(score=score, weights_hash=get_weights_hash(), **stats)
+            )
+
+    @classmethod
+    def bulk_save_user_engagement_scores(cls, course_key, user_scores, batch_size=None, user_id_range=None,
+                                         refresh_rankings=True):
+        """
+        Creates or updates engagement scores of many users in a course.
+        Existing rows are loaded with a single query and written back in chunks,
+        each chunk in its own transaction.
+
+        Rows whose score and stats did not change are not written at all.
+        Model signals are not sent for bulk writes, so the history entries
+        and cache invalidation are handled here.
+
+        :param user_scores: iterable of `(user_id, score, stats)` tuples
+        :param user_id_range: optional `(first, last)` tuple of user ids, if all `user_scores` are in the range
+        :param refresh_rankings: set this to False if stored ranks and the leaderboard
+                                 index are rebuilt by the caller after all writes
+        :returns: tuple with the number of written and skipped scores
+        """
+        batch_size = batch_size or getattr(settings, 'SOCIAL_ENGAGEMENT_BULK_BATCH_SIZE', 500)
+        existing = cls.get_course_engagement_entries(course_key, user_id_range)
+        weights_hash = get_weights_hash()
+
+        changed_scores = []
+        skipped_count = 0
+        for user_id, score, stats in user_scores:
+            user_id = int(user_id)
+            stats = stats or {}
+            entry = existing.get(user_id)
+            if entry is not None and not entry.has_engagement_changed(score, stats, weights_hash):
+                skipped_count += 1
+            else:
+                changed_scores.append((user_id, score, stats))
+
+        written_count = 0
+        for start in range(0, len(changed_scores), batch_size):
+            written_count += cls._bulk_save_chunk(
+                course_key, changed_scores[start:start + batch_size], existing, weights_hash
+            )
+
+        if written_count and refresh_rankings:
+            cls.refresh_course_rankings(course_key, batch_size)
+
+        return written_count, skipped_count
+
+    @classmethod
+    def bulk_apply_engagement_changes(cls, course_key, users_changes, social_metric_points, batch_size=None):
+        """
+        Adds signed stat changes to the stats and scores of many users in a course.
+        Entries of each chunk of users are locked, updated and written back in
+        their own transaction, with a fixed number of queries per chunk.
+
+        All users must exist. Model signals are not sent, as in `bulk_save_user_engagement_scores`.
+        Scores computed with other social metric points are computed again from the stats.
+        Stored ranks are rebuilt after every chunk, and the changed users are moved in the
+        leaderboard index.
+
+        :param users_changes: dictionary of `user_id: {stat: delta}`
+        :returns: the number of written scores
+        """
+        batch_size = batch_size or getattr(settings, 'SOCIAL_ENGAGEMENT_BULK_BATCH_SIZE', 500)
+        scoring_engine = ScoringEngine(social_metric_points)
+        # locking in a fixed order avoids deadlocks between concurrent batches
+        user_ids = sorted(users_changes)
+
+        written_count = 0
+        for start in range(0, len(user_ids), batch_size):
+            chunk_user_ids = user_ids[start:start + batch_size]
+            with transaction.atomic():
+                cls.lock_course_ranks(course_key)
+                existing = {
+                    entry.user_id: entry
+                    for entry in cls.objects.select_for_update().filter(
+                        course_id__exact=course_key, user_id__in=chunk_user_ids
+                    )
+                }
+
+                chunk = []
+                for user_id in chunk_user_ids:
+                    entry = existing.get(user_id)
+                    changes = users_changes[user_id]
+                    stats = {stat: (getattr(entry, stat) if entry else 0) + delta for stat, delta in changes.items()}
+                    if entry is not None and entry.weights_hash != scoring_engine.weights_hash:
+                        score = scoring_engine.score(dict(entry.stats, **stats))
+                    else:
+                        score = (entry.score if entry else 0) + sum(
+                            social_metric_points.get(stat, 0) * delta for stat, delta in changes.items()
+                        )
+                    chunk.append((user_id, score, stats))
+
+                written_count += cls._bulk_save_chunk(course_key, chunk, existing, scoring_engine.weights_hash)
+                if is_materialized_rank_enabled():
+                    cls.rebuild_course_ranks(course_key)
+                cls._update_users_index(course_key, chunk_user_ids)
+
+        return written_count
+
+    @classmethod
+    def _update_users_index(cls, course_key, user_ids):
+        """
+        Helper method to move the saved entries of some users in the leaderboard index.
+        """
+        leaderboard_index = get_leaderboard_index()
+        if not leaderboard_index:
+            return
+
+        leaderboard_user_ids = set(
+            cls._build_queryset(course_key).filter(user_id__in=user_ids).values_list('user_id', flat=True)
+        )
+        entries = cls.objects.filter(course_id__exact=course_key, user_id__in=user_ids)
+        for user_id, score, modified in entries.values_list('user_id', 'score', 'modified'):
+            if user_id in leaderboard_user_ids:
+                leaderboard_index.update(course_key, user_id, score, modified)
+            else:
+                leaderboard_index.remove(course_key, user_id)
+
+    @classmethod
+    def refresh_course_rankings(cls, course_key, batch_size=None):
+        """
+        Rebuilds stored ranks and the leaderboard index of a course after bulk writes.
+        """
+        batch_size = batch_size or getattr(settings, 'SOCIAL_ENGAGEMENT_BULK_BATCH_SIZE', 500)
+        if is_materialized_rank_enabled():
+            cls.rebuild_course_ranks(course_key, batch_size=batch_size)
+
+        if get_leaderboard_index():
+            cls.rebuild_leaderboard_index(course_key)
+
+    @classmethod
+    def get_stale_course_ids(cls, weights_hash=None):
+        """
+        Returns ids of courses with scores computed with other social metric points than the current ones.
+        """
+        weights_hash = weights_hash or get_weights_hash()
+        return list(
+            cls.objects.exclude(weights_hash=weights_hash).values_list('course_id', flat=True).distinct()
         )
 
+    @classmethod
+    def rescore_course(cls, course_key, batch_size=None):
+        """
+        Recomputes the scores of a course from the stored stats with the current social
+        metric points, for the entries stamped with other weights. Every chunk of entries
+        is re-scored with a single UPDATE, without fetching stats from the forum service.
+
+        Model signals are not sent, as in `bulk_save_user_engagement_scores`.
+        Returns the number of re-scored entries.
+        """
+        batch_size = batch_size or getattr(settings, 'SOCIAL_ENGAGEMENT_BULK_BATCH_SIZE', 500)
+        social_metric_points = get_social_metric_points()
+        weights_hash = get_weights_hash(social_metric_points)
+        stats = {field.name for field in cls._meta.fields if field.name.startswith('num_')}
+        score = ExpressionWrapper(
+            sum((F(stat) * weight for stat, weight in social_metric_points.items() if stat in stats), Value(0)),
+            output_field=models.IntegerField(),
+        )
+
+        stale = cls.objects.filter(course_id__exact=course_key).exclude(weights_hash=weights_hash)
+        user_ids = list(stale.order_by('user_id').values_list('user_id', flat=True))
+
+        for start in range(0, len(user_ids), batch_size):
+            chunk_user_ids = user_ids[start:start + batch_size]
+            with transaction.atomic():
+                cls.lock_course_ranks(course_key)
+                stale.filter(user_id__range=(chunk_user_ids[0], chunk_user_ids[-1])).update(
+                    score=score, weights_hash=weights_hash
+                )
+                StudentSocialEngagementScoreHistory.objects.bulk_create([
+                    StudentSocialEngagementScoreHistory(user_id=user_id, course_id=course_key, score=user_score)
+                    for user_id, user_score in cls.objects.filter(
+                        course_id__exact=course_key, user_id__in=chunk_user_ids
+                    ).values_list('user_id', 'score')
+                ])
+
+            for user_id in chunk_user_ids:
+                invalid_user_data_cache('social', course_key, user_id)
+
+        if user_ids:
+            if is_course_aggregate_enabled():
+                CourseSocialEngagementAggregate.reconcile(course_key)
+            cls.refresh_course_rankings(course_key, batch_size)
+
+        return len(user_ids)
+
+    @classmethod
+    def _bulk_save_chunk(cls, course_key, chunk, existing, weights_hash):
+        """
+        Helper method to write a chunk of `(user_id, score, stats)` tuples.
+        """
+        now = timezone.now()
+        new_entries = []
+        changed_entries = []
+        update_fields = {'score', 'modified', 'weights_hash'}
+
+        score_delta = 0
+        aggregated_user_ids = set(cls._build_queryset(course_key).filter(
+            user_id__in=[user_id for user_id, __, __ in chunk]
+        ).values_list('user_id', flat=True)) if is_course_aggregate_enabled() else set()
+
+        for user_id, score, stats in chunk:
+            entry = existing.get(user_id)
+            if user_id in aggregated_user_ids:
+                score_delta += score - (entry.score if entry else 0)
+            if entry is None:
+                entry = cls(course_id=course_key, user_id=user_id)
+                new_entries.append(entry)
+            else:
+                entry.modified = now
+                changed_entries.append(entry)
+
+            entry.score = score
+            entry.weights_hash = weights_hash
+            for stat, value in stats.items():
+                setattr(entry, stat, value)
+                update_fields.add(stat)
+
+        with transaction.atomic():
+            cls.lock_course_ranks(course_key)
+            cls.objects.bulk_create(new_entries)
+            cls.objects.bulk_update(changed_entries, list(update_fields))
+            StudentSocialEngagementScoreHistory.objects.bulk_create([
+                StudentSocialEngagementScoreHistory(user_id=user_id, course_id=course_key, score=score)
+                for user_id, score, __ in chunk
+            ])
+            if is_course_aggregate_enabled():
+                CourseSocialEngagementAggregate.apply_delta(course_key, score_delta)
+
+        for user_id, __, __ in chunk:
+            invalid_user_data_cache('social', course_key, user_id)
+
+        return len(chunk)
+
+    @classmethod
+    def supports_upsert(cls):
+        """
+        Returns True if the database can apply changes with `upsert_engagement_changes`.
+        """
+        if connection.vendor == 'sqlite':
+            # ON CONFLICT was added in SQLite 3.24
+            return connection.Database.sqlite_version_info >= (3, 24, 0)
+        return connection.vendor in ('mysql', 'postgresql')
+
+    @classmethod
+    def upsert_engagement_changes(cls, course_key, user_id, changes, score_delta):
+        """
+        Adds signed stat `changes` and `score_delta` to a user's entry with a single
+        UPDATE, or creates the entry if it does not exist yet. The INSERT only runs
+        for new entries, so updates don't use up AUTO_INCREMENT or sequence values,
+        and uses ON CONFLICT / ON DUPLICATE KEY UPDATE in case of a concurrent insert.
+
+        New entries are stamped with the current weights hash, existing entries keep
+        theirs, as their score may have been computed with other social metric points.
+
+        Model signals are not sent, callers run `handle_engagement_score_written`.
+        """
+        stats = [field.name for field in cls._meta.fields if field.name.startswith('num_')]
+        changed_stats = [stat for stat in stats if changes.get(stat)]
+        modified = timezone.now()
+
+        updated = cls.objects.filter(course_id=course_key, user_id=user_id).update(
+            score=F('score') + score_delta,
+            modified=modified,
+            **{stat: F(stat) + changes[stat] for stat in changed_stats}
+        )
+        if updated:
+            return
+
+        quote = connection.ops.quote_name
+        table = quote(cls._meta.db_table)
+        now = connection.ops.adapt_datetimefield_value(modified)
+
+        columns = ['user_id', 'course_id', 'created', 'modified', 'score', 'weights_hash'] + stats
+        values = [int(user_id), str(course_key), now, now, score_delta, get_weights_hash()] + [
+            changes.get(stat, 0) for stat in stats
+        ]
+        changed_columns = ['score'] + changed_stats
+
+        if connection.vendor == 'mysql':
+            conflict_clause = 'ON DUPLICATE KEY UPDATE {}'.format(', '.join(
+                ['{0} = {0} + VALUES({0})'.format(quote(column)) for column in changed_columns] +
+                ['{0} = VALUES({0})'.format(quote('modified'))]
+            ))
+        else:
+            conflict_clause = 'ON CONFLICT ({}, {}) DO UPDATE SET {}'.format(
+                quote('user_id'),
+                quote('course_id'),
+                ', '.join(
+                    ['{0} = {1}.{0} + excluded.{0}'.format(quote(column), table) for column in changed_columns] +
+                    ['{0} = excluded.{0}'.format(quote('modified'))]
+                )
+            )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {} ({}) VALUES ({}) {}'.format(
+                    table,
+                    ', '.join(quote(column) for column in columns),
+                    ', '.join(['%s'] * len(values)),
+                    conflict_clause,
+                ),
+                values
+            )
+
     @classmethod
     def get_user_leaderboard_position(cls, course_key, **kwargs):
         """
@@ -184,19 +593,327 @@ class StudentSocialEngagementScore(TimeStampedModel):
 
         if queryset:
             user_score = queryset.score
-            user_time_scored = queryset.created
-
-            queryset = cls._build_queryset(course_key, **kwargs)
+            leaderboard_index = cls._get_built_leaderboard_index(
+                course_key
+            ) if cls._is_unfiltered_by_membership(**kwargs) else None
+            index_rank = leaderboard_index.rank(
+                course_key, queryset.user_id, exclude_users=kwargs.get('exclude_users')
+            ) if leaderboard_index else None
 
-            users_above = queryset.filter(
-                Q(score__gt=user_score) |
-                Q(score=user_score, modified__lt=user_time_scored)
-            ).count()
+            if index_rank is not None:
+                users_above = index_rank
+            elif queryset.rank and cls._can_use_materialized_rank(**kwargs):
+                users_above = queryset.rank - 1
+                if kwargs.get('exclude_users'):
+                    users_above -= cls.objects.filter(
+                        course_id__exact=course_key,
+                        user__in=kwargs.get('exclude_users'),
+                        rank__lt=queryset.rank,
+                    ).count()
+            else:
+                users_above = cls._count_entries_above(cls._build_queryset(course_key, **kwargs), queryset)
 
             data['position'] = users_above + 1 if user_score > 0 else 0
             data['score'] = user_score
         return data
 
+    @classmethod
+    def get_users_leaderboard_positions(cls, course_key, user_ids, **kwargs):
+        """
+        Returns progress positions of many users in a given course with a single query,
+        plus range counts for users outside of the filtered entries. Positions and scores
+        are the same as the ones of `get_user_leaderboard_position`.
+        :param kwargs:
+            - `exclude_users`
+            - `group_ids`
+            - `org_ids`
+            - `cohort_user_ids`
+
+        :returns data = {123: {"score": 22, "position": 4}, 983: {"score": 0, "position": 0}}
+        """
+        data = {int(user_id): {"score": 0, "position": 0} for user_id in user_ids}
+        if not data:
+            return data
+
+        queryset = cls._build_queryset(course_key, **kwargs)
+        rows = list(cls._get_ranked_rows(queryset, list(data))) if connection.features.supports_over_clause else []
+
+        # users outside of the filtered entries, e.g. excluded or unenrolled ones, are
+        # positioned among them with their own score, as in `get_user_leaderboard_position`
+        unranked_user_ids = set(data) - {user_id for user_id, __, __ in rows}
+        if unranked_user_ids:
+            rows.extend(
+                (entry.user_id, entry.score, cls._count_entries_above(queryset, entry) + 1)
+                for entry in cls.objects.filter(course_id__exact=course_key, user_id__in=unranked_user_ids)
+            )
+
+        for user_id, score, position in rows:
+            data[user_id] = {"score": score, "position": position if score > 0 else 0}
+        return data
+
+    @classmethod
+    def _get_ranked_rows(cls, queryset, user_ids):
+        """
+        Helper method to number all rows of the queryset in leaderboard order with
+        `ROW_NUMBER()` and return `(user_id, score, position)` of the requested users.
+        """
+        ranked_queryset = queryset.annotate(
+            leaderboard_position=Window(
+                expression=RowNumber(),
+                partition_by=[F('course_id')],
+                order_by=[F('score').desc(), F('modified').asc(), F('user_id').asc()],
+            )
+        ).values('user_id', 'score', 'leaderboard_position')
+
+        # window functions can't be filtered in the same query, so the requested
+        # users are selected from the numbered rows in an outer query
+        sql, params = ranked_queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT ranked.user_id, ranked.score, ranked.leaderboard_position FROM ({}) ranked '
+                'WHERE ranked.user_id IN ({})'.format(sql, ', '.join(['%s'] * len(user_ids))),
+                tuple(params) + tuple(user_ids)
+            )
+            return cursor.fetchall()
+
+    @classmethod
+    def _count_entries_above(cls, queryset, entry):
+        """
+        Helper method to count rows of the queryset ordered before `entry` in `LEADERBOARD_ORDERING`.
+        Separate range counts instead of an OR, so all of them can be answered from the score index.
+        """
+        queryset = queryset.exclude(pk=entry.pk)
+        entries_above = queryset.filter(score__gt=entry.score).count()
+        entries_above += queryset.filter(score=entry.score, modified__lt=entry.modified).count()
+        entries_above += queryset.filter(
+            score=entry.score, modified=entry.modified, user_id__lt=entry.user_id
+        ).count()
+        return entries_above
+
+    @classmethod
+    def _is_unfiltered_by_membership(cls, **kwargs):
+        """
+        Returns True if the lookup is not filtered by groups, organizations or cohorts.
+        """
+        return not any(kwargs.get(key) for key in ('group_ids', 'org_ids', 'cohort_user_ids'))
+
+    @classmethod
+    def _can_use_materialized_rank(cls, **kwargs):
+        """
+        Stored ranks cover the active enrolled users of the course, so they can only answer
+        position lookups which do not filter by groups, organizations or cohorts.
+        """
+        return is_materialized_rank_enabled() and cls._is_unfiltered_by_membership(**kwargs)
+
+    @classmethod
+    def rebuild_leaderboard_index(cls, course_key):
+        """
+        Replaces the leaderboard index of a course with the active enrolled users' scores.
+        """
+        leaderboard_index = get_leaderboard_index()
+        if not leaderboard_index:
+            return 0
+
+        entries = list(cls._build_queryset(course_key).values_list('user_id', 'score', 'modified'))
+        leaderboard_index.replace(course_key, entries)
+        return len(entries)
+
+    @classmethod
+    def _get_built_leaderboard_index(cls, course_key):
+        """
+        Helper method to return the leaderboard index if it holds the whole course, or None.
+        A course index which was never built, or was lost after a restart or an eviction,
+        is rebuilt by one of the requests, and lookups use the database meanwhile.
+        """
+        leaderboard_index = get_leaderboard_index()
+        if not leaderboard_index:
+            return None
+        if leaderboard_index.is_built(course_key):
+            return leaderboard_index
+
+        timeout = getattr(settings, 'SOCIAL_ENGAGEMENT_LEADERBOARD_INDEX_REBUILD_TIMEOUT', 5 * 60)
+        lock_token = acquire_course_task_lock(LEADERBOARD_INDEX_REBUILD_LOCK, str(course_key), timeout)
+        if lock_token:
+            try:
+                cls.rebuild_leaderboard_index(course_key)
+            finally:
+                release_course_task_lock(LEADERBOARD_INDEX_REBUILD_LOCK, str(course_key), lock_token)
+        return None
+
+    @classmethod
+    def is_leaderboard_entry(cls, entry):
+        """
+        Returns True if the entry belongs to an active user with an active
+        enrollment in the course, i.e. is ranked on the leaderboard.
+        """
+        return cls._build_queryset(entry.course_id).filter(pk=entry.pk).exists()
+
+    @classmethod
+    def update_entry_rankings(cls, entry, is_leaderboard_entry=None):
+        """
+        Moves a saved entry in the stored ranks and the leaderboard index of the course.
+        Users outside of `_build_queryset` are removed from the index.
+        """
+        if is_materialized_rank_enabled():
+            cls.update_user_rank(entry)
+
+        leaderboard_index = get_leaderboard_index()
+        if leaderboard_index:
+            if is_leaderboard_entry is None:
+                is_leaderboard_entry = cls.is_leaderboard_entry(entry)
+            if is_leaderboard_entry:
+                leaderboard_index.update(entry.course_id, entry.user_id, entry.score, entry.modified)
+            else:
+                leaderboard_index.remove(entry.course_id, entry.user_id)
+
+    @classmethod
+    def lock_course_ranks(cls, course_key):
+        """
+        Locks the stored ranks of a course until the end of the current transaction,
+        if they are maintained. Writes of a course's scores take the lock before
+        they lock any score row, so rank moves of the course are applied one after
+        the other and can't deadlock with each other.
+        """
+        if is_materialized_rank_enabled():
+            CourseSocialEngagementState.lock_course(course_key)
+
+    @classmethod
+    def update_user_rank(cls, entry):
+        """
+        Moves the saved `entry` to its rank among the ranked active enrolled users
+        of the course, shifting only the rows between the old and the new rank of
+        the entry. Entries of other users have no rank.
+        The ranks of a course are rebuilt instead if they were never built.
+        """
+        with transaction.atomic():
+            state = CourseSocialEngagementState.lock_course(entry.course_id)
+            if not state.ranks_built:
+                # moves are counted among ranked rows, which are only complete once built
+                cls.rebuild_course_ranks(entry.course_id)
+                entry.rank = cls.objects.filter(pk=entry.pk).values_list('rank', flat=True).first()
+                return entry.rank
+
+            # read under the lock, a concurrent move may have shifted the rank
+            old_rank = cls.objects.filter(pk=entry.pk).values_list('rank', flat=True).first()
+            queryset = cls._build_queryset(entry.course_id)
+            if queryset.filter(pk=entry.pk).exists():
+                new_rank = cls._count_entries_above(queryset.filter(rank__isnull=False), entry) + 1
+            else:
+                new_rank = None
+
+            others = cls.objects.filter(course_id__exact=entry.course_id).exclude(pk=entry.pk)
+            if old_rank is None and new_rank is not None:
+                others.filter(rank__gte=new_rank).update(rank=F('rank') + 1)
+            elif old_rank is not None and new_rank is None:
+                others.filter(rank__gt=old_rank).update(rank=F('rank') - 1)
+            elif old_rank is not None and new_rank < old_rank:
+                others.filter(rank__gte=new_rank, rank__lt=old_rank).update(rank=F('rank') + 1)
+            elif old_rank is not None and new_rank > old_rank:
+                others.filter(rank__gt=old_rank, rank__lte=new_rank).update(rank=F('rank') - 1)
+
+            if new_rank != old_rank:
+                cls.objects.filter(pk=entry.pk).update(rank=new_rank)
+
+        entry.rank = new_rank
+        return new_rank
+
+    @classmethod
+    def rebuild_course_ranks(cls, course_key, batch_size=None):
+        """
+        Recalculates stored ranks of the active enrolled users in a course from
+        scratch, clears the ranks of other users and marks the ranks as built.
+        Returns the number of rows whose rank changed.
+        """
+        with transaction.atomic():
+            state = CourseSocialEngagementState.lock_course(course_key)
+            if not state.ranks_built:
+                CourseSocialEngagementState.objects.filter(pk=state.pk).update(ranks_built=True)
+
+            if cls._can_rank_in_database():
+                return cls._rank_course_in_database(course_key)
+
+            ranks = {
+                pk: rank
+                for rank, pk in enumerate(
+                    cls._build_queryset(course_key).order_by(*cls.LEADERBOARD_ORDERING).values_list('id', flat=True),
+                    start=1
+                )
+            }
+            changed_entries = []
+            for entry in cls.objects.filter(course_id__exact=course_key).only('id', 'rank'):
+                if entry.rank != ranks.get(entry.pk):
+                    entry.rank = ranks.get(entry.pk)
+                    changed_entries.append(entry)
+
+            cls.objects.bulk_update(changed_entries, ['rank'], batch_size=batch_size)
+
+        return len(changed_entries)
+
+    @classmethod
+    def _can_rank_in_database(cls):
+        """
+        Returns True if the database can number rows and update from a join, for `_rank_course_in_database`.
+        """
+        if not connection.features.supports_over_clause:
+            return False
+        if connection.vendor == 'sqlite':
+            # UPDATE FROM was added in SQLite 3.33
+            return connection.Database.sqlite_version_info >= (3, 33, 0)
+        return connection.vendor in ('mysql', 'postgresql')
+
+    @classmethod
+    def _rank_course_in_database(cls, course_key):
+        """
+        Helper method to store the ranks of a course with a single UPDATE of its entries
+        joined to the `ROW_NUMBER()` of the active enrolled users' entries. Entries of other
+        users are not joined to a number, so their ranks are cleared by the same statement.
+        Returns the number of rows whose rank changed.
+        """
+        ranked_queryset = cls._build_queryset(course_key).annotate(
+            leaderboard_position=Window(
+                expression=RowNumber(),
+                partition_by=[F('course_id')],
+                order_by=[F('score').desc(), F('modified').asc(), F('user_id').asc()],
+            )
+        ).values('id', 'leaderboard_position')
+        sql, params = ranked_queryset.query.sql_with_params()
+
+        quote = connection.ops.quote_name
+        names = {
+            'table': quote(cls._meta.db_table),
+            'id': quote('id'),
+            'rank': quote('rank'),
+            'course_id': quote('course_id'),
+            'ranked_sql': sql,
+        }
+        if connection.vendor == 'mysql':
+            statement = (
+                'UPDATE {table} LEFT JOIN ({ranked_sql}) ranked ON ranked.id = {table}.{id} '
+                'SET {table}.{rank} = ranked.leaderboard_position '
+                'WHERE {table}.{course_id} = %s AND NOT ({table}.{rank} <=> ranked.leaderboard_position)'
+            )
+        else:
+            statement = (
+                'UPDATE {table} SET {rank} = ranked.leaderboard_position '
+                'FROM {table} course_entries LEFT JOIN ({ranked_sql}) ranked ON ranked.id = course_entries.{id} '
+                'WHERE {table}.{id} = course_entries.{id} AND course_entries.{course_id} = %s '
+                'AND {table}.{rank} {is_distinct_from} ranked.leaderboard_position'
+            )
+            names['is_distinct_from'] = 'IS DISTINCT FROM' if connection.vendor == 'postgresql' else 'IS NOT'
+
+        with connection.cursor() as cursor:
+            cursor.execute(statement.format(**names), tuple(params) + (str(course_key),))
+            return cursor.rowcount
+
+    @classmethod
+    def get_leaderboard_user_ids(cls, course_key, count, **kwargs):
+        """
+        Returns ids of the Top N users with a positive score, in leaderboard order.
+        :param kwargs: same filters as `_build_queryset`
+        """
+        queryset = cls._build_queryset(course_key, **kwargs).filter(score__gt=0)
+        return list(queryset.order_by(*cls.LEADERBOARD_ORDERING).values_list('user_id', flat=True)[:count])
+
     @classmethod
     def generate_leaderboard(cls, course_key, **kwargs):
         """
@@ -230,7 +947,12 @@ class StudentSocialEngagementScore(TimeStampedModel):
             if cached_data is not None:
                 data['course_avg'] = cached_data.get('course_avg')
             else:
-                data['course_avg'] = cls._calculate_course_average_engagement_score(queryset, data['total_user_count'])
+                total_score = cls._get_aggregated_total_score(
+                    course_key, kwargs.get('exclude_users')
+                ) if cls._is_unfiltered_by_membership(**kwargs) else None
+                data['course_avg'] = cls._calculate_course_average_engagement_score(
+                    queryset, data['total_user_count'], total_score
+                )
         else:
             data['total_user_count'] = cls._build_enrollment_queryset(
                 course_key,
@@ -239,21 +961,82 @@ class StudentSocialEngagementScore(TimeStampedModel):
             ).count()
             data['course_avg'] = cls._calculate_course_average_engagement_score(queryset, data['total_user_count'])
         if kwargs.get('count'):
-            data['queryset'] = queryset.values(
-                'user__id',
-                'user__username',
-                'user__first_name',
-                'user__last_name',
-                'user__profile__title',
-                'user__profile__profile_image_uploaded_at',
-                'score',
-                'modified'
-            ).order_by('-score', 'modified')[:int(kwargs.get('count'))]
+            data['queryset'] = cls._get_leaderboard_from_index(queryset, course_key, **kwargs)
+            if data['queryset'] is None:
+                data['queryset'] = queryset.values(
+                    *cls.LEADERBOARD_VALUES
+                ).order_by(*cls.LEADERBOARD_ORDERING)[:int(kwargs.get('count'))]
         else:
             data['queryset'] = queryset
 
         return data
 
+    @classmethod
+    def get_leaderboard_page(cls, course_key, cursor=None, page_size=100, **kwargs):
+        """
+        Returns a page of the full leaderboard for a given course. Pages are
+        sought with the cursor of the previous page instead of an OFFSET, so
+        deep pages are as cheap as the first one and rows do not shift between
+        pages when other users' scores change in the meantime.
+        :param cursor: `(score, modified, user_id)` of the last row of the previous page,
+                       or None for the first page
+        :param kwargs:
+            - `exclude_users`
+            - `group_ids`
+            - `org_ids`
+            - `cohort_user_ids`
+
+        :returns data = {
+            'results': [{'user__id': 123, 'user__username': 'testuser1', ..., 'score': 80, 'modified': ...}, ...],
+            'next_cursor': (80, datetime(...), 123),
+        }
+        """
+        queryset = cls._build_queryset(course_key, **kwargs)
+        if cursor:
+            score, modified, user_id = cursor
+            queryset = queryset.filter(
+                Q(score__lt=score) |
+                Q(score=score, modified__gt=modified) |
+                Q(score=score, modified=modified, user_id__gt=user_id)
+            )
+
+        # one extra row tells whether there is a next page
+        rows = list(queryset.values(*cls.LEADERBOARD_VALUES).order_by(*cls.LEADERBOARD_ORDERING)[:page_size + 1])
+        results = rows[:page_size]
+        next_cursor = None
+        if len(rows) > page_size:
+            last = results[-1]
+            next_cursor = (last['score'], last['modified'], last['user__id'])
+
+        return {
+            'results': results,
+            'next_cursor': next_cursor,
+        }
+
+    @classmethod
+    def _get_leaderboard_from_index(cls, queryset, course_key, **kwargs):
+        """
+        Helper method to return the Top N leaderboard rows in index order,
+        or None if the index is not enabled or cannot answer the request.
+        """
+        if not cls._is_unfiltered_by_membership(**kwargs):
+            return None
+        leaderboard_index = cls._get_built_leaderboard_index(course_key)
+        if not leaderboard_index:
+            return None
+
+        count = int(kwargs.get('count'))
+        user_ids = leaderboard_index.top(course_key, count, exclude_users=kwargs.get('exclude_users'))
+        rows = {
+            row['user__id']: row
+            for row in queryset.filter(user_id__in=user_ids).values(*cls.LEADERBOARD_VALUES)
+        }
+        if len(rows) < len(user_ids):
+            # some indexed users are not active anymore, so the index is out of date
+            return None
+
+        return [rows[user_id] for user_id in user_ids]
+
     @classmethod
     def _build_queryset(cls, course_key, **kwargs):
         """
@@ -264,20 +1047,30 @@ class StudentSocialEngagementScore(TimeStampedModel):
             - `org_ids`
             - `cohort_user_ids`
         """
+        # active enrollments are checked with a semi-join rather than a join, so the
+        # database can walk the score index of the course and probe enrollments
         queryset = cls.objects.filter(
             course_id__exact=course_key,
             user__is_active=True,
-            user__courseenrollment__is_active=True,
-            user__courseenrollment__course_id__exact=course_key,
+            user_id__in=CourseEnrollment.objects.filter(
+                course_id=course_key,
+                is_active=True,
+            ).values('user_id'),
         ).exclude(
             user__in=kwargs.get('exclude_users') or []
         )
 
+        # membership filters are semi-joins, so a user in several of the groups or
+        # organizations is not duplicated, which window ranking relies on
         if kwargs.get('group_ids'):
-            queryset = queryset.filter(user__groups__in=kwargs.get('group_ids')).distinct()
+            queryset = queryset.filter(
+                user_id__in=User.objects.filter(groups__in=kwargs.get('group_ids')).values('id')
+            )
 
         if kwargs.get('org_ids'):
-            queryset = queryset.filter(user__organizations__in=kwargs.get('org_ids'))
+            queryset = queryset.filter(
+                user_id__in=User.objects.filter(organizations__in=kwargs.get('org_ids')).values('id')
+            )
 
         if kwargs.get('cohort_user_ids'):
             queryset = queryset.filter(user_id__in=kwargs.get('cohort_user_ids'))
@@ -309,16 +1102,193 @@ class StudentSocialEngagementScore(TimeStampedModel):
         return queryset
 
     @classmethod
-    def _calculate_course_average_engagement_score(cls, queryset, total_user_count):
+    def _calculate_course_average_engagement_score(cls, queryset, total_user_count, total_score=None):
         """
-        Helper method to calculate and return course average score from queryset.
+        Helper method to calculate and return course average score from queryset,
+        or from `total_score` if it is already known.
         """
-        aggregates = queryset.aggregate(Sum('score'))
-        total_score = aggregates['score__sum'] if aggregates['score__sum'] else 0
+        if total_score is None:
+            aggregates = queryset.aggregate(Sum('score'))
+            total_score = aggregates['score__sum'] if aggregates['score__sum'] else 0
         if total_score:
             return int(round(total_score / float(total_user_count)))
         return 0
 
+
+class CourseSocialEngagementAggregate(TimeStampedModel):
+    """
+    Running total of the engagement scores of the active enrolled users of a course,
+    maintained when ENABLE_SOCIAL_ENGAGEMENT_COURSE_AGGREGATES feature is enabled
+    """
+    course_id = CourseKeyField(max_length=255, unique=True)
+    total_score = models.BigIntegerField(default=0)
+
+    @classmethod
+    def apply_delta(cls, course_key, score_delta):
+        """
+        Adds the score change of an active enrolled user to the course total.
+        Should be called in the transaction of the write, after the write.
+        """
+        updated = cls.objects.filter(course_id=course_key).update(total_score=F('total_score') + score_delta)
+        if not updated:
+            # first write since the aggregate was enabled, start from the stored scores
+            cls.reconcile(course_key)
+
+    @classmethod
+    def reconcile(cls, course_key, repair=True):
+        """
+        Compares the running total of a course with a full SUM over the scores
+        of its active enrolled users, and repairs it unless `repair` is False.
+        A missing aggregate is created from the SUM, or left missing if `repair` is False.
+        Returns a dictionary with the drift of every total, empty if there is none.
+        """
+        queryset = StudentSocialEngagementScore._build_queryset(course_key)  # pylint: disable=protected-access
+        expected = queryset.aggregate(total_score=Sum('score'))
+        expected['total_score'] = expected['total_score'] or 0
+
+        if not repair:
+            aggregate = cls.objects.filter(course_id=course_key).first()
+            return {} if aggregate is None else cls._get_drift(aggregate, expected)
+
+        with transaction.atomic():
+            aggregate, created = cls.objects.select_for_update().get_or_create(
+                course_id=course_key,
+                defaults=expected,
+            )
+            drift = {} if created else cls._get_drift(aggregate, expected)
+            if drift:
+                cls.objects.filter(pk=aggregate.pk).update(**expected)
+
+        return drift
+
+    @classmethod
+    def _get_drift(cls, aggregate, expected):
+        """
+        Helper method to return the difference of every drifted total of the aggregate from the expected value.
+        """
+        return {
+            field: getattr(aggregate, field) - value
+            for field, value in expected.items()
+            if getattr(aggregate, field) != value
+        }
+
+
+class CourseSocialEngagementState(TimeStampedModel):
+    """
+    Watermarks of forum activity and score recomputes of a course, maintained when
+    ENABLE_SOCIAL_ENGAGEMENT_INCREMENTAL_RECOMPUTE feature is enabled
+    """
+    RECOMPUTE_RUNNING = 'running'
+    RECOMPUTE_COMPLETED = 'completed'
+    RECOMPUTE_FAILED = 'failed'
+    RECOMPUTE_STATUSES = (
+        (RECOMPUTE_RUNNING, 'Running'),
+        (RECOMPUTE_COMPLETED, 'Completed'),
+        (RECOMPUTE_FAILED, 'Failed'),
+    )
+
+    course_id = CourseKeyField(max_length=255, unique=True)
+    last_activity = models.DateTimeField(null=True, blank=True)
+    last_recompute = models.DateTimeField(null=True, blank=True)
+
+    # progress of a checkpointed recompute, maintained when
+    # ENABLE_SOCIAL_ENGAGEMENT_CHECKPOINTED_RECOMPUTE feature is enabled
+    recompute_status = models.CharField(max_length=16, choices=RECOMPUTE_STATUSES, null=True, blank=True)
+    recompute_snapshot_id = models.CharField(max_length=32, null=True, blank=True)
+    recompute_last_user_id = models.IntegerField(null=True, blank=True)
+
+    # set once the stored ranks of the course are built, maintained when
+    # ENABLE_SOCIAL_ENGAGEMENT_MATERIALIZED_RANK feature is enabled
+    ranks_built = models.BooleanField(default=False)
+
+    @classmethod
+    def record_activity(cls, course_key, when=None):
+        """
+        Moves the activity watermark of a course forward.
+        """
+        when = when or timezone.now()
+        updated = cls.objects.filter(course_id=course_key).update(last_activity=when, modified=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(course_id=course_key, defaults={'last_activity': when})
+
+    @classmethod
+    def lock_course(cls, course_key):
+        """
+        Locks the state row of a course until the end of the current transaction.
+        """
+        cls.objects.get_or_create(course_id=course_key)
+        return cls.objects.select_for_update().get(course_id=course_key)
+
+    @classmethod
+    def record_recompute(cls, course_key, started):
+        """
+        Moves the recompute watermark of a course to the time the recompute started,
+        so activity during the recompute is picked up by the next one.
+        """
+        cls.objects.update_or_create(course_id=course_key, defaults={'last_recompute': started})
+
+    @classmethod
+    def start_recompute(cls, course_key):
+        """
+        Marks a checkpointed recompute of a course as running.
+        Returns the state, holding the checkpoint of an unfinished previous recompute if there is one.
+        """
+        state, __ = cls.objects.get_or_create(course_id=course_key)
+        if state.recompute_status != cls.RECOMPUTE_RUNNING:
+            cls.objects.filter(pk=state.pk).update(recompute_status=cls.RECOMPUTE_RUNNING, modified=timezone.now())
+        return state
+
+    @classmethod
+    def record_checkpoint(cls, course_key, snapshot_id, last_user_id=None):
+        """
+        Stores the stats snapshot of a running recompute and the last user whose score is saved.
+        """
+        cls.objects.filter(course_id=course_key).update(
+            recompute_snapshot_id=snapshot_id,
+            recompute_last_user_id=last_user_id,
+            modified=timezone.now(),
+        )
+
+    @classmethod
+    def finish_recompute(cls, course_key, started, failed=False):
+        """
+        Marks a checkpointed recompute as completed, clearing its checkpoint, or as failed,
+        keeping the checkpoint for the next attempt.
+        """
+        if failed:
+            cls.objects.filter(course_id=course_key).update(
+                recompute_status=cls.RECOMPUTE_FAILED, modified=timezone.now()
+            )
+        else:
+            cls.objects.filter(course_id=course_key).update(
+                recompute_status=cls.RECOMPUTE_COMPLETED,
+                recompute_snapshot_id=None,
+                recompute_last_user_id=None,
+                last_recompute=started,
+                modified=timezone.now(),
+            )
+
+    @classmethod
+    def get_failed_course_ids(cls):
+        """
+        Returns ids of courses whose last checkpointed recompute failed.
+        """
+        return list(cls.objects.filter(recompute_status=cls.RECOMPUTE_FAILED).values_list('course_id', flat=True))
+
+    def is_dormant(self, now):
+        """
+        Returns True if the course had no activity since the last recompute and
+        the last recompute is not older than SOCIAL_ENGAGEMENT_FULL_RECOMPUTE_MAX_AGE.
+        """
+        max_age = timedelta(seconds=getattr(settings, 'SOCIAL_ENGAGEMENT_FULL_RECOMPUTE_MAX_AGE', 7 * 24 * 60 * 60))
+        # activity is recorded at most once per interval, so some may have happened after the watermark
+        interval = timedelta(seconds=getattr(settings, 'SOCIAL_ENGAGEMENT_ACTIVITY_RECORD_INTERVAL', 60))
+
+        if self.last_recompute is None or self.last_recompute < now - max_age:
+            return False
+        return self.last_activity is None or self.last_activity + interval < self.last_recompute
+
+
 class StudentSocialEngagementScoreHistory(TimeStampedModel):
     """
     A running audit trail for the StudentProgress model.  Listens for
@@ -329,6 +1299,17 @@ class StudentSocialEngagementScoreHistory(TimeStampedModel):
     score = models.IntegerField()
 
 
+@receiver(pre_save, sender=StudentSocialEngagementScore)
+def on_studentengagementscore_pre_save(sender, instance, **kwargs):
+    """
+    Remember the stored score, so the course aggregate can be updated by the difference
+    """
+    if is_course_aggregate_enabled() and instance.pk:
+        instance.presave_score = StudentSocialEngagementScore.objects.filter(
+            pk=instance.pk
+        ).values_list('score', flat=True).first()
+
+
 @receiver(post_save, sender=StudentSocialEngagementScore)
 def on_studentengagementscore_save(sender, instance, created, **kwargs):
     """
@@ -337,10 +1318,87 @@ def on_studentengagementscore_save(sender, instance, created, **kwargs):
     of the student's engagement score
     """
     instance.refresh_from_db()
-    invalid_user_data_cache('social', instance.course_id, instance.user.id)
+    presave_score = getattr(instance, 'presave_score', None) or 0
+    handle_engagement_score_written(instance, created, instance.score - presave_score)
+
+
+def handle_engagement_score_written(instance, created, score_delta):
+    """
+    Post-write hook of a single score entry, run by the save receiver and
+    explicitly by writes which bypass model signals. `instance` must hold
+    the stored values.
+    """
+    is_leaderboard_entry = None
+    if is_course_aggregate_enabled():
+        is_leaderboard_entry = StudentSocialEngagementScore.is_leaderboard_entry(instance)
+        if is_leaderboard_entry:
+            CourseSocialEngagementAggregate.apply_delta(instance.course_id, score_delta)
+    StudentSocialEngagementScore.update_entry_rankings(instance, is_leaderboard_entry)
+    invalid_user_data_cache('social', instance.course_id, instance.user_id)
     history_entry = StudentSocialEngagementScoreHistory(
-        user=instance.user,
+        user_id=instance.user_id,
         course_id=instance.course_id,
         score=instance.score
     )
     history_entry.save()
+
+
+def is_enrollment_tracking_enabled():
+    """
+    Returns True if course totals, stored ranks or the leaderboard index are maintained,
+    which follow activations and deactivations of enrollments.
+    """
+    return bool(is_course_aggregate_enabled() or is_materialized_rank_enabled() or get_leaderboard_index())
+
+
+def handle_enrollment_changed(course_key, user_id):
+    """
+    Moves a user's score in or out of the course total and rankings after
+    their enrollment in the course was activated or deactivated. Must only
+    be called once per transition, as the score is added to or subtracted
+    from the course total every time.
+    """
+    if is_enrollment_tracking_enabled():
+        # the enrollment of inactive users is not counted either way
+        _move_leaderboard_entry(course_key, user_id, lambda entry: entry.user.is_active)
+
+
+def handle_user_activation_changed(user_id):
+    """
+    Moves a user's scores in or out of the totals and rankings of their
+    courses after the user was activated or deactivated. Must only be
+    called once per transition, like `handle_enrollment_changed`.
+    """
+    if not is_enrollment_tracking_enabled():
+        return
+
+    course_keys = StudentSocialEngagementScore.objects.filter(user_id=user_id).values_list('course_id', flat=True)
+    for course_key in list(course_keys):
+        # inactive enrollments are not counted either way
+        _move_leaderboard_entry(
+            course_key, user_id, lambda entry: CourseEnrollment.is_enrolled(entry.user, entry.course_id)
+        )
+
+
+def _move_leaderboard_entry(course_key, user_id, is_counted):
+    """
+    Moves a user's score in or out of the course total and rankings after one
+    of the conditions of `_build_queryset` changed. The score is only added to or
+    subtracted from the course total if `is_counted(entry)`, i.e. the other
+    conditions hold, so the change moved the entry in or out of the leaderboard.
+    """
+    with transaction.atomic():
+        StudentSocialEngagementScore.lock_course_ranks(course_key)
+        entry = StudentSocialEngagementScore.objects.filter(
+            course_id__exact=course_key, user_id=user_id
+        ).select_related('user').first()
+        if entry is None:
+            return
+
+        is_leaderboard_entry = StudentSocialEngagementScore.is_leaderboard_entry(entry)
+        if is_course_aggregate_enabled() and is_counted(entry):
+            CourseSocialEngagementAggregate.apply_delta(
+                course_key, entry.score if is_leaderboard_entry else -entry.score
+            )
+        StudentSocialEngagementScore.update_entry_rankings(entry, is_leaderboard_entry)
+        invalid_user_data_cache('social', course_key, user_id)
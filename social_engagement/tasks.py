@@ -2,43 +2,305 @@
 This module has implementation of celery tasks for discussion forum use cases
 """
 import logging
-from datetime import datetime
+import time
+from collections import defaultdict
 
-import pytz
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
+from celery import chord
+from celery.exceptions import Retry
 from celery.task import task
 from opaque_keys.edx.keys import CourseKey
-from social_engagement.engagement import (get_social_metric_points,
+from openedx.core.djangoapps.django_comment_common.comment_client.utils import CommentClientRequestError
+from requests.exceptions import ConnectionError  # pylint: disable=redefined-builtin
+from social_engagement.buffer import get_engagement_buffer
+from social_engagement.course_schedule import is_course_closed
+from social_engagement.engagement import (_get_author_of_thread,
+                                          apply_user_engagement_changes,
+                                          finish_course_scores_shards,
+                                          get_course_social_stats_shards,
+                                          get_leaderboard_leaders,
+                                          get_social_metric_points,
+                                          get_stat_changes,
+                                          is_checkpointed_recompute_enabled,
+                                          is_sharded_recompute_enabled,
+                                          leaderboard_notification_batch,
+                                          save_course_scores_shard,
                                           update_course_engagement)
-from social_engagement.models import StudentSocialEngagementScore
+from social_engagement.models import CourseSocialEngagementState, StudentSocialEngagementScore
+from social_engagement.scoring import get_weights_hash
+from social_engagement.utils import (acquire_course_task_lock,
+                                     clear_course_task_request,
+                                     is_course_task_requested,
+                                     release_course_task_lock,
+                                     request_course_task)
 from xmodule.modulestore.django import modulestore
 
 log = logging.getLogger('edx.celery.task')
 
+# names of the course task locks
+RECOMPUTE_LOCK = 'recompute'
+DEFERRED_DELETION_LOCK = 'deferred_deletion'
+
 
 @task(
+    bind=True,
     name='lms.djangoapps.social_engagement.tasks.task_compute_social_scores_in_course',
     routing_key=settings.RECALCULATE_SOCIAL_ENGAGEMENT_ROUTING_KEY,
 )
-def task_compute_social_scores_in_course(course_id):
+def task_compute_social_scores_in_course(self, course_id, lock_token=None):
     """
     Task to compute social scores in course
+
+    The course lock taken by `enqueue_course_recompute` is passed as `lock_token`
+    and released when the task finishes, or by the chord callbacks of a sharded
+    recompute. Tasks enqueued without a token leave the course lock alone.
+    """
+    keep_lock = False
+    try:
+        keep_lock = _compute_social_scores_in_course(self, course_id, lock_token)
+    except Retry:
+        keep_lock = True
+        raise
+    finally:
+        if not keep_lock:
+            _release_course_recompute_lock(course_id, lock_token)
+
+
+def _compute_social_scores_in_course(task_instance, course_id, lock_token):
+    """
+    Compute social scores in course. Returns True if the work continues in other tasks.
     """
     course_key = CourseKey.from_string(course_id)
     course = modulestore().get_course(course_key, depth=None)
 
-    if course:
+    if course and is_sharded_recompute_enabled():
+        return _compute_social_scores_in_shards(course_key, lock_token)
+
+    elif course and is_checkpointed_recompute_enabled():
+        try:
+            score_update_count = update_course_engagement(
+                course_key,
+                compute_if_closed_course=True,
+                course_descriptor=course,
+                bulk=settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT_BULK_RECOMPUTE', False),
+                checkpointed=True,
+            )
+        except (CommentClientRequestError, ConnectionError) as error:
+            retries = task_instance.request.retries
+            max_retries = getattr(settings, 'SOCIAL_ENGAGEMENT_RECOMPUTE_MAX_RETRIES', 5)
+            if retries >= max_retries:
+                log.exception(error)
+                CourseSocialEngagementState.finish_recompute(course_key, None, failed=True)
+                return False
+            # the retried task resumes after the last checkpoint
+            countdown = getattr(settings, 'SOCIAL_ENGAGEMENT_RECOMPUTE_RETRY_DELAY', 60) * 2 ** retries
+            raise task_instance.retry(exc=error, countdown=countdown, max_retries=max_retries)
+        log.info("Social scores updated for %d users in course %s", score_update_count or 0, course_id)
+
+    elif course:
         score_update_count = update_course_engagement(
-            course_key, compute_if_closed_course=True, course_descriptor=course
+            course_key,
+            compute_if_closed_course=True,
+            course_descriptor=course,
+            bulk=settings.FEATURES.get('ENABLE_SOCIAL_ENGAGEMENT_BULK_RECOMPUTE', False),
         )
         log.info("Social scores updated for %d users in course %s", score_update_count or 0, course_id)
 
     else:
         log.info("Course with course id %s does not exist", course_id)
 
+    return False
+
+
+@task(
+    name='lms.djangoapps.social_engagement.tasks.task_compute_social_scores_shard',
+    routing_key=settings.RECALCULATE_SOCIAL_ENGAGEMENT_ROUTING_KEY,
+)
+def task_compute_social_scores_shard(course_id, shard):
+    """
+    Task to compute social scores of a shard of `[user_id, stats]` pairs in course
+    """
+    return save_course_scores_shard(CourseKey.from_string(course_id), [tuple(item) for item in shard])
+
+
+@task(
+    name='lms.djangoapps.social_engagement.tasks.task_finish_social_scores_shards',
+    routing_key=settings.RECALCULATE_SOCIAL_ENGAGEMENT_ROUTING_KEY,
+)
+def task_finish_social_scores_shards(shard_results, course_id, previous_leaders=None, started=None,
+                                     lock_token=None):
+    """
+    Task to refresh course data once all shards of a course are computed
+    """
+    try:
+        score_update_count = finish_course_scores_shards(
+            CourseKey.from_string(course_id),
+            shard_results,
+            previous_leaders=previous_leaders,
+            started=parse_datetime(started) if started else None,
+        )
+    finally:
+        _release_course_recompute_lock(course_id, lock_token)
+    log.info("Social scores updated for %d users in course %s", score_update_count, course_id)
+
+
+@task(
+    name='lms.djangoapps.social_engagement.tasks.task_release_course_recompute_lock',
+    routing_key=settings.RECALCULATE_SOCIAL_ENGAGEMENT_ROUTING_KEY,
+)
+def task_release_course_recompute_lock(course_id, lock_token):
+    """
+    Error callback of a sharded recompute, releasing the course lock when a shard failed
+    """
+    log.error("Computing social scores in shards failed for course %s", course_id)
+    _release_course_recompute_lock(course_id, lock_token)
+
+
+def _compute_social_scores_in_shards(course_key, lock_token):
+    """
+    Fetch stats of a course once and compute scores of its shards in parallel tasks.
+    Returns True if the shards were dispatched to other tasks.
+    """
+    course_id = str(course_key)
+    started = timezone.now()
+    previous_leaders = get_leaderboard_leaders(course_key) if settings.FEATURES.get('ENABLE_NOTIFICATIONS') else None
+
+    try:
+        shards = get_course_social_stats_shards(course_id)
+    except (CommentClientRequestError, ConnectionError) as error:
+        log.exception(error)
+        return False
+
+    if len(shards) <= 1:
+        shard_results = [save_course_scores_shard(course_key, shard) for shard in shards]
+        finish_course_scores_shards(course_key, shard_results, previous_leaders=previous_leaders, started=started)
+        return False
+
+    log.info("Computing social scores in course %s in %d shards", course_id, len(shards))
+    callback = task_finish_social_scores_shards.s(course_id, previous_leaders, started.isoformat(), lock_token)
+    chord(
+        task_compute_social_scores_shard.s(course_id, shard) for shard in shards
+    )(callback.on_error(task_release_course_recompute_lock.si(course_id, lock_token)))
+    return True
+
+
+@task(
+    bind=True,
+    max_retries=getattr(settings, 'SOCIAL_ENGAGEMENT_DEFERRED_DELETION_MAX_RETRIES', 10),
+    name='lms.djangoapps.social_engagement.tasks.task_apply_deferred_deletion',
+    routing_key=settings.RECALCULATE_SOCIAL_ENGAGEMENT_ROUTING_KEY,
+)
+def task_apply_deferred_deletion(self, course_id, post_id, lock_token=None):
+    """
+    Task to apply the decrements of threads and comments deleted in a course.
+
+    cs_comments_service no longer counts deleted posts, so the stats of the
+    course users are fetched again and changed scores are written with bulk
+    queries in a single transaction, under the course recompute lock.
+
+    The deletion lock taken by `enqueue_deferred_deletion` is passed as `lock_token`
+    and held until the task finishes. Deletions requested after the stats were fetched are applied
+    by another task. Waits for the recompute lock and errors of cs_comments_service
+    are retried with a backoff, up to SOCIAL_ENGAGEMENT_DEFERRED_DELETION_MAX_RETRIES
+    times in total. Failed tasks are not repeated, the next deletion or recompute of
+    the course applies their changes.
+    """
+    keep_lock = False
+    completed = False
+    try:
+        _apply_deferred_deletion(self, course_id, post_id)
+        completed = True
+    except Retry:
+        keep_lock = True
+        raise
+    finally:
+        if not keep_lock and lock_token:
+            release_course_task_lock(DEFERRED_DELETION_LOCK, course_id, lock_token)
+            if completed and is_course_task_requested(DEFERRED_DELETION_LOCK, course_id):
+                enqueue_deferred_deletion(course_id, post_id)
+
+
+def _apply_deferred_deletion(task_instance, course_id, post_id):
+    """
+    Compute social scores in course after a deletion, retrying on errors of cs_comments_service.
+    """
+    timeout = getattr(settings, 'SOCIAL_ENGAGEMENT_RECOMPUTE_LOCK_TIMEOUT', 2 * 60 * 60)
+    countdown = min(
+        getattr(settings, 'SOCIAL_ENGAGEMENT_RECOMPUTE_RETRY_DELAY', 60) * 2 ** task_instance.request.retries, timeout
+    )
+    recompute_lock_token = acquire_course_task_lock(RECOMPUTE_LOCK, course_id, timeout)
+    if not recompute_lock_token:
+        # a running recompute may have fetched the stats before the deletion
+        log.info("Deletion of post %s in course %s waits for a recompute of the course", post_id, course_id)
+        raise task_instance.retry(countdown=countdown)
+
+    try:
+        # deletions from now on need another run
+        clear_course_task_request(DEFERRED_DELETION_LOCK, course_id)
+        log.info("Applying deletion of post %s in course %s", post_id, course_id)
+        score_update_count = update_course_engagement(course_id, bulk=True, raise_forum_errors=True, atomic=True)
+    except (CommentClientRequestError, ConnectionError) as error:
+        log.exception(error)
+        raise task_instance.retry(exc=error, countdown=countdown)
+    finally:
+        _release_course_recompute_lock(course_id, recompute_lock_token)
+    log.info("Social scores updated for %d users in course %s", score_update_count or 0, course_id)
+
+
+def enqueue_deferred_deletion(course_id, post_id):
+    """
+    Enqueue a task applying a deletion, unless one is already pending for the course.
+    A task which is already running is repeated once it finishes.
+    """
+    timeout = getattr(settings, 'SOCIAL_ENGAGEMENT_DEFERRED_DELETION_LOCK_TIMEOUT', 2 * 60 * 60)
+    request_course_task(DEFERRED_DELETION_LOCK, course_id, timeout)
+    lock_token = acquire_course_task_lock(DEFERRED_DELETION_LOCK, course_id, timeout)
+    if not lock_token:
+        log.info("Deletion of post %s in course %s is applied by a pending task", post_id, course_id)
+        return
+
+    try:
+        task_apply_deferred_deletion.delay(course_id, post_id, lock_token=lock_token)
+    except Exception:
+        release_course_task_lock(DEFERRED_DELETION_LOCK, course_id, lock_token)
+        raise
+
+
+def enqueue_course_recompute(course_id, **options):
+    """
+    Enqueue a task computing social scores in course, unless one is already queued or running for it,
+    or one finished within SOCIAL_ENGAGEMENT_RECOMPUTE_DEBOUNCE seconds.
+    Returns True if a task was enqueued.
+    """
+    timeout = getattr(settings, 'SOCIAL_ENGAGEMENT_RECOMPUTE_LOCK_TIMEOUT', 2 * 60 * 60)
+    lock_token = acquire_course_task_lock(RECOMPUTE_LOCK, course_id, timeout)
+    if not lock_token:
+        log.info("Skipping course %s, social scores are already being computed", course_id)
+        return False
+
+    try:
+        task_compute_social_scores_in_course.apply_async((course_id,), {'lock_token': lock_token}, **options)
+    except Exception:
+        release_course_task_lock(RECOMPUTE_LOCK, course_id, lock_token)
+        raise
+    return True
+
+
+def _release_course_recompute_lock(course_id, lock_token):
+    """
+    Releases the course lock of a recompute if it is held with `lock_token`.
+    """
+    if lock_token:
+        release_course_task_lock(
+            RECOMPUTE_LOCK, course_id, lock_token, getattr(settings, 'SOCIAL_ENGAGEMENT_RECOMPUTE_DEBOUNCE', 0)
+        )
+
 
 @task(name='lms.djangoapps.social_engagement.tasks.task_update_user_engagement')
 def task_update_user_engagement(user_id, course_id, param, increment=True, items=1):
@@ -48,32 +310,179 @@ def task_update_user_engagement(user_id, course_id, param, increment=True, items
     :param param: `str` with stat that should be changed or
                   `dict[str, int]` (`stat: number_of_occurrences`) with the stats that should be changed
     """
-    factor = items if increment else -items
-    social_metric_points = get_social_metric_points()
     course_key = CourseKey.from_string(course_id)
 
     # Do not calculate engagement after course ends.
-    course_descriptor = modulestore().get_course(course_key)
-    if course_descriptor and course_descriptor.end and course_descriptor.end < datetime.now(pytz.UTC):
+    if is_course_closed(course_key):
+        return
+
+    _update_user_engagement(user_id, course_key, get_stat_changes(param, increment, items))
+
+
+@task(name='lms.djangoapps.social_engagement.tasks.task_update_users_engagement')
+def task_update_users_engagement(course_id, users_changes):
+    """
+    Save changes in stats and calculate scores of many users in a course.
+
+    :param users_changes: `dict[user_id, dict[str, int]]` (`user_id: {stat: delta}`) with signed changes of stats
+    """
+    course_key = CourseKey.from_string(course_id)
+
+    # Do not calculate engagement after course ends.
+    if is_course_closed(course_key):
         return
 
+    _update_users_engagement(course_key, users_changes)
+
+
+@task(name='lms.djangoapps.social_engagement.tasks.task_update_thread_author_engagement')
+def task_update_thread_author_engagement(thread_id, course_id, param, increment=True, items=1):
+    """
+    Resolve the author of a thread and save changes in their stats and score.
+    """
+    # IMPORTANT: `_get_author_of_thread` uses getattr, as
+    # otherwise the property will not get fetched
+    # from cs_comment_service
+    try:
+        thread_user_id = _get_author_of_thread(thread_id)
+    except (CommentClientRequestError, ConnectionError) as error:
+        log.exception(error)
+        return
+
+    if thread_user_id is None:
+        log.error("Author of thread with id: '{}' could not be found.".format(thread_id))
+        return
+
+    engagement_buffer = get_engagement_buffer()
+    if engagement_buffer:
+        buffer_engagement_changes(
+            engagement_buffer, int(thread_user_id), course_id, get_stat_changes(param, increment, items)
+        )
+    else:
+        task_update_user_engagement(int(thread_user_id), course_id, param, increment, items)
+
+
+def buffer_engagement_changes(engagement_buffer, user_id, course_id, changes):
+    """
+    Merge changes into the write-behind buffer and make sure a flush is scheduled.
+    """
+    pending_since, first = engagement_buffer.add(user_id, course_id, changes)
+
+    if first:
+        task_flush_engagement_buffer.apply_async(
+            countdown=getattr(settings, 'SOCIAL_ENGAGEMENT_WRITE_BUFFER_FLUSH_INTERVAL', 30)
+        )
+    elif time.time() - pending_since > getattr(settings, 'SOCIAL_ENGAGEMENT_WRITE_BUFFER_MAX_STALENESS', 300):
+        if engagement_buffer.request_flush():
+            task_flush_engagement_buffer.delay()
+
+
+@task(bind=True, name='lms.djangoapps.social_engagement.tasks.task_flush_engagement_buffer')
+def task_flush_engagement_buffer(self):
+    """
+    Apply all stat changes merged in the write-behind buffer.
+
+    Changes of a course which fail to apply are put back into the buffer, and
+    another flush is scheduled as long as changes are left in the buffer.
+    """
+    engagement_buffer = get_engagement_buffer()
+    if not engagement_buffer:
+        return
+
+    changes_by_course = defaultdict(dict)
+    for (user_id, course_id), changes in engagement_buffer.pop_all().items():
+        changes_by_course[course_id][user_id] = changes
+
+    for course_id, users_changes in changes_by_course.items():
+        course_key = CourseKey.from_string(course_id)
+        if is_course_closed(course_key):
+            continue
+
+        try:
+            _update_users_engagement(course_key, users_changes)
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Failed to flush buffered social engagement changes in course %s", course_id)
+            for user_id, changes in users_changes.items():
+                engagement_buffer.add(user_id, course_id, changes)
+        else:
+            log.info(
+                "Flushed buffered social engagement changes of %d users in course %s", len(users_changes), course_id
+            )
+
+    # eagerly run flushes apply changes as they are buffered, so they don't need to schedule more
+    if engagement_buffer.has_pending() and not self.request.is_eager:
+        self.apply_async(countdown=getattr(settings, 'SOCIAL_ENGAGEMENT_WRITE_BUFFER_FLUSH_INTERVAL', 30))
+
+
+def _update_users_engagement(course_key, users_changes):
+    """
+    Add signed changes (`user_id: {stat: delta}`) to the stats and scores of many users with bulk queries.
+    """
+    # user ids are strings after being serialized as task arguments
+    merged_changes = defaultdict(lambda: defaultdict(int))
+    for user_id, changes in users_changes.items():
+        for stat, delta in changes.items():
+            merged_changes[int(user_id)][stat] += delta
+    users_changes = {
+        user_id: {stat: delta for stat, delta in changes.items() if delta}
+        for user_id, changes in merged_changes.items()
+    }
+    users_changes = {user_id: changes for user_id, changes in users_changes.items() if changes}
+    if len(users_changes) == 1:
+        [(user_id, changes)] = users_changes.items()
+        _update_user_engagement(user_id, course_key, changes)
+        return
+
+    existing_user_ids = set(User.objects.filter(id__in=list(users_changes)).values_list('id', flat=True))
+    for user_id in set(users_changes) - existing_user_ids:
+        log.error("User with id: '{}' does not exist.".format(user_id))
+        del users_changes[user_id]
+    if not users_changes:
+        return
+
+    with leaderboard_notification_batch(course_key):
+        StudentSocialEngagementScore.bulk_apply_engagement_changes(
+            course_key, users_changes, get_social_metric_points()
+        )
+
+
+def _update_user_engagement(user_id, course_key, changes):
+    """
+    Add signed `changes` (`stat: delta`) to the user's stats and score.
+    """
+    changes = {stat: delta for stat, delta in changes.items() if delta}
+    if not changes:
+        return
+
+    if StudentSocialEngagementScore.supports_upsert():
+        try:
+            apply_user_engagement_changes(course_key, user_id, changes)
+        except IntegrityError:
+            # the upsert fails on the foreign key of a deleted user, which is only checked
+            # once it failed so the common case costs no extra query
+            if User.objects.filter(id=user_id).exists():
+                raise
+            log.error("User with id: '{}' does not exist.".format(user_id))
+        return
+
+    social_metric_points = get_social_metric_points()
+
     try:
         user = User.objects.get(id=user_id)
     except User.DoesNotExist:
         log.error("User with id: '{}' does not exist.".format(user_id))
     else:
-        score, _ = StudentSocialEngagementScore.objects.get_or_create(
-            user=user,
-            course_id=course_key,
-        )
-        if isinstance(param, dict):
+        # in one transaction with the course aggregate and rank updated by the save receivers
+        with transaction.atomic():
+            StudentSocialEngagementScore.lock_course_ranks(course_key)
+            score, _ = StudentSocialEngagementScore.objects.get_or_create(
+                user=user,
+                course_id=course_key,
+                defaults={'weights_hash': get_weights_hash(social_metric_points)},
+            )
             score_difference = 0
-            for key, value in param.items():
-                score_difference += social_metric_points.get(key, 0) * factor * value
-                setattr(score, key, F(key) + value * factor)
+            for key, value in changes.items():
+                score_difference += social_metric_points.get(key, 0) * value
+                setattr(score, key, F(key) + value)
             score.score = F('score') + score_difference
-        else:
-            score.score = F('score') + social_metric_points.get(param, 0) * factor
-            setattr(score, param, F(param) + factor)
-
-        score.save()
+            score.save()
@@ -8,18 +8,43 @@ from datetime import datetime, timedelta
 
 import pytz
 from django.conf import settings
-from django.db import IntegrityError
-from django.test.utils import override_settings
+from django.db import DatabaseError, IntegrityError, connection
+from django.test.utils import CaptureQueriesContext, override_settings
 
 import ddt
+from celery.exceptions import Retry
 from edx_notifications.lib.consumer import get_notifications_count_for_user
 from edx_notifications.startup import initialize as initialize_notifications
-from mock import patch
-from social_engagement.engagement import (_detail_results_factory,
+from mock import ANY, call, patch
+from openedx.core.djangoapps.django_comment_common.comment_client.utils import CommentClientRequestError
+from social_engagement.engagement import (_CommentTreeWalker,
+                                          _detail_results_factory,
                                           _get_details_for_deletion,
+                                          get_course_social_stats_shards,
+                                          get_involved_users_in_thread,
+                                          get_social_metric_points,
                                           update_course_engagement)
-from social_engagement.models import (StudentSocialEngagementScore,
+from social_engagement.handlers import (_decrement, _increment,
+                                        _increment_thread_author,
+                                        comment_deleted_signal_handler,
+                                        thread_signal_handler)
+from social_engagement.leaderboard import (InMemoryLeaderboardIndex,
+                                           get_leaderboard_index,
+                                           index_member)
+from social_engagement.models import (CourseSocialEngagementState,
+                                      StudentSocialEngagementScore,
                                       StudentSocialEngagementScoreHistory)
+from social_engagement.tasks import (DEFERRED_DELETION_LOCK, RECOMPUTE_LOCK,
+                                     enqueue_deferred_deletion,
+                                     task_apply_deferred_deletion,
+                                     task_compute_social_scores_in_course,
+                                     task_flush_engagement_buffer,
+                                     task_update_thread_author_engagement,
+                                     task_update_user_engagement,
+                                     task_update_users_engagement)
+from social_engagement.utils import (acquire_course_task_lock,
+                                     release_course_task_lock,
+                                     reset_local_state)
 from student.models import CourseEnrollment
 from student.roles import CourseObserverRole
 from student.tests.factories import UserFactory
@@ -47,6 +72,12 @@ class StudentEngagementTests(ModuleStoreTestCase):
 
     def setUp(self):
         super().setUp()
+        reset_local_state()
+        # leaderboard notifications are published on commit, which never comes in a test case
+        on_commit_patcher = patch('django.db.transaction.on_commit', side_effect=lambda func, using=None: func())
+        on_commit_patcher.start()
+        self.addCleanup(on_commit_patcher.stop)
+
         self.user = UserFactory()
         self.user2 = UserFactory()
         self.user_ids = (self.user.id, self.user2.id)
@@ -372,6 +403,722 @@ class StudentEngagementTests(ModuleStoreTestCase):
 
         self.assertEqual(len(data['queryset']), 2)
 
+    @override_settings(SOCIAL_ENGAGEMENT_BULK_BATCH_SIZE=1)
+    def test_calc_course_bulk(self):
+        """
+        Verifies that the bulk recompute creates and updates scores in chunks
+        """
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.user.id, 10)
+
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = ((str(user_id), self.DEFAULT_STATS) for user_id in self.user_ids)
+            score_update_count = update_course_engagement(self.course.id, bulk=True)
+
+        self.assertEqual(score_update_count, 2)
+        for user_id in self.user_ids:
+            self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, user_id), 85)
+            self.assertEqual(
+                StudentSocialEngagementScore.get_user_engagements_stats(self.course.id, user_id)['num_threads'],
+                1
+            )
+
+        self.assertEqual(
+            StudentSocialEngagementScoreHistory.objects.filter(
+                course_id=self.course.id,
+                user__id=self.user.id
+            ).count(),
+            2
+        )
+
+    @ddt.data(False, True)
+    def test_calc_course_skips_unchanged(self, bulk):
+        """
+        Verifies that recomputing unchanged stats does not write any rows
+        """
+        for expected_count in (2, 0):
+            with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+                mock_func.return_value = ((user_id, self.DEFAULT_STATS) for user_id in self.user_ids)
+                self.assertEqual(update_course_engagement(self.course.id, bulk=bulk), expected_count)
+
+        self.assertEqual(
+            StudentSocialEngagementScoreHistory.objects.filter(course_id=self.course.id).count(),
+            2
+        )
+
+        stats = dict(self.DEFAULT_STATS, num_upvotes=2)
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = ((self.user.id, stats), (self.user2.id, self.DEFAULT_STATS))
+            self.assertEqual(update_course_engagement(self.course.id, bulk=bulk), 1)
+
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user.id), 110)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_SOCIAL_ENGAGEMENT_SHARDED_RECOMPUTE': True})
+    @override_settings(SOCIAL_ENGAGEMENT_RECOMPUTE_SHARD_SIZE=1)
+    def test_calc_course_sharded(self):
+        """
+        Verifies that a course recompute split into shards saves the scores of all shards
+        """
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = ((str(user_id), self.DEFAULT_STATS) for user_id in self.user_ids)
+            self.assertEqual(
+                get_course_social_stats_shards(str(self.course.id)),
+                [[(user_id, self.DEFAULT_STATS)] for user_id in sorted(self.user_ids)]
+            )
+
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = ((user_id, self.DEFAULT_STATS) for user_id in self.user_ids)
+            task_compute_social_scores_in_course(str(self.course.id))
+
+        for user_id in self.user_ids:
+            self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, user_id), 85)
+        self.assertEqual(get_notifications_count_for_user(self.user.id), 1)
+
+        with override_settings(SOCIAL_ENGAGEMENT_RECOMPUTE_MAX_SHARDS=1):
+            with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+                mock_func.return_value = ((user_id, self.DEFAULT_STATS) for user_id in self.user_ids)
+                self.assertEqual(len(get_course_social_stats_shards(str(self.course.id))), 1)
+
+    @ddt.data(False, True)
+    @override_settings(SOCIAL_ENGAGEMENT_BULK_BATCH_SIZE=1)
+    def test_calc_course_checkpointed(self, bulk):
+        """
+        Verifies that a failed checkpointed recompute resumes after the last saved user with the same stats
+        """
+        first_user_id, second_user_id = sorted(self.user_ids)
+        bulk_save = StudentSocialEngagementScore.bulk_save_user_engagement_scores
+        save = StudentSocialEngagementScore.save_user_engagement_score
+
+        def _bulk_save_or_fail(course_key, user_scores, **kwargs):
+            if user_scores[0][0] == second_user_id:
+                raise DatabaseError('Connection lost')
+            return bulk_save(course_key, user_scores, **kwargs)
+
+        def _save_or_fail(course_key, user_id, *args):
+            if user_id == second_user_id:
+                raise DatabaseError('Connection lost')
+            return save(course_key, user_id, *args)
+
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func, \
+                patch.object(StudentSocialEngagementScore, 'bulk_save_user_engagement_scores',
+                             side_effect=_bulk_save_or_fail), \
+                patch.object(StudentSocialEngagementScore, 'save_user_engagement_score', side_effect=_save_or_fail):
+            mock_func.return_value = ((user_id, self.DEFAULT_STATS) for user_id in self.user_ids)
+            with self.assertRaises(DatabaseError):
+                update_course_engagement(self.course.id, bulk=bulk, checkpointed=True)
+
+        state = CourseSocialEngagementState.objects.get(course_id=self.course.id)
+        self.assertEqual(state.recompute_status, CourseSocialEngagementState.RECOMPUTE_FAILED)
+        self.assertEqual(state.recompute_last_user_id, first_user_id)
+        self.assertEqual(CourseSocialEngagementState.get_failed_course_ids(), [self.course.id])
+        self.assertIsNone(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, second_user_id))
+
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            self.assertEqual(update_course_engagement(self.course.id, bulk=bulk, checkpointed=True), 1)
+            self.assertFalse(mock_func.called)
+
+        state.refresh_from_db()
+        self.assertEqual(state.recompute_status, CourseSocialEngagementState.RECOMPUTE_COMPLETED)
+        self.assertIsNone(state.recompute_snapshot_id)
+
+    def test_calc_course_checkpointed_fetch_failure(self):
+        """
+        Verifies that a checkpointed recompute failing to fetch the stats is marked as failed
+        """
+        with patch('social_engagement.engagement._get_course_social_stats',
+                   side_effect=CommentClientRequestError('Service unavailable')):
+            with self.assertRaises(CommentClientRequestError):
+                update_course_engagement(self.course.id, checkpointed=True)
+
+        self.assertEqual(CourseSocialEngagementState.get_failed_course_ids(), [self.course.id])
+
+    @override_settings(SOCIAL_ENGAGEMENT_BULK_BATCH_SIZE=1)
+    def test_calc_course_checkpointed_notifications(self):
+        """
+        Verifies that a resumed recompute notifies users against the leaders from before it failed
+        """
+        first_user_id, second_user_id = sorted(self.user_ids)
+        save = StudentSocialEngagementScore.save_user_engagement_score
+
+        def _save_or_fail(course_key, user_id, *args):
+            if user_id == second_user_id:
+                raise DatabaseError('Connection lost')
+            return save(course_key, user_id, *args)
+
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func, \
+                patch.object(StudentSocialEngagementScore, 'save_user_engagement_score', side_effect=_save_or_fail):
+            mock_func.return_value = ((user_id, self.DEFAULT_STATS) for user_id in self.user_ids)
+            with self.assertRaises(DatabaseError):
+                update_course_engagement(self.course.id, checkpointed=True)
+        self.assertEqual(get_notifications_count_for_user(first_user_id), 0)
+
+        with patch('social_engagement.engagement._get_course_social_stats'):
+            update_course_engagement(self.course.id, checkpointed=True)
+
+        self.assertEqual(get_notifications_count_for_user(first_user_id), 1)
+        self.assertEqual(get_notifications_count_for_user(second_user_id), 1)
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, second_user_id), 85)
+
+    @ddt.data(False, True)
+    def test_calc_course_batch_notifications(self, bulk):
+        """
+        Verifies that a recompute notifies only users who newly entered the leaderboard
+        """
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.user.id, 10)
+        self.assertEqual(get_notifications_count_for_user(self.user.id), 1)
+
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func, \
+                patch.object(StudentSocialEngagementScore, 'get_user_leaderboard_position') as mock_position:
+            mock_func.return_value = ((user_id, self.DEFAULT_STATS) for user_id in self.user_ids)
+            update_course_engagement(self.course.id, bulk=bulk)
+
+        self.assertFalse(mock_position.called)
+        self.assertEqual(get_notifications_count_for_user(self.user.id), 1)
+        self.assertEqual(get_notifications_count_for_user(self.user2.id), 1)
+
+    @override_settings(SOCIAL_ENGAGEMENT_LEADERBOARD_INDEX={
+        'BACKEND': 'social_engagement.leaderboard.InMemoryLeaderboardIndex',
+        'OPTIONS': {'name': 'test_leaderboard_index'},
+    })
+    def test_leaderboard_index(self):
+        """
+        Verifies that leaderboard reads are answered from the synced index once it is built
+        """
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.user.id, 10)
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.user2.id, 20)
+
+        # updates alone don't build the index, the first read falls back to the database and builds it
+        self.assertFalse(get_leaderboard_index().is_built(self.course.id))
+        data = StudentSocialEngagementScore.generate_leaderboard(self.course.id, count=2)
+        self.assertEqual([row['user__id'] for row in data['queryset']], [self.user2.id, self.user.id])
+        self.assertTrue(get_leaderboard_index().is_built(self.course.id))
+
+        build_queryset = StudentSocialEngagementScore._build_queryset
+        with patch.object(StudentSocialEngagementScore, '_build_queryset', wraps=build_queryset) as mock_build:
+            position = StudentSocialEngagementScore.get_user_leaderboard_position(self.course.id, user_id=self.user.id)
+            self.assertFalse(mock_build.called)
+        self.assertEqual(position, {'score': 10, 'position': 2})
+
+        position = StudentSocialEngagementScore.get_user_leaderboard_position(
+            self.course.id,
+            user_id=self.user.id,
+            exclude_users=[self.user2.id],
+        )
+        self.assertEqual(position['position'], 1)
+
+        data = StudentSocialEngagementScore.generate_leaderboard(self.course.id, count=1)
+        self.assertEqual([row['user__id'] for row in data['queryset']], [self.user2.id])
+
+        # unenrolled users are dropped from the index
+        CourseEnrollment.unenroll(self.user2, self.course.id)
+        position = StudentSocialEngagementScore.get_user_leaderboard_position(self.course.id, user_id=self.user.id)
+        self.assertEqual(position['position'], 1)
+        self.assertIsNone(get_leaderboard_index().rank(self.course.id, self.user2.id))
+
+        CourseEnrollment.enroll(self.user2, self.course.id)
+        self.assertEqual(get_leaderboard_index().rank(self.course.id, self.user2.id), 0)
+
+    def test_leaderboard_index_member_order(self):
+        """
+        Verifies that sorted set members rank ties like `LEADERBOARD_ORDERING`
+        """
+        users = [self.user, self.user2]
+        for __ in range(4):
+            user = UserFactory()
+            CourseEnrollment.enroll(user, self.course.id)
+            users.append(user)
+        for score, user in zip((10, 20, 10, 20, 10, 30), users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+
+        # ties on score and modification time, and modifications a microsecond apart
+        queryset = StudentSocialEngagementScore.objects.filter(course_id=self.course.id)
+        modified = datetime.now(pytz.UTC).replace(microsecond=500)
+        queryset.filter(user_id__in=[users[0].id, users[1].id, users[3].id]).update(modified=modified)
+        queryset.filter(user_id=users[2].id).update(modified=modified - timedelta(microseconds=1))
+        queryset.filter(user_id=users[4].id).update(modified=modified + timedelta(microseconds=1))
+
+        expected = list(queryset.order_by(*StudentSocialEngagementScore.LEADERBOARD_ORDERING).values_list(
+            'user_id', flat=True
+        ))
+        # ZREVRANGE order: score descending, then member in reverse lexicographic order
+        rows = sorted(
+            queryset.values_list('score', 'user_id', 'modified'),
+            key=lambda row: (row[0], index_member(row[1], row[2])),
+            reverse=True,
+        )
+        self.assertEqual([user_id for __, user_id, __ in rows], expected)
+
+        leaderboard_index = InMemoryLeaderboardIndex()
+        leaderboard_index.replace(self.course.id, queryset.values_list('user_id', 'score', 'modified'))
+        self.assertEqual(leaderboard_index.top(self.course.id, len(users)), expected)
+
+    def test_get_users_leaderboard_positions(self):
+        """
+        Verifies that batch position lookup matches single lookups and respects filters
+        """
+        user3 = UserFactory()
+        CourseEnrollment.enroll(user3, self.course.id)
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.user.id, 10)
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.user2.id, 20)
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user3.id, 10)
+
+        user_ids = [self.user.id, self.user2.id, user3.id]
+        positions = StudentSocialEngagementScore.get_users_leaderboard_positions(self.course.id, user_ids)
+        self.assertEqual(
+            positions,
+            {
+                self.user.id: {'score': 10, 'position': 2},
+                self.user2.id: {'score': 20, 'position': 1},
+                user3.id: {'score': 10, 'position': 3},
+            }
+        )
+        for user_id in user_ids:
+            self.assertEqual(
+                StudentSocialEngagementScore.get_user_leaderboard_position(self.course.id, user_id=user_id),
+                positions[user_id]
+            )
+
+        positions = StudentSocialEngagementScore.get_users_leaderboard_positions(
+            self.course.id,
+            user_ids + [UserFactory().id],
+            cohort_user_ids=[self.user.id, user3.id],
+        )
+        self.assertEqual(positions[self.user.id]['position'], 1)
+        self.assertEqual(positions[user3.id]['position'], 2)
+        self.assertEqual(positions[self.user2.id], {'score': 20, 'position': 1})
+        self.assertEqual(len(positions), 4)
+
+    def test_users_leaderboard_positions_outside_leaderboard(self):
+        """
+        Verifies that batch and single lookups agree for excluded, unenrolled and unscored users
+        """
+        unenrolled_user = UserFactory()
+        unscored_user = UserFactory()
+        CourseEnrollment.enroll(unscored_user, self.course.id)
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.user.id, 10)
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.user2.id, 20)
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, unenrolled_user.id, 15)
+
+        user_ids = [self.user.id, self.user2.id, unenrolled_user.id, unscored_user.id]
+        positions = StudentSocialEngagementScore.get_users_leaderboard_positions(
+            self.course.id, user_ids, exclude_users=[self.user2.id]
+        )
+        self.assertEqual(positions[self.user2.id], {'score': 20, 'position': 1})
+        self.assertEqual(positions[unenrolled_user.id], {'score': 15, 'position': 1})
+        self.assertEqual(positions[unscored_user.id], {'score': 0, 'position': 0})
+        for user_id in user_ids:
+            self.assertEqual(
+                StudentSocialEngagementScore.get_user_leaderboard_position(
+                    self.course.id, user_id=user_id, exclude_users=[self.user2.id]
+                ),
+                positions[user_id]
+            )
+
+    def test_get_leaderboard_page(self):
+        """
+        Verifies that paging with cursors walks the whole leaderboard in order
+        """
+        users = [self.user, self.user2]
+        for __ in range(3):
+            user = UserFactory()
+            CourseEnrollment.enroll(user, self.course.id)
+            users.append(user)
+        for score, user in zip((10, 50, 30, 30, 20), users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+
+        page = StudentSocialEngagementScore.get_leaderboard_page(self.course.id, page_size=2)
+        self.assertEqual([row['user__id'] for row in page['results']], [users[1].id, users[2].id])
+
+        # a score change of an already listed user does not shift the next page
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, users[1].id, 5)
+
+        user_ids = []
+        while page['next_cursor']:
+            page = StudentSocialEngagementScore.get_leaderboard_page(
+                self.course.id, cursor=page['next_cursor'], page_size=2
+            )
+            user_ids.extend(row['user__id'] for row in page['results'])
+        self.assertEqual(user_ids, [users[3].id, users[4].id, users[0].id, users[1].id])
+
+        page = StudentSocialEngagementScore.get_leaderboard_page(
+            self.course.id, page_size=10, exclude_users=[users[1].id]
+        )
+        self.assertEqual(len(page['results']), 4)
+        self.assertIsNone(page['next_cursor'])
+
+    @override_settings(SOCIAL_ENGAGEMENT_WRITE_BUFFER={
+        'BACKEND': 'social_engagement.buffer.InMemoryEngagementBuffer',
+        'OPTIONS': {'name': 'test_write_buffer'},
+    })
+    def test_write_buffer(self):
+        """
+        Verifies that buffered signal changes are merged and applied by a single flush
+        """
+        course_id = str(self.course.id)
+        with patch.object(task_flush_engagement_buffer, 'apply_async') as mock_schedule, \
+                patch('social_engagement.handlers.task_update_user_engagement') as mock_update:
+            _increment(self.user.id, course_id, 'num_upvotes')
+            _increment(self.user.id, course_id, 'num_upvotes')
+            _increment(self.user2.id, course_id, 'num_threads')
+            _decrement(self.user.id, course_id, {'num_upvotes': 1, 'num_threads': 1})
+
+        self.assertEqual(mock_schedule.call_count, 1)
+        self.assertFalse(mock_update.delay.called)
+
+        task_flush_engagement_buffer()
+
+        self.assertEqual(
+            StudentSocialEngagementScore.get_user_engagements_stats(self.course.id, self.user.id)['num_upvotes'],
+            1
+        )
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user.id), 15)
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user2.id), 10)
+
+        # a second flush has nothing left to apply
+        task_flush_engagement_buffer()
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user.id), 15)
+
+    @override_settings(SOCIAL_ENGAGEMENT_WRITE_BUFFER={
+        'BACKEND': 'social_engagement.buffer.InMemoryEngagementBuffer',
+        'OPTIONS': {'name': 'test_write_buffer_failure'},
+    })
+    def test_write_buffer_failed_flush(self):
+        """
+        Verifies that changes failing to apply are kept in the buffer and flushed again later
+        """
+        course_id = str(self.course.id)
+        with patch.object(task_flush_engagement_buffer, 'apply_async'):
+            _increment(self.user.id, course_id, 'num_upvotes')
+            _increment(self.user2.id, course_id, 'num_threads')
+
+        with patch('social_engagement.tasks._update_users_engagement', side_effect=DatabaseError), \
+                patch.object(task_flush_engagement_buffer, 'apply_async') as mock_schedule:
+            task_flush_engagement_buffer()
+        self.assertEqual(mock_schedule.call_count, 1)
+        self.assertIsNone(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user.id))
+
+        with patch.object(task_flush_engagement_buffer, 'apply_async') as mock_schedule:
+            task_flush_engagement_buffer()
+        self.assertFalse(mock_schedule.called)
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user.id), 25)
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user2.id), 10)
+
+    @override_settings(SOCIAL_ENGAGEMENT_WRITE_BUFFER={
+        'BACKEND': 'social_engagement.buffer.InMemoryEngagementBuffer',
+        'OPTIONS': {'name': 'test_write_buffer_thread_author'},
+    })
+    @patch('social_engagement.engagement.cc.Thread.find')
+    def test_write_buffer_thread_author(self, mock_find):
+        """
+        Verifies that changes of thread authors looked up by a task are buffered as well
+        """
+        mock_find.return_value.user_id = str(self.user2.id)
+        with patch.object(task_flush_engagement_buffer, 'apply_async') as mock_schedule, \
+                patch('social_engagement.tasks.task_update_user_engagement') as mock_update:
+            task_update_thread_author_engagement('thread-1', str(self.course.id), 'num_comments_generated')
+            task_update_thread_author_engagement('thread-1', str(self.course.id), 'num_comments_generated')
+        self.assertEqual(mock_schedule.call_count, 1)
+        self.assertFalse(mock_update.called)
+
+        task_flush_engagement_buffer()
+        stats = StudentSocialEngagementScore.get_user_engagements_stats(self.course.id, self.user2.id)
+        self.assertEqual(stats['num_comments_generated'], 2)
+
+    @ddt.data(True, False)
+    def test_update_user_engagement_upsert(self, supports_upsert):
+        """
+        Verifies that single-statement upserts and the ORM fallback apply the same changes
+        """
+        if supports_upsert and not StudentSocialEngagementScore.supports_upsert():
+            self.skipTest('Database does not support upserts')
+
+        course_id = str(self.course.id)
+        with patch.object(StudentSocialEngagementScore, 'supports_upsert', return_value=supports_upsert):
+            task_update_user_engagement(self.user.id, course_id, 'num_upvotes')
+            task_update_user_engagement(self.user.id, course_id, {'num_threads': 2, 'num_upvotes': 1}, items=2)
+            task_update_user_engagement(self.user.id, course_id, 'num_upvotes', increment=False)
+
+        stats = StudentSocialEngagementScore.get_user_engagements_stats(self.course.id, self.user.id)
+        self.assertEqual(stats['num_upvotes'], 2)
+        self.assertEqual(stats['num_threads'], 4)
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user.id), 90)
+        self.assertEqual(
+            StudentSocialEngagementScoreHistory.objects.filter(course_id=self.course.id, user__id=self.user.id).count(),
+            3 if supports_upsert else 4
+        )
+        self.assertEqual(get_notifications_count_for_user(self.user.id), 1)
+
+    def test_upsert_updates_without_insert(self):
+        """
+        Verifies that changes of an existing entry are applied without an INSERT
+        """
+        if not StudentSocialEngagementScore.supports_upsert():
+            self.skipTest('Database does not support upserts')
+
+        StudentSocialEngagementScore.upsert_engagement_changes(self.course.id, self.user.id, {'num_threads': 1}, 10)
+        with CaptureQueriesContext(connection) as queries:
+            StudentSocialEngagementScore.upsert_engagement_changes(self.course.id, self.user.id, {'num_threads': 2}, 20)
+
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('INSERT')])
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user.id), 30)
+        stats = StudentSocialEngagementScore.get_user_engagements_stats(self.course.id, self.user.id)
+        self.assertEqual(stats['num_threads'], 3)
+
+    def test_upsert_integrity_errors(self):
+        """
+        Verifies that only upserts failing for a deleted user are dropped
+        """
+        course_id = str(self.course.id)
+        with patch.object(StudentSocialEngagementScore, 'supports_upsert', return_value=True), \
+                patch('social_engagement.tasks.apply_user_engagement_changes') as mock_apply:
+            mock_apply.side_effect = IntegrityError('FOREIGN KEY constraint failed')
+            task_update_user_engagement(self.user.id + 1000, course_id, 'num_upvotes')
+
+            mock_apply.side_effect = IntegrityError('Duplicate entry')
+            with self.assertRaises(IntegrityError):
+                task_update_user_engagement(self.user.id, course_id, 'num_upvotes')
+
+    def test_closed_course_events_dropped(self):
+        """
+        Verifies that events of closed courses are discarded before a task is enqueued
+        """
+        closed_course = CourseFactory.create(
+            org='closed',
+            course='course',
+            run='run',
+            end=datetime.now(pytz.UTC) - timedelta(days=1),
+        )
+
+        with patch('social_engagement.handlers.task_update_user_engagement') as mock_update:
+            _increment(self.user.id, str(closed_course.id), 'num_upvotes')
+            # the course end is cached after the first lookup
+            with self.assertNumQueries(0):
+                _increment(self.user.id, str(closed_course.id), 'num_upvotes')
+            self.assertFalse(mock_update.delay.called)
+
+            _increment(self.user.id, str(self.course.id), 'num_upvotes')
+            self.assertEqual(mock_update.delay.call_count, 1)
+
+    def test_invalid_course_id_events_dropped(self):
+        """
+        Verifies that events with an invalid course id are discarded before a task is enqueued
+        """
+        with patch('social_engagement.handlers.task_update_user_engagement') as mock_update, \
+                patch('social_engagement.handlers.task_update_thread_author_engagement') as mock_author_task:
+            _increment(self.user.id, 'not a course id', 'num_upvotes')
+            _decrement(self.user.id, 'not a course id', 'num_upvotes')
+            _increment_thread_author('thread-1', 'not a course id', 'num_comments_generated')
+            self.assertFalse(mock_update.delay.called)
+            self.assertFalse(mock_author_task.delay.called)
+
+    @patch('social_engagement.engagement.cc.Thread.find')
+    def test_thread_author_resolved_in_task(self, mock_find):
+        """
+        Verifies that the thread author is looked up by a task and cached for later comments
+        """
+        mock_find.return_value.user_id = str(self.user2.id)
+        course_id = str(self.course.id)
+
+        with patch('social_engagement.handlers.task_update_thread_author_engagement') as mock_author_task:
+            _increment_thread_author('thread-1', course_id, 'num_comments_generated')
+            mock_author_task.delay.assert_called_once_with('thread-1', course_id, 'num_comments_generated')
+        self.assertFalse(mock_find.called)
+
+        task_update_thread_author_engagement('thread-1', course_id, 'num_comments_generated')
+        task_update_thread_author_engagement('thread-1', course_id, 'num_comments_generated')
+        self.assertEqual(mock_find.call_count, 1)
+
+        with patch('social_engagement.handlers.task_update_user_engagement') as mock_update:
+            _increment_thread_author('thread-1', course_id, 'num_comments_generated')
+            mock_update.delay.assert_called_once_with(self.user2.id, course_id, 'num_comments_generated', True, 1)
+
+        stats = StudentSocialEngagementScore.get_user_engagements_stats(self.course.id, self.user2.id)
+        self.assertEqual(stats['num_comments_generated'], 2)
+
+    def test_update_users_engagement(self):
+        """
+        Verifies that decrements of users involved in a deleted thread are applied by one batch task
+        """
+        course_id = str(self.course.id)
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = ((user_id, self.DEFAULT_STATS) for user_id in self.user_ids)
+            update_course_engagement(self.course.id)
+
+        involved_users = {
+            str(self.user.id): {'num_threads': 1, 'num_comments_generated': 1},
+            str(self.user2.id): {'num_comments': 1, 'num_upvotes': 0},
+        }
+        post = self.MockData(id='thread-1', course_id=course_id)
+        with patch('social_engagement.handlers.task_update_users_engagement') as mock_task:
+            thread_signal_handler(None, post=post, involved_users=involved_users)
+            mock_task.delay.assert_called_once_with(course_id, {
+                str(self.user.id): {'num_threads': -1, 'num_comments_generated': -1},
+                str(self.user2.id): {'num_comments': -1, 'num_upvotes': 0},
+            })
+            users_changes = mock_task.delay.call_args[0][1]
+
+        task_update_users_engagement(course_id, users_changes)
+
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user.id), 60)
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user2.id), 70)
+        stats = StudentSocialEngagementScore.get_user_engagements_stats(self.course.id, self.user2.id)
+        self.assertEqual((stats['num_comments'], stats['num_upvotes']), (0, 1))
+
+    @patch.dict(settings.FEATURES, {'ENABLE_SOCIAL_ENGAGEMENT_MATERIALIZED_RANK': True})
+    @override_settings(SOCIAL_ENGAGEMENT_LEADERBOARD_INDEX={
+        'BACKEND': 'social_engagement.leaderboard.InMemoryLeaderboardIndex',
+        'OPTIONS': {'name': 'test_bulk_apply_rankings'},
+    })
+    def test_bulk_apply_updates_changed_rankings(self):
+        """
+        Verifies that batched changes move only the changed users in the stored ranks and the index
+        """
+        users = [self.user, self.user2]
+        for __ in range(3):
+            user = UserFactory()
+            CourseEnrollment.enroll(user, self.course.id)
+            users.append(user)
+        for score, user in zip((10, 20, 30, 40, 50), users):
+            StudentSocialEngagementScore.save_user_engagement_score(self.course.id, user.id, score)
+
+        users_changes = {
+            users[0].id: {'num_threads': 5},
+            users[2].id: {'num_upvotes': 1},
+            users[4].id: {'num_threads': -4},
+        }
+        with patch.object(StudentSocialEngagementScore, 'refresh_course_rankings') as mock_refresh, \
+                CaptureQueriesContext(connection) as queries:
+            StudentSocialEngagementScore.bulk_apply_engagement_changes(
+                self.course.id, users_changes, get_social_metric_points(), batch_size=2
+            )
+        self.assertFalse(mock_refresh.called)
+        if StudentSocialEngagementScore._can_rank_in_database():  # pylint: disable=protected-access
+            # a single rank statement per chunk, however many users changed
+            rank_updates = [
+                query for query in queries.captured_queries
+                if query['sql'].startswith('UPDATE') and 'ROW_NUMBER' in query['sql']
+            ]
+            self.assertEqual(len(rank_updates), 2)
+
+        queryset = StudentSocialEngagementScore.objects.filter(course_id=self.course.id)
+        expected = [users[0].id, users[2].id, users[3].id, users[1].id, users[4].id]
+        self.assertEqual(get_leaderboard_index().top(self.course.id, 10), expected)
+        ranks = dict(queryset.values_list('user_id', 'rank'))
+        self.assertEqual(ranks, {user_id: rank for rank, user_id in enumerate(expected, start=1)})
+
+        self.assertEqual(StudentSocialEngagementScore.rebuild_course_ranks(self.course.id), 0)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_SOCIAL_ENGAGEMENT_DEFERRED_DELETION': True})
+    def test_deferred_deletion(self):
+        """
+        Verifies that deletions in deferred mode are applied by a single course recompute
+        """
+        course_id = str(self.course.id)
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = ((user_id, self.DEFAULT_STATS) for user_id in self.user_ids)
+            update_course_engagement(self.course.id)
+
+        post = self.MockData(id='thread-1', course_id=course_id)
+        self.assertEqual(get_involved_users_in_thread(None, post), {})
+
+        with patch('social_engagement.tasks.task_apply_deferred_deletion') as mock_task:
+            thread_signal_handler(None, post=post, involved_users={})
+            comment_deleted_signal_handler(None, post=self.MockData(id='comment-1', course_id=course_id),
+                                           involved_users={})
+            mock_task.delay.assert_called_once_with(course_id, 'thread-1', lock_token=ANY)
+
+        stats = dict(self.DEFAULT_STATS, num_threads=0, num_comments_generated=0)
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = ((self.user.id, stats), (self.user2.id, self.DEFAULT_STATS))
+            task_apply_deferred_deletion(course_id, 'thread-1', **mock_task.delay.call_args[1])
+
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user.id), 60)
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user2.id), 85)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_SOCIAL_ENGAGEMENT_DEFERRED_DELETION': True})
+    def test_deferred_deletion_during_run(self):
+        """
+        Verifies that a deletion during a deferred deletion run is applied by another
+        run, and that runs wait for a recompute of the course
+        """
+        course_id = str(self.course.id)
+        self.addCleanup(release_course_task_lock, DEFERRED_DELETION_LOCK, course_id)
+
+        def get_stats_and_delete(slash_course_id):  # pylint: disable=unused-argument
+            enqueue_deferred_deletion(course_id, 'thread-2')
+            return iter([(self.user.id, self.DEFAULT_STATS)])
+
+        with patch('social_engagement.engagement._get_course_social_stats', side_effect=get_stats_and_delete), \
+                patch.object(task_apply_deferred_deletion, 'delay') as mock_delay:
+            enqueue_deferred_deletion(course_id, 'thread-1')
+            task_apply_deferred_deletion(course_id, 'thread-1', **mock_delay.call_args[1])
+            self.assertEqual(mock_delay.call_args_list, [call(course_id, 'thread-1', lock_token=ANY)] * 2)
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user.id), 85)
+
+        acquire_course_task_lock(RECOMPUTE_LOCK, course_id, 60)
+        self.addCleanup(release_course_task_lock, RECOMPUTE_LOCK, course_id)
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            with self.assertRaises(Retry):
+                task_apply_deferred_deletion(course_id, 'thread-1')
+            self.assertFalse(mock_func.called)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_SOCIAL_ENGAGEMENT_DEFERRED_DELETION': True})
+    @override_settings(SOCIAL_ENGAGEMENT_BULK_BATCH_SIZE=1)
+    def test_deferred_deletion_failure(self):
+        """
+        Verifies that a failed deferred deletion run writes no scores and is not repeated
+        """
+        course_id = str(self.course.id)
+        self.addCleanup(release_course_task_lock, DEFERRED_DELETION_LOCK, course_id)
+        with patch('social_engagement.engagement._get_course_social_stats') as mock_func:
+            mock_func.return_value = ((user_id, self.DEFAULT_STATS) for user_id in self.user_ids)
+            update_course_engagement(self.course.id)
+
+        def get_stats_and_delete(slash_course_id):  # pylint: disable=unused-argument
+            enqueue_deferred_deletion(course_id, 'thread-2')
+            return iter([(self.user.id, {}), (self.user2.id, {})])
+
+        bulk_save_chunk = StudentSocialEngagementScore._bulk_save_chunk
+        saved_chunks = []
+
+        def save_chunk_and_fail(*args):
+            # the second chunk fails after the first one was written
+            if saved_chunks:
+                raise DatabaseError('Lost connection')
+            saved_chunks.append(args)
+            return bulk_save_chunk(*args)
+
+        with patch('social_engagement.engagement._get_course_social_stats', side_effect=get_stats_and_delete), \
+                patch.object(StudentSocialEngagementScore, '_bulk_save_chunk', side_effect=save_chunk_and_fail), \
+                patch.object(task_apply_deferred_deletion, 'delay') as mock_delay:
+            enqueue_deferred_deletion(course_id, 'thread-1')
+            with self.assertRaises(DatabaseError):
+                task_apply_deferred_deletion(course_id, 'thread-1', **mock_delay.call_args[1])
+            self.assertEqual(mock_delay.call_args_list, [call(course_id, 'thread-1', lock_token=ANY)])
+
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user.id), 85)
+        self.assertEqual(StudentSocialEngagementScore.get_user_engagement_score(self.course.id, self.user2.id), 85)
+
+    @ddt.data('top', 'above', 'tied')
+    def test_leaderboard_queries_use_score_index(self, query):
+        """
+        Verifies that leaderboard ordering and position counts are answered from the score index
+        """
+        if connection.vendor not in ('sqlite', 'mysql'):
+            self.skipTest('Query plan is only checked on SQLite and MySQL')
+
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.user.id, 10)
+        StudentSocialEngagementScore.save_user_engagement_score(self.course.id, self.user2.id, 20)
+        entry = StudentSocialEngagementScore.objects.get(course_id=self.course.id, user_id=self.user.id)
+
+        queryset = StudentSocialEngagementScore._build_queryset(self.course.id, exclude_users=[self.user2.id])
+        queryset = {
+            'top': queryset.order_by('-score', 'modified')[:3],
+            'above': queryset.filter(score__gt=entry.score).values('id'),
+            'tied': queryset.filter(score=entry.score, modified__lt=entry.modified).values('id'),
+        }[query]
+
+        self.assertIn('social_engagement_score_idx', queryset.explain())
+
     @ddt.data(ModuleStoreEnum.Type.split, ModuleStoreEnum.Type.mongo)
     def test_all_courses(self, store):
         """
@@ -604,3 +1351,78 @@ class StudentEngagementTests(ModuleStoreTestCase):
 
                 results = _get_details_for_deletion(None, None)
                 self.assertEqual(results, expected)
+
+    def _mock_comment_pages(self):
+        """
+        Returns mocked responses of a two page thread with four comments, each of them with one reply.
+        """
+        def _page(count, num_pages, comments):
+            response = self.MockResponse()
+            response.data = {
+                'pagination': {'count': count, 'num_pages': num_pages, 'next': None},
+                'results': [
+                    self.MockData(**{
+                        'id': comment_id,
+                        'author': user_id,
+                        'vote_count': 1,
+                        'child_count': 1 if comment_id.startswith('parent') else 0,
+                        'serializer': self.MockSerializer(user_id, 0),
+                    })
+                    for comment_id, user_id in comments
+                ],
+            }
+            return response
+
+        responses = {
+            (None, 1): _page(4, 2, [('parent-1', self.user.id), ('parent-2', self.user.id)]),
+            (None, 2): _page(4, 2, [('parent-3', self.user2.id), ('parent-4', self.user2.id)]),
+        }
+        for index in range(1, 5):
+            responses[('parent-{}'.format(index), 1)] = _page(1, 1, [('reply-{}'.format(index), self.user2.id)])
+        return responses
+
+    @override_settings(SOCIAL_ENGAGEMENT_DELETION_FETCH_WORKERS=4)
+    def test_get_details_for_deletion_concurrent_pages(self):
+        """
+        Test that pages and reply subtrees fetched concurrently are merged like sequential ones.
+        """
+        responses = self._mock_comment_pages()
+
+        expected = _detail_results_factory()
+        expected['replies'] = 4
+        expected['all_comments'] = 8
+        expected['users'][self.user.id]['num_comments'] = 2
+        expected['users'][self.user.id]['num_upvotes'] = 2
+        expected['users'][self.user2.id]['num_comments'] = 2
+        expected['users'][self.user2.id]['num_replies'] = 4
+        expected['users'][self.user2.id]['num_upvotes'] = 6
+
+        with patch('social_engagement.engagement._get_request') as mock_func:
+            mock_func.side_effect = lambda request, params: params
+            with patch('lms.djangoapps.discussion.rest_api.views.CommentViewSet.retrieve') as mock_func2:
+                mock_func2.side_effect = lambda request, comment_id: responses[(comment_id, request['page'])]
+
+                results = _get_details_for_deletion(None, None)
+                self.assertEqual(results, expected)
+                self.assertEqual(mock_func2.call_count, 6)
+
+    @override_settings(SOCIAL_ENGAGEMENT_DELETION_MAX_PAGES=3)
+    def test_comment_tree_walk_page_cap(self):
+        """
+        Test that the comment tree walk stops fetching pages at the configured cap.
+        """
+        responses = self._mock_comment_pages()
+
+        with patch('social_engagement.engagement._get_request') as mock_func:
+            mock_func.side_effect = lambda request, params: params
+            with patch('lms.djangoapps.discussion.rest_api.views.CommentViewSet.retrieve') as mock_func2:
+                mock_func2.side_effect = lambda request, comment_id: responses[(comment_id, request['page'])]
+
+                walker = _CommentTreeWalker(None)
+                users = set()
+                for __, __, response in walker.walk():
+                    users.update(comment['author'] for comment in response.data['results'])
+
+        self.assertEqual(mock_func2.call_count, 3)
+        self.assertEqual((walker.pages_fetched, walker.nodes_visited, walker.truncated), (3, 5, True))
+        self.assertEqual(users, {self.user.id, self.user2.id})
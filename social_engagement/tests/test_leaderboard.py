@@ -0,0 +1,85 @@
+"""
+Tests for the social engagement leaderboard index
+"""
+from datetime import datetime, timedelta
+
+import pytz
+from django.test import TestCase
+
+from social_engagement.leaderboard import InMemoryLeaderboardIndex, index_member, parse_index_member
+
+
+class InMemoryLeaderboardIndexTests(TestCase):
+    """ Test suite for InMemoryLeaderboardIndex """
+
+    course_id = 'course-v1:foo+bar+baz'
+
+    def setUp(self):
+        super().setUp()
+        self.now = datetime.now(pytz.UTC)
+        self.index = InMemoryLeaderboardIndex()
+
+    def test_index_member_ordering(self):
+        """
+        Verify that members sort in reverse by earlier modification, then by lower user id
+        """
+        earlier = self.now - timedelta(microseconds=1)
+        self.assertGreater(index_member(2, earlier), index_member(1, self.now))
+        self.assertGreater(index_member(1, self.now), index_member(2, self.now))
+        self.assertGreater(index_member(9, self.now), index_member(10, self.now))
+        self.assertEqual(parse_index_member(index_member(42, self.now)), 42)
+        self.assertEqual(parse_index_member(index_member(42, self.now).encode('ascii')), 42)
+
+    def test_ties(self):
+        """
+        Verify that equal scores are ranked by earlier modification, then by lower user id
+        """
+        earlier = self.now - timedelta(microseconds=1)
+        self.index.update(self.course_id, 10, 20, self.now)
+        self.index.update(self.course_id, 9, 20, self.now)
+        self.index.update(self.course_id, 11, 20, earlier)
+        self.index.update(self.course_id, 12, 30, self.now)
+
+        self.assertEqual(self.index.top(self.course_id, 4), [12, 11, 9, 10])
+        self.assertEqual(self.index.rank(self.course_id, 10), 3)
+        self.assertEqual(self.index.rank(self.course_id, 10, exclude_users=[9, 13]), 2)
+
+    def test_rank_and_top(self):
+        """
+        Verify rank and Top N lookups with and without excluded users
+        """
+        for user_id, score in ((1, 10), (2, 40), (3, 20), (4, 30)):
+            self.index.update(self.course_id, user_id, score, self.now)
+
+        self.assertEqual(self.index.top(self.course_id, 3), [2, 4, 3])
+        self.assertEqual(self.index.top(self.course_id, 3, exclude_users=[4]), [2, 3, 1])
+        self.assertEqual(self.index.rank(self.course_id, 3), 2)
+        self.assertEqual(self.index.rank(self.course_id, 3, exclude_users=[2, 1]), 1)
+        self.assertIsNone(self.index.rank(self.course_id, 5))
+
+        self.index.update(self.course_id, 1, 50, self.now)
+        self.assertEqual(self.index.rank(self.course_id, 1), 0)
+
+        self.index.remove(self.course_id, 1)
+        self.assertEqual(self.index.top(self.course_id, 10), [2, 4, 3])
+
+    def test_replace(self):
+        """
+        Verify that replacing the course index drops old entries
+        """
+        self.index.update(self.course_id, 1, 10, self.now)
+        self.index.replace(self.course_id, [(2, 5, self.now), (3, 15, self.now)])
+
+        self.assertEqual(self.index.top(self.course_id, 10), [3, 2])
+        self.assertIsNone(self.index.rank(self.course_id, 1))
+
+    def test_is_built(self):
+        """
+        Verify that only replacing the course index builds it
+        """
+        self.index.update(self.course_id, 1, 10, self.now)
+        self.assertFalse(self.index.is_built(self.course_id))
+
+        self.index.replace(self.course_id, [])
+        self.assertTrue(self.index.is_built(self.course_id))
+        self.assertFalse(self.index.is_built('course-v1:foo+bar+other'))
@@ -0,0 +1,141 @@
+"""
+Tests for the social engagement scoring engine
+"""
+import logging
+import os
+import random
+import time
+from unittest import skipIf, skipUnless
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from social_engagement.engagement import _compute_social_engagement_score, get_scoring_engine
+from social_engagement.scoring import ScoringEngine, numpy
+
+SOCIAL_METRIC_POINTS = {
+    'num_threads': 10,
+    'num_comments': 15,
+    'num_replies': 15,
+    'num_upvotes': 25,
+    'num_thread_followers': 5,
+    'num_comments_generated': 15,
+}
+
+log = logging.getLogger(__name__)
+
+
+def _make_stats_list(user_count):
+    """
+    Returns reproducible random stats of `user_count` users, with some metrics missing.
+    """
+    rand = random.Random(42)
+    metrics = list(SOCIAL_METRIC_POINTS) + ['num_flagged']
+    return [
+        {metric: rand.randint(0, 50) for metric in metrics if rand.random() > 0.2}
+        for __ in range(user_count)
+    ]
+
+
+def _score_per_user(stats_list):
+    return [_compute_social_engagement_score(stats) for stats in stats_list]
+
+
+@override_settings(SOCIAL_METRIC_POINTS=SOCIAL_METRIC_POINTS)
+class ScoringEngineTests(TestCase):
+    """ Test suite for ScoringEngine """
+
+    USER_COUNT = 500
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stats_list = _make_stats_list(cls.USER_COUNT)
+
+    def _assert_same_scores(self, engine):
+        scores = engine.score_many(self.stats_list)
+        self.assertEqual(scores, _score_per_user(self.stats_list))
+        self.assertTrue(all(type(score) is int for score in scores))  # pylint: disable=unidiomatic-typecheck
+
+    def test_pure_python_scores(self):
+        """
+        Verify that the pure Python engine scores users like the per user computation
+        """
+        self._assert_same_scores(ScoringEngine(SOCIAL_METRIC_POINTS, use_numpy=False))
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy_scores(self):
+        """
+        Verify that the NumPy engine scores users like the per user computation
+        """
+        engine = get_scoring_engine()
+        self.assertTrue(engine.use_numpy)
+        self._assert_same_scores(engine)
+
+    def test_fallback_for_non_integer_values(self):
+        """
+        Verify that float weights and stats are scored in the same order as the per user computation
+        """
+        points = dict(SOCIAL_METRIC_POINTS, num_upvotes=0.1)
+        stats_list = [{'num_upvotes': 3, 'num_threads': 1}, {'num_comments': 0.5, 'num_upvotes': 7}]
+        with override_settings(SOCIAL_METRIC_POINTS=points):
+            expected = [_compute_social_engagement_score(stats) for stats in stats_list]
+            self.assertEqual(get_scoring_engine().score_many(stats_list), expected)
+
+        engine = ScoringEngine(SOCIAL_METRIC_POINTS)
+        stats_list = [{'num_comments': 0.5}, {'num_threads': 2 ** 63}]
+        self.assertEqual(engine.score_many(stats_list), [7.5, 10 * 2 ** 63])
+
+    def test_score_users(self):
+        """
+        Verify that scores are returned with their users and stats
+        """
+        engine = ScoringEngine(SOCIAL_METRIC_POINTS)
+        user_stats = [(1, {'num_threads': 2}), (2, {}), (3, {'num_upvotes': 1, 'num_replies': 1})]
+        self.assertEqual(engine.score_users(user_stats), [
+            (1, 20, {'num_threads': 2}),
+            (2, 0, {}),
+            (3, 40, {'num_upvotes': 1, 'num_replies': 1}),
+        ])
+        self.assertEqual(engine.score_users([]), [])
+
+
+@skipUnless(os.environ.get('SOCIAL_ENGAGEMENT_BENCHMARK'), 'Set SOCIAL_ENGAGEMENT_BENCHMARK to run benchmarks')
+@override_settings(SOCIAL_METRIC_POINTS=SOCIAL_METRIC_POINTS)
+class ScoringEngineBenchmark(TestCase):
+    """ Benchmarks the ScoringEngine against the per user computation """
+
+    USER_COUNT = 100000
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stats_list = _make_stats_list(cls.USER_COUNT)
+
+    def _time_scores(self, engine):
+        started = time.time()
+        expected = _score_per_user(self.stats_list)
+        per_user_duration = time.time() - started
+
+        started = time.time()
+        scores = engine.score_many(self.stats_list)
+        duration = time.time() - started
+
+        self.assertEqual(scores, expected)
+        return per_user_duration, duration
+
+    def test_pure_python_100k_users(self):
+        """
+        Time the pure Python engine scoring 100k users
+        """
+        per_user_duration, duration = self._time_scores(ScoringEngine(SOCIAL_METRIC_POINTS, use_numpy=False))
+        log.info('Scored 100k users in %.3fs per user and %.3fs in pure Python', per_user_duration, duration)
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy_100k_users(self):
+        """
+        Verify that the NumPy engine scores 100k users faster than the per user computation
+        """
+        per_user_duration, duration = self._time_scores(get_scoring_engine())
+        log.info('Scored 100k users in %.3fs per user and %.3fs with NumPy', per_user_duration, duration)
+        self.assertLess(duration, per_user_duration)
@@ -0,0 +1,152 @@
+"""
+Helpers shared by the social_engagement app
+"""
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+# configured backend instances, keyed by backend and options
+_backends = {}
+
+# all process-local caches, cleared by `reset_local_state`
+_local_caches = weakref.WeakSet()
+
+
+def get_configured_backend(setting_name):
+    """
+    Returns the backend instance configured by a `{'BACKEND': ..., 'OPTIONS': {...}}`
+    setting, or None if the setting is not set. Instances are shared per process.
+    """
+    config = getattr(settings, setting_name, None)
+    if not config:
+        return None
+
+    options = config.get('OPTIONS', {})
+    cache_key = (setting_name, config['BACKEND'], repr(sorted(options.items())))
+    if cache_key not in _backends:
+        backend = import_string(config['BACKEND'])
+        _backends[cache_key] = backend(**options)
+    return _backends[cache_key]
+
+
+def acquire_course_task_lock(name, course_id, timeout):
+    """
+    Takes the lock of a course task in the shared cache. Returns the token of
+    the lock, which is passed on to release it, or None if it is already held,
+    i.e. the task is queued or running for the course.
+
+    The lock expires after `timeout` seconds, in case the task gets lost.
+    """
+    token = uuid.uuid4().hex
+    return token if cache.add(_course_task_lock_key(name, course_id), token, timeout) else None
+
+
+def release_course_task_lock(name, course_id, token=None, debounce=0):
+    """
+    Releases the lock of a course task. With `debounce` set, the lock is held
+    for that many more seconds, so the task is not enqueued again meanwhile.
+
+    With `token` set, the lock is only released if it is still held with that
+    token, so a run doesn't release a lock taken for another one after its own
+    lock expired. Returns False if the lock was not released.
+    """
+    key = _course_task_lock_key(name, course_id)
+    if token is not None and cache.get(key) != token:
+        return False
+    if debounce:
+        cache.set(key, token or True, debounce)
+    else:
+        cache.delete(key)
+    return True
+
+
+def request_course_task(name, course_id, timeout):
+    """
+    Flags that a course task has to run, so a run which started before can tell
+    it has to be repeated.
+    """
+    cache.set(_course_task_request_key(name, course_id), True, timeout)
+
+
+def is_course_task_requested(name, course_id):
+    """
+    Returns True if a course task was requested since its request flag was cleared.
+    """
+    return cache.get(_course_task_request_key(name, course_id)) is not None
+
+
+def clear_course_task_request(name, course_id):
+    """
+    Clears the request flag of a course task, before the task starts its work.
+    """
+    cache.delete(_course_task_request_key(name, course_id))
+
+
+def _course_task_request_key(name, course_id):
+    return 'social_engagement.task_request.{}.{}'.format(name, course_id)
+
+
+def _course_task_lock_key(name, course_id):
+    return 'social_engagement.task_lock.{}.{}'.format(name, course_id)
+
+
+class LocalTTLCache:
+    """
+    Process-local LRU cache whose entries expire `ttl` seconds after they were set.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        _local_caches.add(self)
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value or `default` if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Caches the value, evicting the least recently used entry when full.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def reset_local_state():
+    """
+    Clears all process-local caches and drops the configured backend instances,
+    so state of a test can't leak into the next one.
+    """
+    for local_cache in list(_local_caches):
+        local_cache.clear()
+    _backends.clear()